@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+from tensorflow.keras import Model
+from tensorflow.keras.layers import Input, Conv3D
+from tensorflow.keras.optimizers import SGD
+
+from layers import FFTConv3D, SliceConv3D
+
+
+def time_layer(layer, x, n_repeat):
+    """
+    Measures the time of a training step, i.e. the forward and backward pass, of a single layer
+
+    :param layer: layer to measure
+    :param x: input tensor
+    :param n_repeat: number of timed steps, after one untimed step for tracing
+    :return: a tuple of the output and the average time of a step in seconds
+    """
+    inputs = Input(shape=tuple(x.shape[1:]))
+    model = Model(inputs=inputs, outputs=layer(inputs))
+    # a learning rate of 0 keeps the weights identical for all layers that are compared
+    model.compile(optimizer=SGD(learning_rate=0.0), loss='mse')
+
+    y = model.predict_on_batch(x)
+    y_target = np.zeros_like(y)
+
+    model.train_on_batch(x, y_target)
+    t_start = time.time()
+    for _ in range(n_repeat):
+        model.train_on_batch(x, y_target)
+
+    return np.asarray(y), (time.time() - t_start) / n_repeat
+
+
+if __name__ == '__main__':
+    # same shapes as the layers in get_model with a batch size of 8 on 256 x 256 x 5 cubes
+    batch_size = 8
+    n_repeat = 5
+
+    # input shape, filters and kernel size
+    vec_conv_config = [((256, 256, 5, 1), 5, (40, 40, 2)),
+                       ((217, 217, 4, 5), 10, (30, 30, 2)),
+                       ((94, 94, 3, 10), 20, (20, 20, 2)),
+                       ((60, 60, 3, 20), 30, (10, 10, 2)),
+                       ((256, 256, 5, 1), 16, (20, 20, 1)),
+                       ((118, 118, 5, 16), 32, (10, 10, 1)),
+                       ((50, 50, 4, 30), 40, (5, 5, 1)),
+                       ((25, 25, 4, 40), 40, (4, 4, 1)),
+                       ((23, 23, 4, 40), 50, (3, 3, 1))]
+
+    rng = np.random.RandomState(0)
+
+    print('{:<20}{:<14}{:<12}{:>12}{:>12}{:>12}{:>12}'.format('input', 'kernel', 'layer', 'time [s]', 'speedup',
+                                                           'max error', 'max output'))
+    for shape_input, filters, kernel_size in vec_conv_config:
+        x = rng.rand(batch_size, *shape_input).astype(np.float32)
+
+        layer_direct = Conv3D(filters, kernel_size, activation='relu', kernel_initializer='he_uniform')
+        layer_direct.build((None,) + shape_input)
+        y_direct, t_direct = time_layer(layer_direct, x, n_repeat)
+
+        vec_layer = []
+        if kernel_size[2] == 1:
+            vec_layer.append(SliceConv3D(filters, kernel_size, activation='relu'))
+        vec_layer.append(FFTConv3D(filters, kernel_size, activation='relu'))
+
+        vec_result = [(layer_direct, y_direct, t_direct)]
+        for layer in vec_layer:
+            layer.build((None,) + shape_input)
+            layer.set_weights(layer_direct.get_weights())
+            vec_result.append((layer,) + time_layer(layer, x, n_repeat))
+
+        for layer, y, t_layer in vec_result:
+            print('{:<20}{:<14}{:<12}{:>12.4f}{:>12.2f}{:>12.2e}{:>12.2e}'.format(
+                str(shape_input), str(kernel_size), type(layer).__name__, t_layer, t_direct / t_layer,
+                np.max(np.abs(y - y_direct)), np.max(np.abs(y_direct))))
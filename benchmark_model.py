@@ -0,0 +1,168 @@
+import os
+import copy
+import json
+import time
+import pathlib
+import platform
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from model import get_model, get_all_architectures
+from config.load_config import get_config
+
+
+def benchmark_model(str_model, batch_size, downscale_size, cfg, n_warmup=3, n_step=20):
+    """
+    Measures the steady-state training and inference speed of a single architecture on random inputs of the shapes set
+    by cfg.sample_size, so that no patient data is needed. Meant to run in a fresh process, see run_benchmark, so that
+    the peak memory is that of this configuration alone
+
+    :param str_model: name of the architecture passed to get_model
+    :param batch_size: number of samples in each step
+    :param downscale_size: size of the images in the form [width, height]
+    :param cfg: object holding all the training parameters
+    :param n_warmup: number of untimed steps before the timed ones, which trace the graph and warm up the caches
+    :param n_step: number of timed steps of training and of inference each
+    :return: dictionary holding the configuration, the samples per second, the step latency percentiles in ms and the
+        peak resident memory in MB, or the error if the model cannot be built for this configuration
+    """
+    cfg = copy.deepcopy(cfg)
+    cfg.batch_size = batch_size
+    cfg.downscale_size = list(downscale_size)
+    cfg.crop_size = [int(np.round(cfg.downscale_size[1] * 1.5/7.32)),
+                     int(np.round(cfg.downscale_size[1] * 1.8/7.32))]
+    cfg.sample_size = [(cfg.downscale_size[0], cfg.downscale_size[1], cfg.num_octa, 1),
+                       (cfg.downscale_size[0], cfg.downscale_size[1], 1)]
+
+    dict_result = {'str_model': str_model, 'batch_size': batch_size, 'downscale_size': list(downscale_size)}
+    try:
+        model = get_model(str_model, cfg)
+    except Exception as e:
+        dict_result['error'] = str(e)
+        return dict_result
+
+    rng = np.random.RandomState(cfg.random_seed)
+    X = [rng.rand(batch_size, *x.shape[1:]).astype(np.float32) for x in model.inputs]
+    n_output = model.outputs[0].shape[-1]
+    if n_output == 1:
+        y = rng.randint(0, 2, size=(batch_size, 1)).astype(np.float32)
+    else:
+        y = np.eye(n_output, dtype=np.float32)[rng.randint(0, n_output, size=batch_size)]
+
+    dict_result['train'] = _time_steps(lambda: model.train_on_batch(X, y), batch_size, n_warmup, n_step)
+    dict_result['predict'] = _time_steps(lambda: model.predict_on_batch(X), batch_size, n_warmup, n_step)
+
+    # ru_maxrss is in kB on linux
+    dict_result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return dict_result
+
+
+def run_benchmark(vec_str_model, vec_batch_size, vec_downscale_size, cfg, n_warmup=3, n_step=20, f_result=None):
+    """
+    Runs benchmark_model over the grid of all architectures, batch sizes and image sizes, each in its own process
+
+    :param vec_str_model: list of architecture names, all architectures if None
+    :param vec_batch_size: list of batch sizes
+    :param vec_downscale_size: list of image sizes in the form [width, height]
+    :param cfg: object holding all the training parameters
+    :param n_warmup: number of untimed steps of every configuration
+    :param n_step: number of timed steps of every configuration
+    :param f_result: path to a json file to save the results in, not saved if None
+    :return: dictionary holding the environment and the list of results of benchmark_model
+    """
+    if vec_str_model is None:
+        vec_str_model = get_all_architectures()
+
+    dict_benchmark = {'time': time.strftime("%Y%m%d_%H%M%S"),
+                      'tensorflow': tf.__version__,
+                      'python': platform.python_version(),
+                      'machine': platform.machine(),
+                      'cpu_count': os.cpu_count(),
+                      'n_warmup': n_warmup,
+                      'n_step': n_step,
+                      'vec_result': []}
+
+    for str_model in vec_str_model:
+        for downscale_size in vec_downscale_size:
+            for batch_size in vec_batch_size:
+                # spawn gives every configuration a clean TensorFlow runtime and its own peak memory
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    dict_result = executor.submit(benchmark_model, str_model, batch_size, downscale_size, cfg,
+                                                  n_warmup, n_step).result()
+
+                _print_result(dict_result)
+                dict_benchmark['vec_result'].append(dict_result)
+
+                # saved after every configuration so that a long run can be inspected while it runs
+                if f_result is not None:
+                    with open(f_result, 'w') as f:
+                        json.dump(dict_benchmark, f, indent=2)
+
+    return dict_benchmark
+
+
+def _time_steps(step, batch_size, n_warmup, n_step):
+    """
+    Times the given step function
+
+    :return: dictionary holding the samples per second and the 50th, 90th and 99th percentile of the step latency in ms
+    """
+    for _ in range(n_warmup):
+        step()
+
+    vec_t = []
+    for _ in range(n_step):
+        t_start = time.perf_counter()
+        step()
+        vec_t.append(time.perf_counter() - t_start)
+
+    vec_t = np.asarray(vec_t)
+
+    return {'samples_per_sec': batch_size * n_step / np.sum(vec_t),
+            'latency_p50_ms': np.percentile(vec_t, 50) * 1e3,
+            'latency_p90_ms': np.percentile(vec_t, 90) * 1e3,
+            'latency_p99_ms': np.percentile(vec_t, 99) * 1e3}
+
+
+def _print_result(dict_result):
+    str_config = '{:<10}{:<14}{:>6}'.format(dict_result['str_model'], str(dict_result['downscale_size']),
+                                            dict_result['batch_size'])
+    if 'error' in dict_result:
+        print('{}  cannot be built: {}'.format(str_config, dict_result['error']))
+        return
+
+    print('{}{:>14.2f}{:>12.1f}{:>12.1f}{:>14.2f}{:>12.1f}{:>12.1f}'.format(
+        str_config, dict_result['train']['samples_per_sec'], dict_result['train']['latency_p50_ms'],
+        dict_result['train']['latency_p99_ms'], dict_result['predict']['samples_per_sec'],
+        dict_result['predict']['latency_p50_ms'], dict_result['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    # Configuring the files here for now
+    cfg = get_config(filename=pathlib.Path(os.getcwd()) / 'config' / 'default_config.yml')
+
+    cfg.num_octa = 5
+    cfg.num_classes = 3
+    cfg.binary_class = False
+    cfg.lr = 5e-5
+    cfg.lam = 1e-5
+    cfg.random_seed = 68
+
+    # architectures to benchmark, all architectures if None
+    vec_str_model = ['arch_009']
+    vec_batch_size = [4, 8, 16]
+    vec_downscale_size = [[192, 192], [256, 256]]
+    n_warmup = 3
+    n_step = 20
+    # path to the json file to save the results in
+    f_result = 'benchmark_{}.json'.format(time.strftime("%Y%m%d_%H%M%S"))
+
+    print('{:<10}{:<14}{:>6}{:>14}{:>12}{:>12}{:>14}{:>12}{:>12}'.format(
+        'model', 'size', 'batch', 'train [1/s]', 'p50 [ms]', 'p99 [ms]', 'pred [1/s]', 'p50 [ms]', 'rss [MB]'))
+    run_benchmark(vec_str_model, vec_batch_size, vec_downscale_size, cfg, n_warmup=n_warmup, n_step=n_step,
+                  f_result=f_result)
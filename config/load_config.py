@@ -19,6 +19,28 @@ def _init_empty_config_struct():
     cfg.d_model = None  # path to the directory to save the model/load trained models
     cfg.d_output = None  # path to the directory to save cleaned data
 
+    cfg.n_load_workers = None  # number of worker processes used for loading the images, serial loading if None
+    cfg.d_cache = None  # path to the directory to cache the resized images, no caching if None
+    cfg.cache_size_limit = None  # maximum total size of the image cache in bytes, no eviction if None
+    cfg.d_store = None  # path to the compiled datasets of the 'store' load mode, sees image changes via f_manifest only
+    cfg.store_load_mode = None  # load mode used to compile the dataset store, i.e. 'csv' or 'folder'
+    cfg.f_manifest = None  # path to the manifest file listing all images in d_data, glob is used if None
+    cfg.rebuild_manifest = False  # whether or not to rescan d_data even if the manifest is up to date
+    cfg.check_manifest_images = False  # whether or not to also check every image of the loaded patients for changes
+    cfg.d_patient_store = None  # path to the directory holding the per-patient store for incremental loading
+    cfg.storage_dtype = None  # dtype of the loaded cubes, i.e. 'uint8', 'float16' or 'float32', float64 if None
+    cfg.split_method = 'random'  # 'random' for rejection sampling of the splits or 'stratified' for stratified splits
+    cfg.vec_class_weight = None  # weight of each class passed to fit, set by the 'weight' oversampling method
+    cfg.cv_fold_view = False  # whether preprocess_cv returns views of the full dataset instead of copies for each fold
+    cfg.n_cv_workers = None  # number of cross validation folds trained in parallel, one process per fold if None
+    cfg.n_cv_threads = None  # number of TensorFlow threads of each fold worker, cores split evenly if None
+    cfg.cache_model = False  # whether get_model reuses the compiled model of an architecture and resets its weights
+    cfg.fft_conv_threshold = 20  # smallest in-plane kernel size convolved via FFT in Conv3D layers, never if None
+    cfg.use_slice_conv = False  # whether Conv3D layers with a kernel depth of 1 run as 2D convolutions over every slice
+    cfg.n_repeats = None  # number of repeated splits drawn by preprocess_repeated
+    cfg.n_repeat_workers = None  # number of repeats trained in parallel worker processes, serial training if None
+    cfg.image_backend = None  # 'pil' for faster decoding and area resizing of the images, 'skimage' if None
+
     return cfg
 
 
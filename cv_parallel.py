@@ -0,0 +1,199 @@
+import os
+import time
+import shutil
+import pathlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from model import get_model, get_callbacks
+from data_pipeline import get_dataset, IndexedView
+from utils.io_funcs import save_model
+from plotting import plot_training_loss, plot_training_acc, plot_raw_conf_matrix, plot_norm_conf_matrix
+
+
+def train_cv_parallel(X, vec_Xs, vec_ys, cfg, str_model='arch_009', n_workers=None, n_threads=None, save=True):
+    """
+    Trains the cross validation folds in separate worker processes at the same time. The full dataset is shared with
+    the workers as read-only memory-mapped arrays and every fold only receives the indices of its samples, so that the
+    dataset is held on disk once instead of once per worker. Each worker gets its own TensorFlow thread budget so that
+    the workers split the CPU cores between them instead of all competing for every core. Each fold saves its weights
+    and plots exactly as the serial loop in train_single_model_cv does. The repeats of preprocess_repeated are trained
+    the same way, with save set to False as in the serial loop of train_repeated_model
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d] holding all samples, as returned by
+        data_loading, either in memory or memory-mapped from the dataset store. Arrays in memory are written to a
+        temporary directory under cfg.d_store, or cfg.d_cache if that is None, for the duration of the training
+    :param vec_Xs: list of the folds as returned by preprocess_cv or preprocess_repeated called with the same data
+    :param vec_ys: list of the labels of the folds as returned by preprocess_cv or preprocess_repeated
+    :param cfg: object holding all the training parameters
+    :param str_model: name of the architecture passed to get_model
+    :param n_workers: number of worker processes, cfg.n_cv_workers or the number of folds if None
+    :param n_threads: number of intra-op threads of each worker, cfg.n_cv_threads or an even share of the cores if None
+    :param save: whether or not to save the weights and plots of each fold
+
+    :return: a tuple vec_history, vec_acc, vec_y_true, vec_y_pred with one entry for each fold in fold order
+    """
+    n_fold = len(vec_Xs)
+    if n_workers is None:
+        n_workers = cfg.n_cv_workers if cfg.n_cv_workers is not None else n_fold
+    n_workers = max(min(n_workers, n_fold), 1)
+
+    if n_threads is None:
+        n_threads = cfg.n_cv_threads if cfg.n_cv_threads is not None else max(os.cpu_count() // n_workers, 1)
+
+    # all folds are saved under the same name, which would otherwise be set by whichever fold is saved first
+    cfg.str_model = str_model
+    f_model = "{}_{}".format(cfg.str_model, time.strftime("%Y%m%d_%H%M%S"))
+
+    d_shared = None
+    try:
+        vec_f_x = []
+        for idx_x, x in enumerate(X):
+            # arrays opened from the dataset store are already on disk and are reused as they are
+            if isinstance(x, np.memmap) and x.filename is not None and x.offset == 0 \
+                    and str(x.filename).endswith('.npy'):
+                vec_f_x.append(str(x.filename))
+                continue
+
+            if d_shared is None:
+                # a copy of the full dataset is too large for the system temp directory, which is often held in memory
+                d_parent = cfg.d_store if cfg.d_store is not None else cfg.d_cache
+                if d_parent is None:
+                    raise Exception('Need to provide d_store or d_cache to share the dataset held in memory with the '
+                                    'workers')
+                pathlib.Path(d_parent).mkdir(parents=True, exist_ok=True)
+                d_shared = tempfile.mkdtemp(prefix='cv_parallel_', dir=str(d_parent))
+            f_x = os.path.join(d_shared, 'x_{}.npy'.format(idx_x))
+            np.save(f_x, np.asarray(x))
+            vec_f_x.append(f_x)
+
+        vec_args = []
+        for idx_fold in range(n_fold):
+            vec_idx_fold = [_get_split_idx(vec_Xs[idx_fold][idx_set], cfg.vec_idx_absolute[idx_fold][idx_set])
+                            for idx_set in range(len(vec_Xs[idx_fold]))]
+            vec_args.append((idx_fold, vec_f_x, vec_idx_fold, vec_ys[idx_fold], cfg, str_model, f_model, save))
+
+        print('Training {} folds in {} worker processes with {} threads each'.format(n_fold, n_workers, n_threads))
+
+        # spawn gives each worker a clean TensorFlow runtime instead of a fork of the one in this process
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(n_threads,)) as executor:
+            vec_out = list(executor.map(_train_fold, *zip(*vec_args)))
+
+    finally:
+        if d_shared is not None:
+            shutil.rmtree(d_shared, ignore_errors=True)
+
+    # set up the output paths as save_model does for the serial loop
+    if save:
+        cfg.f_model_cv = f_model
+        cfg.p_cfg = cfg.d_model / cfg.str_model / f_model
+        cfg.p_figure_all = cfg.p_cfg
+        cfg.p_out_csv = cfg.p_figure_all
+        cfg.p_figure = cfg.p_cfg / "fold_{}".format(n_fold - 1)
+
+    vec_history, vec_acc, vec_y_true, vec_y_pred = [list(x) for x in zip(*vec_out)]
+
+    return vec_history, vec_acc, vec_y_true, vec_y_pred
+
+
+def _get_split_idx(x_set, vec_idx_absolute_set):
+    """
+    Obtains the absolute indices of the samples in a single set of a fold
+
+    :param x_set: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d] for a single set
+    :param vec_idx_absolute_set: absolute indices of the set recorded by preprocess_cv
+    :return: numpy array of absolute indices, which differ from the recorded ones if the set was oversampled
+    """
+    if isinstance(x_set[0], IndexedView):
+        return x_set[0].vec_idx
+
+    return np.asarray(vec_idx_absolute_set)
+
+
+def _init_worker(n_threads):
+    """
+    Sets the thread budget of a worker process, which has to happen before TensorFlow runs any operation
+
+    :param n_threads: number of intra-op threads
+    """
+    os.environ['OMP_NUM_THREADS'] = str(n_threads)
+    tf.config.threading.set_intra_op_parallelism_threads(n_threads)
+    # the models are mostly a single chain of layers, so there is little to gain from running several ops at once
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _train_fold(idx_fold, vec_f_x, vec_idx_fold, ys, cfg, str_model, f_model, save):
+    """
+    Trains, saves and evaluates the model of a single fold inside a worker process
+
+    :param idx_fold: index of the fold
+    :param vec_f_x: list of absolute paths to the .npy files holding all samples of each input
+    :param vec_idx_fold: list in the form [vec_idx_train, vec_idx_valid, vec_idx_test] of absolute indices
+    :param ys: list of the labels of the training, validation and test set
+    :param cfg: object holding all the training parameters
+    :param str_model: name of the architecture passed to get_model
+    :param f_model: name under which the weights of all folds are saved
+    :param save: whether or not to save the weights and plots of this fold
+
+    :return: a tuple history, vec_acc, y_true, y_pred for this fold
+    """
+    X = [np.load(f_x, mmap_mode='r') for f_x in vec_f_x]
+    Xs = [[IndexedView(x, vec_idx_set) for x in X] for vec_idx_set in vec_idx_fold]
+
+    print('\n\nFold: {}\n'.format(idx_fold))
+
+    model_curr = get_model(str_model, cfg)
+    callbacks_curr = get_callbacks(cfg)
+    n_inputs = len(model_curr.inputs)
+
+    # class weights are only set by the 'weight' oversampling method
+    class_weight_curr = None
+    if cfg.vec_class_weight is not None and cfg.vec_class_weight[idx_fold] is not None:
+        class_weight_curr = dict(enumerate(cfg.vec_class_weight[idx_fold]))
+
+    h = model_curr.fit(get_dataset(Xs[0], ys[0], cfg.batch_size, n_inputs=n_inputs), epochs=cfg.n_epoch,
+                       verbose=2, callbacks=callbacks_curr,
+                       class_weight=class_weight_curr,
+                       validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=n_inputs))
+
+    if save:
+        # save trained models
+        save_model(model_curr, cfg, overwrite=True, save_format='tf', idx_cv_fold=idx_fold, f_model=f_model)
+
+        # plotting training history
+        plot_training_loss(h, cfg, save=True)
+        plot_training_acc(h, cfg, save=True)
+
+    # Now perform prediction
+    vec_acc = []
+    for idx_set in range(len(Xs)):
+        set_score = model_curr.evaluate(get_dataset(Xs[idx_set], ys[idx_set], n_inputs=n_inputs),
+                                        callbacks=callbacks_curr, verbose=0)
+        vec_acc.append(set_score[1])
+
+    print("\nFold {} train set accuracy: {}".format(idx_fold, vec_acc[0]))
+    print("Fold {} valid set accuracy: {}".format(idx_fold, vec_acc[1]))
+    print("Fold {} test set accuracy: {}".format(idx_fold, vec_acc[2]))
+
+    if cfg.num_classes == 2:
+        y_true = ys[-1]
+        y_pred = model_curr.predict(get_dataset(Xs[2], n_inputs=n_inputs))
+        y_pred[y_pred >= 0.5] = 1
+        y_pred[y_pred < 0.5] = 0
+        y_pred = y_pred.reshape(-1)
+
+    else:
+        y_true = np.argmax(ys[-1], axis=1)
+        y_pred = np.argmax(model_curr.predict(get_dataset(Xs[2], n_inputs=n_inputs)), axis=1)
+
+    if save:
+        # plot the confusion matrices
+        plot_raw_conf_matrix(y_true, y_pred, cfg, save=True)
+        plot_norm_conf_matrix(y_true, y_pred, cfg, save=True)
+
+    return h.history, vec_acc, y_true, y_pred
@@ -0,0 +1,124 @@
+import numpy as np
+import tensorflow as tf
+
+
+def convert_storage_dtype(x):
+    """
+    Converts a batch of images from the storage dtype back into float32 in the range [0, 1]
+
+    :param x: numpy array of images stored as uint8, float16 or any float type
+    :return: float32 numpy array of the same shape
+    """
+    if x.dtype == np.uint8:
+        return x.astype(np.float32) / 255
+
+    return x.astype(np.float32)
+
+
+def get_dataset(X, y=None, batch_size=32, shuffle=False, cache=False, n_inputs=None, random_seed=None):
+    """
+    Builds a tf.data pipeline for the multi-input models from in-memory arrays, memory-mapped arrays or IndexedView.
+    Only the sample indices go through shuffling and batching; the images of each batch are gathered and converted
+    to float32 in a numpy_function and prefetched, so that host memory stays bounded and input preparation overlaps
+    with the training step
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    :param y: numpy array of labels, None for prediction
+    :param batch_size: number of samples in each batch
+    :param shuffle: whether or not to reshuffle the samples at every epoch
+    :param cache: whether or not to keep the converted samples in memory after the first epoch
+    :param n_inputs: number of input tensors consumed by the model, e.g. len(model.inputs), all of X if None
+    :param random_seed: random seed for shuffling
+
+    :return: tf.data.Dataset yielding (inputs, labels) or (inputs,) if y is None
+    """
+    X = list(X) if n_inputs is None else list(X)[:n_inputs]
+    n_sample = X[0].shape[0]
+
+    vec_tf_dtype = [tf.float32] * len(X)
+    if y is not None:
+        y = np.asarray(y)
+        vec_tf_dtype.append(tf.as_dtype(y.dtype))
+
+    def _gather(vec_idx):
+        # gather in ascending order so that reads from memory-mapped arrays are as sequential as possible
+        vec_idx = np.sort(vec_idx)
+        vec_out = [convert_storage_dtype(np.asarray(x[vec_idx])) for x in X]
+        if y is not None:
+            vec_out.append(y[vec_idx])
+
+        return vec_out
+
+    vec_x_out = X if y is None else X + [y]
+
+    def _get_element(idx):
+        vec_out = tf.numpy_function(_gather, [idx], vec_tf_dtype)
+        for out, x in zip(vec_out, vec_x_out):
+            out.set_shape([None] + list(x.shape[1:]))
+
+        if y is None:
+            return tuple(vec_out),
+
+        return tuple(vec_out[:-1]), vec_out[-1]
+
+    dataset = tf.data.Dataset.range(n_sample)
+    if cache:
+        # samples are converted one at a time so that the cache can be reshuffled and rebatched at every epoch
+        dataset = dataset.batch(1).map(_get_element, num_parallel_calls=tf.data.experimental.AUTOTUNE).unbatch()
+        dataset = dataset.cache()
+        if shuffle:
+            dataset = dataset.shuffle(n_sample, seed=random_seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+
+    else:
+        if shuffle:
+            dataset = dataset.shuffle(n_sample, seed=random_seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size).map(_get_element, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+    return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+class IndexedView:
+    """
+    Read-only view of a subset of the rows of an array, e.g. the training set of a cross validation fold. Rows are only
+    gathered from the underlying array, which may be memory-mapped, when the view is indexed, so that all folds share
+    a single copy of the dataset
+    """
+
+    def __init__(self, x, vec_idx):
+        """
+        :param x: numpy array (or memory-mapped array) holding all samples
+        :param vec_idx: numpy array of the absolute indices of the rows in this view
+        """
+        self.x = x
+        self.vec_idx = np.asarray(vec_idx)
+
+    @property
+    def shape(self):
+        return (self.vec_idx.shape[0],) + tuple(self.x.shape[1:])
+
+    @property
+    def dtype(self):
+        return self.x.dtype
+
+    @property
+    def ndim(self):
+        return self.x.ndim
+
+    def __len__(self):
+        return self.vec_idx.shape[0]
+
+    def __getitem__(self, key):
+        # only the first axis is remapped, the remaining ones are applied to the gathered rows
+        if isinstance(key, tuple):
+            x = self.x[self.vec_idx[key[0]]]
+            if np.ndim(self.vec_idx[key[0]]) == 0:
+                return x[key[1:]]
+
+            return x[(slice(None),) + key[1:]]
+
+        return self.x[self.vec_idx[key]]
+
+    def __array__(self, dtype=None, copy=None):
+        x = self.x[self.vec_idx]
+        return x if dtype is None else x.astype(dtype)
@@ -0,0 +1,143 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Conv3D
+
+
+def get_conv3d(filters, kernel_size, cfg=None, **kwargs):
+    """
+    Obtains the 3D convolution layer that suits the kernel size best. Kernels with a depth of 1 are run as 2D
+    convolutions over every slice if cfg.use_slice_conv is set, other kernels whose in-plane size is at least
+    cfg.fft_conv_threshold are convolved via FFT, and all others directly. All layers hold the same weights and compute
+    the same outputs, so the choice never changes what the model learns. See benchmark_conv for the speed of each
+
+    :param filters: number of output channels
+    :param kernel_size: tuple in the form (width, height, depth)
+    :param cfg: object holding all the training parameters, direct convolution is used throughout if None
+    :param kwargs: additional arguments accepted by the tensorflow.keras.layers.Conv3D layer
+    :return: Conv3D or FFTConv3D layer
+    """
+    # the slice path was faster than FFT for every kernel with a depth of 1 in benchmark_conv
+    if cfg is not None and cfg.use_slice_conv and SliceConv3D.supports(kernel_size, **kwargs):
+        return SliceConv3D(filters, kernel_size, **kwargs)
+
+    if cfg is not None and cfg.fft_conv_threshold is not None and \
+            np.min(np.atleast_1d(kernel_size)[:2]) >= cfg.fft_conv_threshold and FFTConv3D.supports(**kwargs):
+        return FFTConv3D(filters, kernel_size, **kwargs)
+
+    return Conv3D(filters, kernel_size, **kwargs)
+
+
+def _get_triple(value):
+    # keras accepts a single integer for all three axes
+    return tuple(np.broadcast_to(np.atleast_1d(value), 3))
+
+
+def _fold_slices(x):
+    """
+    Moves the slice axis into the batch axis, i.e. (n_sample, width, height, depth, channel) becomes
+    (n_sample * depth, width, height, channel)
+    """
+    x = tf.transpose(x, [0, 3, 1, 2, 4])
+
+    return tf.reshape(x, tf.concat([[-1], tf.shape(x)[2:]], axis=0))
+
+
+def _unfold_slices(x, depth):
+    """
+    Inverse of _fold_slices for the given number of slices
+    """
+    x = tf.reshape(x, tf.concat([[-1, depth], tf.shape(x)[1:]], axis=0))
+
+    return tf.transpose(x, [0, 2, 3, 1, 4])
+
+
+class FFTConv3D(Conv3D):
+    """
+    Drop-in replacement of Conv3D for large in-plane kernels, e.g. the (40, 40, 2) kernels that open the angiography and
+    structure pathways. The width and height axes are convolved as a product in the frequency domain, while the short
+    depth axis is summed directly, which costs O(W H log(W H)) per channel pair instead of O(W H k_w k_h)
+    """
+
+    @staticmethod
+    def supports(strides=(1, 1, 1), padding='valid', data_format=None, dilation_rate=(1, 1, 1), groups=1, **kwargs):
+        """
+        Checks whether the convolution with the given arguments of Conv3D can be computed via FFT
+
+        :return: True if the FFT path computes the same output as Conv3D
+        """
+        return np.all(np.asarray(strides) == 1) and np.all(np.asarray(dilation_rate) == 1) and groups == 1 and \
+            str(padding).lower() in ['valid', 'same'] and data_format in [None, 'channels_last']
+
+    def call(self, inputs):
+        if not self.supports(self.strides, self.padding, self.data_format, self.dilation_rate,
+                             getattr(self, 'groups', 1)):
+            return super().call(inputs)
+
+        kernel_width, kernel_height, kernel_depth = self.kernel_size[:3]
+        if self.padding.lower() == 'same':
+            # same split of the padding as tf.nn.conv3d
+            inputs = tf.pad(inputs, [[0, 0],
+                                     [(kernel_width - 1) // 2, kernel_width // 2],
+                                     [(kernel_height - 1) // 2, kernel_height // 2],
+                                     [(kernel_depth - 1) // 2, kernel_depth // 2],
+                                     [0, 0]])
+
+        width = inputs.shape[1]
+        height = inputs.shape[2]
+        depth_out = inputs.shape[3] - kernel_depth + 1
+
+        # (n_sample, depth, c_in, width, height) so that the FFT runs over the two innermost axes
+        x_f = tf.signal.rfft2d(tf.transpose(inputs, [0, 3, 4, 1, 2]))
+
+        # keras convolutions are cross-correlations, i.e. convolutions with the flipped kernel
+        kernel = tf.reverse(self.kernel, axis=[0, 1])
+        kernel_f = tf.signal.rfft2d(tf.transpose(kernel, [2, 3, 4, 0, 1]), fft_length=[width, height])
+        kernel_f = tf.cast(kernel_f, x_f.dtype)
+
+        out_f = 0
+        for idx_depth in range(kernel_depth):
+            out_f += tf.einsum('ndiwh,iowh->ndowh', x_f[:, idx_depth:idx_depth + depth_out, ...], kernel_f[idx_depth])
+
+        # only the outputs that did not wrap around the borders of the circular convolution are valid
+        outputs = tf.signal.irfft2d(out_f, fft_length=[width, height])[..., kernel_width - 1:, kernel_height - 1:]
+        outputs = tf.transpose(outputs, [0, 3, 4, 1, 2])
+
+        if self.use_bias:
+            outputs = outputs + self.bias
+        if self.activation is not None:
+            outputs = self.activation(outputs)
+
+        return outputs
+
+
+class SliceConv3D(Conv3D):
+    """
+    Drop-in replacement of Conv3D for kernels with a depth of 1, e.g. (5, 5, 1), which are 2D convolutions applied to
+    every slice along the num_octa axis. The slices are folded into the batch and convolved with Conv2D, which is faster
+    on CPU than the equivalent Conv3D
+    """
+
+    @staticmethod
+    def supports(kernel_size, strides=(1, 1, 1), data_format=None, groups=1, **kwargs):
+        """
+        Checks whether the convolution with the given arguments of Conv3D can be computed slice by slice
+
+        :return: True if the slice path computes the same output as Conv3D
+        """
+        return _get_triple(kernel_size)[2] == 1 and _get_triple(strides)[2] == 1 and groups == 1 and \
+            data_format in [None, 'channels_last']
+
+    def call(self, inputs):
+        if not self.supports(self.kernel_size, self.strides, self.data_format, getattr(self, 'groups', 1)):
+            return super().call(inputs)
+
+        outputs = tf.nn.conv2d(_fold_slices(inputs), self.kernel[:, :, 0], strides=list(self.strides[:2]),
+                               padding=self.padding.upper(), dilations=list(self.dilation_rate[:2]))
+        outputs = _unfold_slices(outputs, inputs.shape[3])
+
+        if self.use_bias:
+            outputs = outputs + self.bias
+        if self.activation is not None:
+            outputs = self.activation(outputs)
+
+        return outputs
@@ -2,8 +2,9 @@ import pandas as pd
 import numpy as np
 
 
-def load_csv_params(cfg):
-    pd_csv = pd.read_csv(str(cfg.d_csv / cfg.f_csv))
+def load_csv_params(cfg, pd_csv=None):
+    if pd_csv is None:
+        pd_csv = pd.read_csv(str(cfg.d_csv / cfg.f_csv))
     pd_csv_headers = pd_csv.columns
 
     # get the valid columns in the CSV file to access
@@ -36,7 +37,7 @@ def load_csv_params(cfg):
     if vec_OD_valid.dtype == 'object':
         idx_invalid_OD_curr = np.logical_not(np.isin(vec_OD_valid, ['0', '1', '2', '3']))
         vec_OD_valid[idx_invalid_OD_curr] = 0
-        vec_OD_valid = vec_OD_valid.astype(np.int)
+        vec_OD_valid = vec_OD_valid.astype(int)
     else:
         idx_invalid_OD_curr = np.logical_not(np.isin(vec_OD_valid, [0, 1, 2, 3]))
         vec_OD_valid[idx_invalid_OD_curr] = 0
@@ -45,14 +46,14 @@ def load_csv_params(cfg):
         vec_OD_feature[idx_invalid_OD_curr] = np.nan
     else:
         # correct the labels so that it's consistent with the other features when using disease label
-        vec_OD_feature = vec_OD_valid.astype(np.float)
+        vec_OD_feature = vec_OD_valid.astype(np.float64)
         vec_OD_feature = vec_OD_feature - 1
         vec_OD_feature[vec_OD_feature < 0] = np.nan
 
     if vec_OS_valid.dtype == 'object':
         idx_invalid_OS_curr = np.logical_not(np.isin(vec_OS_valid, ['0', '1', '2', '3']))
         vec_OS_valid[idx_invalid_OS_curr] = 0
-        vec_OS_valid = vec_OS_valid.astype(np.int)
+        vec_OS_valid = vec_OS_valid.astype(int)
     else:
         idx_invalid_OS_curr = np.logical_not(np.isin(vec_OS_valid, [0, 1, 2, 3]))
         vec_OS_valid[idx_invalid_OS_curr] = 0
@@ -61,7 +62,7 @@ def load_csv_params(cfg):
         vec_OS_feature[idx_invalid_OS_curr] = np.nan
     else:
         # correct the labels so that it's consistent with the other features when using disease label
-        vec_OS_feature = vec_OS_valid.astype(np.float)
+        vec_OS_feature = vec_OS_valid.astype(np.float64)
         vec_OS_feature = vec_OS_feature - 1
         vec_OS_feature[vec_OS_feature < 0] = np.nan
 
@@ -82,3 +83,34 @@ def load_csv_params(cfg):
     cfg.vec_csv_col = [idx_col_patient_id, idx_col_OD_valid, idx_col_OS_valid, idx_col_OD_feature, idx_col_OS_feature]
 
     return vec_str_patient_id, vec_OD_feature, vec_OS_feature
+
+
+def load_csv_params_all(cfg):
+    """
+    Parses the labels of all features in cfg.vec_all_str_feature from a single read of the csv file
+
+    :param cfg: configuration file set by the user
+    :return: a tuple vec_str_patient_id, mat_OD_feature, mat_OS_feature, where the label matrices have the shape
+    (n_row, n_feature) and hold NaN wherever the label of a feature is not valid
+    """
+    pd_csv_all = pd.read_csv(str(cfg.d_csv / cfg.f_csv))
+
+    str_feature = cfg.str_feature
+    vec_OD_feature_all = []
+    vec_OS_feature_all = []
+    try:
+        for str_feature_curr in cfg.vec_all_str_feature:
+            cfg.str_feature = str_feature_curr
+            vec_str_patient_id, vec_OD_feature, vec_OS_feature = load_csv_params(cfg, pd_csv=pd_csv_all.copy())
+
+            vec_OD_feature_all.append(vec_OD_feature.astype(np.float64))
+            vec_OS_feature_all.append(vec_OS_feature.astype(np.float64))
+    finally:
+        cfg.str_feature = str_feature
+
+    # the eyes are recorded against the OD/OS disease columns, which are remapped to the columns of a single feature
+    # once it is selected
+    cfg.pd_csv_all = pd_csv_all
+    cfg.vec_csv_col = cfg.vec_csv_col[:3] + cfg.vec_csv_col[1:3]
+
+    return vec_str_patient_id, np.stack(vec_OD_feature_all, axis=1), np.stack(vec_OS_feature_all, axis=1)
@@ -5,6 +5,7 @@ import numpy as np
 from config.load_config import get_config
 from preprocess import preprocess
 from model import get_model, get_callbacks
+from data_pipeline import get_dataset
 from utils.io_funcs import *
 import matplotlib.pyplot as plt
 from plotting import plot_training_loss, plot_training_acc, plot_raw_conf_matrix, plot_norm_conf_matrix
@@ -57,6 +58,10 @@ cfg.random_seed = 68
 cfg.use_random_seed = True
 cfg.binary_class = False
 
+# name of a cross validation run of the same architecture after the underscore, e.g. from train_single_model_cv.py,
+# whose folds are also loaded as a single model, not loaded if None
+name_cv = None
+
 vec_idx_healthy = [1, 250]
 vec_idx_dry_amd = [1, 250]
 vec_idx_cnv = [1, 250]
@@ -108,4 +113,10 @@ plt.imshow(x_test_idx_test[:, :, 2, :])
 # plot the raw confusion matrix for reference
 plot_raw_conf_matrix(y_test_true, y_test_pred, cfg, save=False)
 
+# all folds of a cross validation run can be loaded as a single model, which scores a batch with every fold at once
+if name_cv is not None:
+    model_cv = load_model_cv(cfg, name_cv)
+    member_prob, mean_prob, vote = model_cv.predict(get_dataset(Xs[2], n_inputs=len(model_cv.inputs)))
+    print('\nTest set accuracy of the majority vote of all folds: {}'.format(np.mean(vote == np.argmax(ys[2], axis=1))))
+
 print('Done')
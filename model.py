@@ -1,14 +1,136 @@
+import re
+import inspect
+import functools
+
 import tensorflow as tf
 from tensorflow.keras import Model
-from tensorflow.keras.layers import Dense, Flatten, Conv3D, Conv2D, AvgPool2D, MaxPooling3D, Dropout, BatchNormalization, Softmax
+from tensorflow.keras.layers import Dense, Flatten, Conv2D, AvgPool2D, MaxPooling3D, Dropout, BatchNormalization, Softmax
 from tensorflow.keras.layers import Input, LeakyReLU, ReLU, Concatenate, concatenate, MaxPool2D, Add, GlobalAveragePooling3D, AveragePooling3D
+from tensorflow.keras.layers import Reshape, Lambda
 from tensorflow.keras.optimizers import Adam, RMSprop, SGD
 from tensorflow.keras.regularizers import l1, l2
 from tensorflow.keras.callbacks import EarlyStopping
 
+from layers import get_conv3d
+
+
+# compiled models kept by get_model when cfg.cache_model is set, with the optimizer state right after compiling
+_dict_model_cache = {}
+
 
-# Everything in the same function
 def get_model(str_model, cfg):
+    """
+    Obtains the compiled model of the specified architecture. When cfg.cache_model is set, the model is only built once
+    for each architecture and set of parameters that shape it, and later calls reset the weights and the optimizer
+    state of the same model in place, so that cross validation folds and repeats skip building and tracing the graph
+    again. Any model returned earlier is reset as well, so a model that is kept while get_model is called again, e.g.
+    for an ensemble, should be removed from the cache with clear_model_cache first
+
+    :param str_model: name of the architecture, e.g. 'arch_009'
+    :param cfg: object holding all the training parameters
+    :return: compiled model
+    """
+    if not cfg.cache_model:
+        return _build_model(str_model, cfg)
+
+    key = (str_model, tuple(tuple(sample_size) for sample_size in cfg.sample_size), cfg.num_classes,
+           cfg.binary_class, repr(cfg.downscale_size), repr(cfg.crop_size), cfg.lr, cfg.lam, cfg.fft_conv_threshold,
+           cfg.use_slice_conv)
+    if key in _dict_model_cache:
+        model, vec_optimizer_value = _dict_model_cache[key]
+        cfg.str_model = str_model
+        reset_model(model, vec_optimizer_value)
+
+        return model
+
+    model = _build_model(str_model, cfg)
+
+    # the optimizer state is normally created by the first training step, build it now so that it can be restored
+    if hasattr(model.optimizer, 'build'):
+        model.optimizer.build(model.trainable_variables)
+    else:
+        model.optimizer._create_all_weights(model.trainable_variables)
+    vec_optimizer_value = [var.numpy() for var in _get_optimizer_variables(model.optimizer)]
+    _dict_model_cache[key] = (model, vec_optimizer_value)
+
+    return model
+
+
+def clear_model_cache(model=None):
+    """
+    Removes models from the cache of get_model, so that later calls build a new model instead of resetting them
+
+    :param model: model returned by get_model to remove from the cache, all models are removed if None
+    """
+    if model is None:
+        _dict_model_cache.clear()
+        return
+
+    for key in [key for key, (model_cached, _) in _dict_model_cache.items() if model_cached is model]:
+        del _dict_model_cache[key]
+
+
+def reset_model(model, vec_optimizer_value):
+    """
+    Draws new initial weights for all layers from their initializers and restores the optimizer state, so that a
+    compiled model can be trained again from scratch without building it again
+
+    :param model: compiled model
+    :param vec_optimizer_value: list of the values of the optimizer variables right after compiling
+    """
+    for layer in _get_layers(model):
+        for str_weight in ['kernel', 'depthwise_kernel', 'pointwise_kernel', 'recurrent_kernel', 'bias', 'gamma',
+                           'beta', 'moving_mean', 'moving_variance']:
+            weight = getattr(layer, str_weight, None)
+            initializer = getattr(layer, '{}_initializer'.format(str_weight), None)
+            if weight is not None and initializer is not None:
+                # a copy of the initializer, since unseeded initializers in keras 3 fix their seed when created
+                initializer = initializer.__class__.from_config(initializer.get_config())
+                weight.assign(initializer(weight.shape, dtype=weight.dtype))
+
+    for var, value in zip(_get_optimizer_variables(model.optimizer), vec_optimizer_value):
+        var.assign(value)
+
+
+def _get_layers(model):
+    """
+    Obtains all layers of a model including the ones of nested models
+
+    :param model: keras model
+    :return: list of layers
+    """
+    vec_layer = []
+    for layer in model.layers:
+        if hasattr(layer, 'layers'):
+            vec_layer.extend(_get_layers(layer))
+        else:
+            vec_layer.append(layer)
+
+    return vec_layer
+
+
+def _get_optimizer_variables(optimizer):
+    # variables is a method of the optimizers in tf.keras 2 and a property in keras 3
+    variables = optimizer.variables
+
+    return variables() if callable(variables) else variables
+
+
+def get_all_architectures():
+    """
+    Obtains the names of all architectures that get_model can build
+
+    :return: list of architecture names in the order they are defined
+    """
+    return re.findall(r"str_model == '(\w+)'", inspect.getsource(_build_model))
+
+
+# Everything in the same function
+def _build_model(str_model, cfg):
+    # every 3D convolution below is created by get_conv3d, which picks the slice-wise convolution for kernels with a
+    # depth of 1 and the FFT convolution for large in-plane kernels
+    conv3d = functools.partial(get_conv3d, cfg=cfg)
+
     gpus = tf.config.experimental.list_physical_devices('GPU')
     if gpus:
         try:
@@ -28,17 +150,17 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # this is information extracted from structural information
-        x = Conv3D(16, kernel_size=(20, 20, 1), activation='relu', kernel_initializer='he_uniform')(structure_inputs)
+        x = conv3d(16, kernel_size=(20, 20, 1), activation='relu', kernel_initializer='he_uniform')(structure_inputs)
         x = MaxPooling3D(pool_size=(5, 5, 1), strides=(2, 2, 1))(x)
         x = BatchNormalization(center=True, scale=True)(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(32, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
+        x = conv3d(32, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
         x = MaxPooling3D(pool_size=(5, 5, 1), strides=(2, 2, 1))(x)
         x = BatchNormalization(center=True, scale=True)(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(64, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
+        x = conv3d(64, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = BatchNormalization(center=True, scale=True)(x)
         x = Dropout(0.05)(x)
@@ -69,17 +191,17 @@ def get_model(str_model, cfg):
         bscan_features = Dropout(0.1)(x)
 
         # finally this is information from the angiography data
-        x = Conv3D(32, kernel_size=(15, 15, 1), activation='relu', kernel_initializer='he_uniform')(angiography_inputs)
+        x = conv3d(32, kernel_size=(15, 15, 1), activation='relu', kernel_initializer='he_uniform')(angiography_inputs)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = BatchNormalization(center=True, scale=True)(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(64, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
+        x = conv3d(64, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = BatchNormalization(center=True, scale=True)(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(64, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
+        x = conv3d(64, kernel_size=(10, 10, 1), activation='relu', kernel_initializer='he_uniform')(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = BatchNormalization(center=True, scale=True)(x)
         x = Dropout(0.05)(x)
@@ -157,32 +279,32 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(4, 4, 1), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(4, 4, 1), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -233,26 +355,26 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -303,38 +425,38 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(1, 1, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -385,38 +507,38 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -467,70 +589,70 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
         x_angio = Flatten()(x)
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(structure_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(5, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(5, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -581,38 +703,38 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(50, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -620,32 +742,32 @@ def get_model(str_model, cfg):
 
         x_angio = GlobalAveragePooling3D()(x)
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(structure_inputs)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(5, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(5, kernel_size=(30, 30, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = ReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -699,32 +821,32 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(4, 4, 1), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(4, 4, 1), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(1, 1, 1))(x)
         # x = BatchNormalization()(x)
@@ -843,26 +965,26 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -941,26 +1063,26 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # angiography pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -968,26 +1090,26 @@ def get_model(str_model, cfg):
         x_angio = Flatten()(x)
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l2(cfg.lam))(structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1052,26 +1174,26 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # angiography pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1084,26 +1206,26 @@ def get_model(str_model, cfg):
         x_angio = Dropout(0.3)(x_angio)
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l2(cfg.lam))(structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1188,26 +1310,26 @@ def get_model(str_model, cfg):
             bscan3d_inputs = Input(shape=tuple(sample_size_cropped))
 
         # angiography pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1216,44 +1338,44 @@ def get_model(str_model, cfg):
 
         # bscan3d pathway
         if cfg.crop_size is None:
-            x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform')(bscan3d_inputs)
+            x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform')(bscan3d_inputs)
             x = LeakyReLU()(x)
             x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
             x = Dropout(0.05)(x)
 
-            x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+            x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
             x = LeakyReLU(0.03)(x)
             x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
             x = Dropout(0.2)(x)
 
-            x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+            x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
             x = LeakyReLU(0.03)(x)
             x = MaxPooling3D(pool_size=(2, 2, 1))(x)
             x = Dropout(0.2)(x)
 
-            x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+            x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
             x = LeakyReLU(0.03)(x)
             x = MaxPooling3D(pool_size=(2, 2, 1))(x)
             x = Dropout(0.2)(x)
             x_bscan = Flatten()(x)
 
         else:
-            x = Conv3D(5, kernel_size=(20, 40, 2), kernel_initializer='he_uniform')(bscan3d_inputs)
+            x = conv3d(5, kernel_size=(20, 40, 2), kernel_initializer='he_uniform')(bscan3d_inputs)
             x = LeakyReLU()(x)
             x = MaxPooling3D(pool_size=(2, 4, 1), strides=(2, 2, 1))(x)
             x = Dropout(0.05)(x)
 
-            x = Conv3D(8, kernel_size=(10, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+            x = conv3d(8, kernel_size=(10, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
             x = LeakyReLU(0.03)(x)
             x = MaxPooling3D(pool_size=(1, 2, 1), strides=(2, 2, 1))(x)
             x = Dropout(0.2)(x)
 
-            x = Conv3D(10, kernel_size=(10, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+            x = conv3d(10, kernel_size=(10, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
             x = LeakyReLU(0.03)(x)
             x = MaxPooling3D(pool_size=(1, 2, 1))(x)
             x = Dropout(0.2)(x)
 
-            x = Conv3D(20, kernel_size=(3, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+            x = conv3d(20, kernel_size=(3, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
             x = LeakyReLU(0.03)(x)
             x = MaxPooling3D(pool_size=(1, 2, 1))(x)
             x = Dropout(0.2)(x)
@@ -1389,22 +1511,22 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(structure_inputs)
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1458,23 +1580,23 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
             structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1523,23 +1645,23 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
             structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1615,27 +1737,27 @@ def get_model(str_model, cfg):
         structure_inputs = Input(shape=cfg.sample_size[0])
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
-        x = Conv3D(5, kernel_size=(40, 40, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(angiography_inputs)
+        x = conv3d(5, kernel_size=(40, 40, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(10, 10, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(10, 10, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(5, 5, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(40, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(40, kernel_size=(3, 3, 1), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1688,23 +1810,23 @@ def get_model(str_model, cfg):
 
         # angiography model
         # same as in arch_009
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1722,23 +1844,23 @@ def get_model(str_model, cfg):
         x_angio = LeakyReLU()(x)
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
             structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1793,26 +1915,26 @@ def get_model(str_model, cfg):
         bscan_inputs = Input(shape=cfg.sample_size[1])
 
         # angiography pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1820,23 +1942,23 @@ def get_model(str_model, cfg):
         x_angio = Flatten()(x)
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(
             structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(30, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -1933,26 +2055,26 @@ def get_model(str_model, cfg):
         bscan3d_inputs = Input(shape=cfg.sample_size[0])
 
         # angiography pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l1(cfg.lam))(angiography_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.1)(x)
 
-        x = Conv3D(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(10, 10, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1960,26 +2082,26 @@ def get_model(str_model, cfg):
         x_angio = Flatten()(x)
 
         # structural pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform',
                    kernel_regularizer=l2(cfg.lam))(structure_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l2(cfg.lam))(x)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         # x = BatchNormalization()(x)
@@ -1987,22 +2109,22 @@ def get_model(str_model, cfg):
         x_struct = Flatten()(x)
 
         # bscan3d pathway
-        x = Conv3D(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform')(bscan3d_inputs)
+        x = conv3d(5, kernel_size=(40, 40, 2), kernel_initializer='he_uniform')(bscan3d_inputs)
         x = LeakyReLU()(x)
         x = MaxPooling3D(pool_size=(4, 4, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.05)(x)
 
-        x = Conv3D(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(8, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU(0.03)(x)
         x = MaxPooling3D(pool_size=(2, 2, 1), strides=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(10, kernel_size=(20, 20, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU(0.03)(x)
         x = MaxPooling3D(pool_size=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
 
-        x = Conv3D(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
+        x = conv3d(20, kernel_size=(5, 5, 2), kernel_initializer='he_uniform', kernel_regularizer=l1(cfg.lam))(x)
         x = LeakyReLU(0.03)(x)
         x = MaxPooling3D(pool_size=(2, 2, 1))(x)
         x = Dropout(0.2)(x)
@@ -2123,6 +2245,52 @@ def get_model(str_model, cfg):
         raise NotImplementedError('Specified architecture is not implemented')
 
 
+def get_ensemble_model(vec_model):
+    """
+    Merges trained models into a single model over shared inputs, so that the whole ensemble is evaluated in one
+    batched forward pass instead of one predict call for every member
+
+    :param vec_model: list of trained models, e.g. from get_model, that predict the same classes
+    :return: model with the outputs [member_prob, mean_prob, vote], where member_prob holds the probabilities of every
+        member in the form (n_sample, n_model, n_output), mean_prob is their average in the form (n_sample, n_output)
+        and vote is the label predicted by most members in the form (n_sample)
+    """
+    # members consume the first inputs of [x_angiography, x_structure, x_bscan, x_bscan3d]
+    model_input = max(vec_model, key=lambda model: len(model.inputs))
+    vec_inputs = [Input(shape=tuple(x.shape[1:])) for x in model_input.inputs]
+
+    vec_prob = [Reshape((1, -1))(model(vec_inputs[:len(model.inputs)])) for model in vec_model]
+    if len(vec_prob) > 1:
+        member_prob = Concatenate(axis=1, name='member_prob')(vec_prob)
+    else:
+        member_prob = Lambda(lambda x: x, name='member_prob')(vec_prob[0])
+
+    mean_prob = Lambda(lambda x: tf.reduce_mean(x, axis=1), name='mean_prob')(member_prob)
+    vote = Lambda(_majority_vote, name='vote')(member_prob)
+
+    return Model(inputs=vec_inputs, outputs=[member_prob, mean_prob, vote])
+
+
+def _majority_vote(member_prob):
+    """
+    Obtains the label predicted by most members, the smallest label in case of a tie as in scipy.stats.mode
+
+    :param member_prob: tensor holding the probabilities of every member in the form (n_sample, n_model, n_output)
+    :return: tensor of labels in the form (n_sample)
+    """
+    # binary models have a single sigmoid output
+    if member_prob.shape[-1] == 1:
+        member_label = tf.cast(member_prob[..., 0] >= 0.5, tf.int32)
+        n_class = 2
+    else:
+        member_label = tf.argmax(member_prob, axis=-1, output_type=tf.int32)
+        n_class = member_prob.shape[-1]
+
+    vote_count = tf.reduce_sum(tf.one_hot(member_label, n_class), axis=1)
+
+    return tf.argmax(vote_count, axis=-1, output_type=tf.int32)
+
+
 # TODO: check this implementation later
 def get_callbacks(cfg):
     es = EarlyStopping(monitor='val_loss', min_delta=cfg.es_min_delta, patience=cfg.es_patience,
@@ -0,0 +1,216 @@
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras.layers import InputLayer, Conv2D, Conv3D, Dense, MaxPooling2D, MaxPooling3D, AveragePooling2D, \
+    AveragePooling3D, GlobalAveragePooling2D, GlobalAveragePooling3D, BatchNormalization, Add, LeakyReLU, ReLU, Softmax
+
+from model import get_model, get_all_architectures
+from config.load_config import get_config
+
+
+# order of the inputs of every architecture, see data_pipeline.get_dataset
+VEC_STR_PATHWAY = ['angiography', 'structure', 'bscan', 'bscan3d']
+
+
+def get_model_report(model):
+    """
+    Obtains the cost of every layer of a model from the layer configuration and the static shapes alone, without running
+    the model. FLOPs count a multiply-add as two operations and are those of the direct computation for a single sample,
+    e.g. an FFTConv3D layer is counted as the Conv3D it replaces
+
+    :param model: keras model, e.g. from get_model
+    :return: pandas DataFrame with one row per layer holding the layer name and type, the pathway, the output shape, the
+        FLOPs, the number of parameters and the number of activations for a single sample
+    """
+    # every layer belongs to the pathways of all inputs it depends on
+    dict_pathway = {}
+    for idx_input, x in enumerate(model.inputs):
+        dict_pathway[id(x._keras_history[0])] = {idx_input}
+
+    vec_report = []
+    for layer in model.layers:
+        if id(layer) not in dict_pathway:
+            set_pathway = set()
+            for layer_inbound in _get_inbound_layers(layer):
+                set_pathway |= dict_pathway.get(id(layer_inbound), set())
+            dict_pathway[id(layer)] = set_pathway
+
+        set_pathway = dict_pathway[id(layer)]
+        str_pathway = VEC_STR_PATHWAY[list(set_pathway)[0]] if len(set_pathway) == 1 else 'merged'
+
+        shape_output = _get_shape(layer.output)
+        if isinstance(layer, InputLayer):
+            vec_shape_input = []
+        else:
+            vec_shape_input = [_get_shape(x) for x in _flatten(layer.input)]
+
+        vec_report.append({'str_layer': layer.name,
+                           'str_type': type(layer).__name__,
+                           'str_pathway': str_pathway,
+                           'output_shape': shape_output,
+                           'n_flop': _get_layer_flop(layer, vec_shape_input, shape_output),
+                           'n_param': int(layer.count_params()),
+                           'n_activation': int(np.prod(shape_output))})
+
+    return pd.DataFrame(vec_report)
+
+
+def get_pathway_report(pd_report, batch_size):
+    """
+    Sums the cost of the layers of each pathway
+
+    :param pd_report: per-layer report from get_model_report
+    :param batch_size: number of samples in each batch, used for the activation memory
+    :return: pandas DataFrame with one row per pathway and a final row for the whole model, holding the GFLOPs for a
+        single sample, the number of parameters and the memory of the float32 weights and of the activations of a batch
+    """
+    vec_str_pathway = [str_pathway for str_pathway in VEC_STR_PATHWAY + ['merged']
+                       if str_pathway in pd_report.str_pathway.values]
+
+    vec_report = []
+    for str_pathway in vec_str_pathway + ['total']:
+        pd_curr = pd_report if str_pathway == 'total' else pd_report[pd_report.str_pathway == str_pathway]
+        vec_report.append({'str_pathway': str_pathway,
+                           'gflop': pd_curr.n_flop.sum() / 1e9,
+                           'n_param': int(pd_curr.n_param.sum()),
+                           'weight_mb': pd_curr.n_param.sum() * 4 / 2 ** 20,
+                           'activation_mb': pd_curr.n_activation.sum() * 4 * batch_size / 2 ** 20})
+
+    return pd.DataFrame(vec_report)
+
+
+def _get_inbound_layers(layer):
+    """
+    Obtains the layers whose outputs are passed to the given layer
+
+    :param layer: layer of a functional model
+    :return: list of layers
+    """
+    vec_layer = []
+    for node in layer._inbound_nodes:
+        # nodes of keras 3 hold their parent nodes, while those of tf.keras 2 hold the inbound layers
+        if hasattr(node, 'parent_nodes'):
+            vec_layer.extend(node_parent.operation for node_parent in node.parent_nodes)
+        else:
+            vec_layer.extend(_flatten(node.inbound_layers))
+
+    return vec_layer
+
+
+def _flatten(x):
+    return list(x) if isinstance(x, (list, tuple)) else [x]
+
+
+def _get_shape(x):
+    # shape of a single sample
+    return tuple(int(n) for n in x.shape[1:])
+
+
+def _get_layer_flop(layer, vec_shape_input, shape_output):
+    """
+    Obtains the FLOPs of a single layer for a single sample
+
+    :param layer: keras layer
+    :param vec_shape_input: list of the shapes of all inputs of the layer without the batch axis
+    :param shape_output: shape of the output of the layer without the batch axis
+    :return: number of floating point operations
+    """
+    n_output = int(np.prod(shape_output))
+
+    if isinstance(layer, (Conv2D, Conv3D)):
+        n_channel_input = vec_shape_input[0][-1] // getattr(layer, 'groups', 1)
+        n_flop = 2 * n_output * int(np.prod(layer.kernel_size)) * n_channel_input
+        n_flop += n_output if layer.use_bias else 0
+        n_flop += _get_activation_flop(layer, n_output)
+
+    elif isinstance(layer, Dense):
+        n_flop = 2 * int(np.prod(vec_shape_input[0])) * layer.units
+        n_flop += n_output if layer.use_bias else 0
+        n_flop += _get_activation_flop(layer, n_output)
+
+    elif isinstance(layer, (MaxPooling2D, MaxPooling3D, AveragePooling2D, AveragePooling3D)):
+        n_flop = n_output * int(np.prod(layer.pool_size))
+
+    elif isinstance(layer, (GlobalAveragePooling2D, GlobalAveragePooling3D)):
+        n_flop = int(np.prod(vec_shape_input[0]))
+
+    elif isinstance(layer, BatchNormalization):
+        # scale and shift at inference
+        n_flop = 2 * n_output
+
+    elif isinstance(layer, Add):
+        n_flop = (len(vec_shape_input) - 1) * n_output
+
+    elif isinstance(layer, (LeakyReLU, ReLU, Softmax)):
+        n_flop = n_output
+
+    else:
+        # reshaping, concatenation and dropout, which is a no-op at inference
+        n_flop = 0
+
+    return n_flop
+
+
+def _get_activation_flop(layer, n_output):
+    activation = getattr(layer, 'activation', None)
+    if activation is None or activation.__name__ == 'linear':
+        return 0
+
+    return n_output
+
+
+if __name__ == '__main__':
+    # Configuring the files here for now
+    cfg = get_config(filename=pathlib.Path(os.getcwd()) / 'config' / 'default_config.yml')
+
+    # same sizes as in the training scripts
+    cfg.num_octa = 5
+    cfg.downscale_size = [256, 256]
+    cfg.crop_size = [int(np.round(cfg.downscale_size[1] * 1.5/7.32)),
+                     int(np.round(cfg.downscale_size[1] * 1.8/7.32))]
+    cfg.sample_size = [(cfg.downscale_size[0], cfg.downscale_size[1], cfg.num_octa, 1),
+                       (cfg.downscale_size[0], cfg.downscale_size[1], 1)]
+    cfg.num_classes = 3
+    cfg.binary_class = False
+    cfg.lr = 5e-5
+    cfg.lam = 1e-5
+    cfg.batch_size = 8
+
+    # architectures to report, all architectures if None
+    vec_str_model = None
+    # whether to print the cost of every layer in addition to the totals of each pathway
+    print_layers = False
+    # path to a csv file to save the per-layer report of all architectures in, not saved if None
+    f_report = None
+
+    if vec_str_model is None:
+        vec_str_model = get_all_architectures()
+
+    vec_pd_report = []
+    vec_summary = []
+    for str_model in vec_str_model:
+        try:
+            model = get_model(str_model, cfg)
+        except Exception as e:
+            print('\n{} cannot be built for sample size {}: {}'.format(str_model, cfg.sample_size, e))
+            continue
+
+        pd_report = get_model_report(model)
+        pd_pathway = get_pathway_report(pd_report, cfg.batch_size)
+
+        print('\n{}, batch size {}'.format(str_model, cfg.batch_size))
+        if print_layers:
+            print(pd_report.to_string(index=False))
+        print(pd_pathway.to_string(index=False, float_format='{:.3f}'.format))
+
+        pd_report.insert(0, 'str_model', str_model)
+        vec_pd_report.append(pd_report)
+        vec_summary.append(dict(str_model=str_model, **pd_pathway.iloc[-1].drop('str_pathway').to_dict()))
+
+    print('\nAll architectures, batch size {}'.format(cfg.batch_size))
+    print(pd.DataFrame(vec_summary).to_string(index=False, float_format='{:.3f}'.format))
+
+    if f_report is not None:
+        pd.concat(vec_pd_report).to_csv(f_report, index=False)
@@ -1,18 +1,37 @@
 import glob
 import re
+import functools
+import collections
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from skimage import io, transform, color
+from PIL import Image
 import pathlib
 import pandas as pd
 import matplotlib.pyplot as plt
 from tensorflow.keras.utils import to_categorical
-from imblearn.over_sampling import SMOTE
 from utils.context_management import temp_seed
-from load_csv import load_csv_params
+from utils.image_cache import get_image_cache_path, load_cached_image, save_cached_image, evict_image_cache
+from utils.dataset_store import get_dataset_store_path, dataset_store_exists, save_dataset_store, open_dataset_store
+from utils.patient_store import get_patient_store_key, get_patient_store_path, get_patient_fingerprint, \
+    load_patient_store, save_patient_store
+from utils.manifest import match_octa_image, match_bscan3d_images, load_manifest, get_manifest_patient_files, \
+    check_manifest, get_manifest_patients
+from load_csv import load_csv_params, load_csv_params_all
+from data_pipeline import IndexedView
 
 
-def preprocess(vec_idx_patient, cfg):
+def preprocess(vec_idx_patient, cfg, data=None):
+    """
+    Loads the data and splits it into training, validation and test sets
+
+    :param vec_idx_patient: list containing start and end indices of the patients
+    :param cfg: object holding all the training parameters
+    :param data: tuple X, y of already loaded data, e.g. from select_feature, data_loading is called if None
+
+    :return: a tuple Xs, ys holding the train, validation and test sets
+    """
     # Exception detection
     if not cfg.binary_class:
         if not cfg.num_classes == 3:
@@ -22,7 +41,9 @@ def preprocess(vec_idx_patient, cfg):
             raise Exception('Binary classification specified but three classes requested')
 
     # load all data
-    [x_angiography, x_structure, x_bscan, x_bscan3d], y = data_loading(vec_idx_patient, cfg)
+    if data is None:
+        data = data_loading(vec_idx_patient, cfg)
+    [x_angiography, x_structure, x_bscan, x_bscan3d], y = data
 
     # split the data into training, validation and test set
     if not cfg.balanced:
@@ -32,57 +53,14 @@ def preprocess(vec_idx_patient, cfg):
         else:
             Xs, ys = _split_data_unbalanced(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg)
 
+        # rebalance the classes in the training set without creating any new images
         if cfg.oversample:
-            if cfg.oversample_method == 'smote':
-                x_train = Xs[0]
-                x_angiography_train = x_train[0]
-                x_structure_train = x_train[1]
-                x_bscan_train = x_train[2]
-                x_bscan3d_train = x_train[3]
-
-                y_train = np.argmax(ys[0], axis=1)
-
-                x_angiography_train_rs = x_angiography_train.reshape(x_angiography_train.shape[0], -1)
-                x_structure_train_rs = x_structure_train.reshape(x_structure_train.shape[0], -1)
-                x_bscan_train_rs = x_bscan_train.reshape(x_bscan_train.shape[0], -1)
-                x_bscan3d_train_rs = x_bscan3d_train.reshape(x_bscan3d_train.shape[0], -1)
-
-                sm = SMOTE()
-                x_angiography_train_rs, y_train_rs = sm.fit_resample(x_angiography_train_rs, y_train)
-                x_structure_train_rs, y_train_rs_alt = sm.fit_resample(x_structure_train_rs, y_train)
-                x_bscan_train_rs, y_train_rs_alt_alt = sm.fit_resample(x_bscan_train_rs, y_train)
-                x_bscan3d_train_rs, y_train_rs_alt_alt = sm.fit_resample(x_bscan3d_train_rs, y_train)
-
-                angio_shape = [x_angiography_train_rs.shape[0]]
-                angio_shape.extend(list(x_angiography_train.shape[1:]))
-
-                structure_shape = [x_structure_train_rs.shape[0]]
-                structure_shape.extend(list(x_structure_train.shape[1:]))
-
-                bscan_shape = [x_bscan_train_rs.shape[0]]
-                bscan_shape.extend(list(x_bscan_train.shape[1:]))
-
-                bscan3d_shape = [x_bscan3d_train_rs.shape[0]]
-                bscan3d_shape.extend(list(x_bscan3d_train.shape[1:]))
-
-                x_angiography = x_angiography_train_rs.reshape(angio_shape)
-                x_structure = x_structure_train_rs.reshape(structure_shape)
-                x_bscan = x_bscan_train_rs.reshape(bscan_shape)
-                x_bscan3d = x_bscan3d_train_rs.reshape(bscan3d_shape)
-
-                if not (np.allclose(y_train_rs, y_train_rs_alt) and np.allclose(y_train_rs, y_train_rs_alt_alt)):
-                    raise Exception("Issues with SMOTE")
-
-                x_train = [x_angiography, x_structure, x_bscan]
-                y_train = to_categorical(y_train_rs, num_classes=cfg.num_classes)
-
-                Xs = [x_train, Xs[1], Xs[2]]
-                ys = [y_train, ys[1], ys[2]]
-
-                raise Exception("Not fully implemented")
-
-            elif cfg.oversample_method == 'random':
-                raise NotImplementedError
+            X = [x_angiography, x_structure, x_bscan, x_bscan3d]
+            if cfg.use_random_seed:
+                with temp_seed(cfg.random_seed):
+                    Xs, ys, cfg.vec_class_weight = _oversample(X, y, Xs, ys, cfg.vec_idx_absolute, cfg)
+            else:
+                Xs, ys, cfg.vec_class_weight = _oversample(X, y, Xs, ys, cfg.vec_idx_absolute, cfg)
 
     else:
         if cfg.use_random_seed:
@@ -94,12 +72,13 @@ def preprocess(vec_idx_patient, cfg):
     return Xs, ys
 
 
-def preprocess_cv(vec_idx_patient, cfg):
+def preprocess_cv(vec_idx_patient, cfg, data=None):
     """
     Cross validation mode of the preprocessing function
 
     :param vec_idx_patient: list containing start and end indices of the patients
     :param cfg: object holding all the training parameters
+    :param data: tuple X, y of already loaded data, e.g. from select_feature, data_loading is called if None
 
     :return:
     """
@@ -120,7 +99,9 @@ def preprocess_cv(vec_idx_patient, cfg):
         raise Exception("Percentage of train, validation and test sets should add to 1")
 
     # load all data
-    [x_angiography, x_structure, x_bscan, x_bscan3d], y = data_loading(vec_idx_patient, cfg)
+    if data is None:
+        data = data_loading(vec_idx_patient, cfg)
+    [x_angiography, x_structure, x_bscan, x_bscan3d], y = data
 
     # split the data into training, validation and test set
     if not cfg.balanced:
@@ -130,9 +111,19 @@ def preprocess_cv(vec_idx_patient, cfg):
         else:
             vec_Xs, vec_ys = _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg)
 
-        # Don't need to do oversample anymore in the future
+        # rebalance the classes in the training set of each fold without creating any new images
         if cfg.oversample:
-            raise NotImplementedError
+            X = [x_angiography, x_structure, x_bscan, x_bscan3d]
+            cfg.vec_class_weight = []
+            for idx_fold in range(len(vec_Xs)):
+                if cfg.use_random_seed:
+                    with temp_seed(cfg.random_seed + idx_fold):
+                        vec_Xs[idx_fold], vec_ys[idx_fold], vec_class_weight = _oversample(
+                            X, y, vec_Xs[idx_fold], vec_ys[idx_fold], cfg.vec_idx_absolute[idx_fold], cfg)
+                else:
+                    vec_Xs[idx_fold], vec_ys[idx_fold], vec_class_weight = _oversample(
+                        X, y, vec_Xs[idx_fold], vec_ys[idx_fold], cfg.vec_idx_absolute[idx_fold], cfg)
+                cfg.vec_class_weight.append(vec_class_weight)
 
     else:
         # In the dataset there are huge imbalances for the feature labels... I don't think doing balanced training would
@@ -142,32 +133,180 @@ def preprocess_cv(vec_idx_patient, cfg):
     return vec_Xs, vec_ys
 
 
+def preprocess_repeated(vec_idx_patient, cfg, data=None):
+    """
+    Repeated mode of the preprocessing function. The data is loaded only once and cfg.n_repeats independent splits are
+    drawn from it as index sets, so that each repeat is a view of the same arrays instead of another load from disk
+
+    :param vec_idx_patient: list containing start and end indices of the patients
+    :param cfg: object holding all the training parameters
+    :param data: tuple X, y of already loaded data, e.g. from select_feature, data_loading is called if None
+
+    :return: a tuple vec_Xs, vec_ys holding the train, validation and test sets of each repeat, with the indices of each
+        split in cfg.vec_idx_absolute as in preprocess_cv
+    """
+    # Exception detection
+    if not cfg.binary_class:
+        if not cfg.num_classes == 3:
+            raise Exception('Three class classification specified but two classes requested')
+    else:
+        if not cfg.num_classes == 2:
+            raise Exception('Binary classification specified but three classes requested')
+    if cfg.n_repeats is None:
+        raise Exception("Should specify the number of repeats")
+
+    # load all data
+    if data is None:
+        data = data_loading(vec_idx_patient, cfg)
+    X, y = data
+
+    vec_Xs = []
+    vec_ys = []
+    vec_idx_absolute_all = []
+    vec_class_weight_all = []
+    for idx_repeat in range(cfg.n_repeats):
+        # every repeat gets its own seed so that the splits differ but can be reproduced
+        if cfg.use_random_seed:
+            with temp_seed(cfg.random_seed + idx_repeat):
+                Xs, ys, vec_class_weight = _split_repeat(X, y, cfg)
+        else:
+            Xs, ys, vec_class_weight = _split_repeat(X, y, cfg)
+
+        vec_Xs.append(Xs)
+        vec_ys.append(ys)
+        vec_idx_absolute_all.append(cfg.vec_idx_absolute)
+        vec_class_weight_all.append(vec_class_weight)
+
+    cfg.vec_idx_absolute = vec_idx_absolute_all
+    cfg.vec_class_weight = vec_class_weight_all if cfg.oversample else None
+
+    return vec_Xs, vec_ys
+
+
+def _split_repeat(X, y, cfg):
+    """
+    Draws a single split for preprocess_repeated, following the same splitting and oversampling as preprocess
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d] holding all samples
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
+
+    :return: a tuple Xs, ys, vec_class_weight, where Xs are views of X
+    """
+    if cfg.balanced:
+        vec_idx_absolute = _split_idx(y, cfg)
+    elif cfg.split_method == 'stratified':
+        vec_idx_absolute = _split_idx_stratified(y, cfg)
+    else:
+        vec_idx_absolute = _split_idx_unbalanced(y, cfg)
+    cfg.vec_idx_absolute = vec_idx_absolute
+
+    Xs, ys = _gather_split(X, y, vec_idx_absolute, cfg, bool_view=True)
+    cfg.sample_size = [Xs[0][0].shape[1:], Xs[0][2].shape[1:]]
+
+    vec_class_weight = None
+    if cfg.oversample and not cfg.balanced:
+        Xs, ys, vec_class_weight = _oversample(X, y, Xs, ys, vec_idx_absolute, cfg)
+
+    return Xs, ys, vec_class_weight
+
+
+def _oversample(X, y, Xs, ys, vec_idx_absolute, cfg):
+    """
+    Rebalances the classes of the training set without creating any new images. With the 'random' method the samples
+    of the smaller classes are drawn again at random until all classes are as large as the largest one, and the training
+    set becomes a view that refers to the rows of X by index. With the 'weight' method the training set is kept as is
+    and the weight of each class for fit is returned instead
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d] holding all samples
+    :param y: numpy array in the form (n_sample)
+    :param Xs: list holding the train, validation and test sets
+    :param ys: list holding the labels of the train, validation and test sets
+    :param vec_idx_absolute: list in the form [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+    :param cfg: object holding all the training parameters
+
+    :return: a tuple Xs, ys, vec_class_weight, where vec_class_weight is None unless the 'weight' method is used
+    """
+    vec_idx_absolute_train = vec_idx_absolute[0]
+    y_train = y[vec_idx_absolute_train]
+    vec_y_unique, vec_n_class = np.unique(y_train, return_counts=True)
+
+    if cfg.oversample_method == 'random':
+        vec_idx_absolute_train_os = [vec_idx_absolute_train]
+        for y_unique, n_class in zip(vec_y_unique, vec_n_class):
+            vec_idx_class = vec_idx_absolute_train[y_train == y_unique]
+            vec_idx_absolute_train_os.append(np.random.choice(vec_idx_class, np.max(vec_n_class) - n_class))
+
+        vec_idx_absolute_train_os = np.concatenate(vec_idx_absolute_train_os, axis=0)
+        vec_idx_absolute_train_os = vec_idx_absolute_train_os[np.random.permutation(vec_idx_absolute_train_os.shape[0])]
+
+        y_train_os = y[vec_idx_absolute_train_os]
+        if not cfg.binary_class:
+            y_train_os = to_categorical(y_train_os, num_classes=cfg.num_classes)
+
+        x_train_os = [IndexedView(x, vec_idx_absolute_train_os) for x in X]
+
+        return [x_train_os, Xs[1], Xs[2]], [y_train_os, ys[1], ys[2]], None
+
+    elif cfg.oversample_method == 'weight':
+        # same weighting as the balanced mode in scikit-learn, kept as a list since cfg cannot hold integer keys
+        vec_n_class = np.bincount(y_train.astype(int), minlength=cfg.num_classes)
+        vec_class_weight = len(y_train) / (cfg.num_classes * np.maximum(vec_n_class, 1))
+
+        return Xs, ys, vec_class_weight.tolist()
+
+    elif cfg.oversample_method == 'smote':
+        raise Exception('SMOTE creates full size synthetic cubes and is no longer supported, use random or weight')
+
+    else:
+        raise Exception('Undefined oversampling method')
+
+
 def _split_data_unbalanced(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg):
+    """
+    Unbalanced splitting of training, validation and test sets. The search for a valid split only touches the labels
+    and the image tensors are gathered once at the end
+
+    :param x_angiography: numpy array in the form (n_sample, width, height, num_octa, 1)
+    :param x_structure: numpy array in the form (n_sample, width, height, num_octa, 1)
+    :param x_bscan: numpy array in the form (n_sample, width, height, 1)
+    :param x_bscan3d: numpy array in the form (n_sample, width, height, num_octa, 1)
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
+
+    :return: a tuple Xs, ys holding the train, validation and test sets
+    """
+    if cfg.split_method == 'stratified':
+        vec_idx_absolute = _split_idx_stratified(y, cfg)
+    else:
+        vec_idx_absolute = _split_idx_unbalanced(y, cfg)
+    cfg.vec_idx_absolute = vec_idx_absolute
+
+    Xs, ys = _gather_split([x_angiography, x_structure, x_bscan, x_bscan3d], y, vec_idx_absolute, cfg)
+    cfg.sample_size = [Xs[0][0].shape[1:], Xs[0][2].shape[1:]]
+
+    return Xs, ys
+
+
+def _split_idx_unbalanced(y, cfg):
+    """
+    Searches for a random split into training, validation and test sets where all sets contain all classes, using the
+    labels alone
+
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
+
+    :return: a list in the form [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+    """
     n_iter = 0
     while True:
-        idx_permutation = np.random.permutation(x_angiography.shape[0])
-        x_angiography_curr = x_angiography[idx_permutation, :, :, :, :]
-        x_structure_curr = x_structure[idx_permutation, :, :, :, :]
-        x_bscan_curr = x_bscan[idx_permutation, :, :, :]
-        x_bscan3d_curr = x_bscan3d[idx_permutation, :, :, :, :]
-
+        idx_permutation = np.random.permutation(y.shape[0])
         y_curr = y[idx_permutation]
 
         # split into train, validation and test
         n_train = int(np.ceil(len(idx_permutation) * cfg.per_train))
         n_valid = int(np.floor(len(idx_permutation) * cfg.per_valid))
 
-        x_angiography_train, x_angiography_valid, x_angiography_test = _split_x_set(x_angiography_curr, n_train,
-                                                                                    n_valid)
-        x_structure_train, x_structure_valid, x_structure_test = _split_x_set(x_structure_curr, n_train, n_valid)
-        x_bscan_train, x_bscan_valid, x_bscan_test = _split_x_set(x_bscan_curr, n_train, n_valid)
-        x_bscan3d_train, x_bscan3d_valid, x_bscan3d_test = _split_x_set(x_bscan3d_curr, n_train, n_valid)
-
-
-        x_train = [x_angiography_train, x_structure_train, x_bscan_train, x_bscan3d_train]
-        x_valid = [x_angiography_valid, x_structure_valid, x_bscan_valid, x_bscan3d_valid]
-        x_test = [x_angiography_test, x_structure_test, x_bscan_test, x_bscan3d_test]
-
         y_train = y_curr[: n_train]
         y_valid = y_curr[n_train: n_train + n_valid]
         y_test = y_curr[n_train + n_valid:]
@@ -181,26 +320,11 @@ def _split_data_unbalanced(x_angiography, x_structure, x_bscan, x_bscan3d, y, cf
         if n_iter > 200:
             raise Exception("No valid splitting possible, check dataset and configuration")
 
-    # convert the labels to onehot encoding if multi-class
-    if not cfg.binary_class:
-        y_train = to_categorical(y_train, num_classes=cfg.num_classes)
-        y_valid = to_categorical(y_valid, num_classes=cfg.num_classes)
-        y_test = to_categorical(y_test, num_classes=cfg.num_classes)
-
-    cfg.sample_size = [x_angiography_train.shape[1:], x_bscan_train.shape[1:]]
+    vec_idx_absolute_train = idx_permutation[: n_train]
+    vec_idx_absolute_valid = idx_permutation[n_train: n_train + n_valid]
+    vec_idx_absolute_test = idx_permutation[n_train + n_valid:]
 
-    vec_idx_absolute = np.arange(0, x_angiography.shape[0])
-    vec_idx_absolute = vec_idx_absolute[idx_permutation]
-    vec_idx_absolute_train = vec_idx_absolute[: n_train]
-    vec_idx_absolute_valid = vec_idx_absolute[n_train: n_train + n_valid]
-    vec_idx_absolute_test = vec_idx_absolute[n_train + n_valid:]
-
-    cfg.vec_idx_absolute = [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
-
-    Xs = [x_train, x_valid, x_test]
-    ys = [y_train, y_valid, y_test]
-
-    return Xs, ys
+    return [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
 
 
 def _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg):
@@ -215,12 +339,41 @@ def _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y,
 
     :return:
     """
+    cfg.sample_size = [x_angiography.shape[1:], x_bscan.shape[1:]]
+
+    if cfg.split_method == 'stratified':
+        vec_idx_absolute = _split_idx_stratified_cv(y, cfg)
+    else:
+        vec_idx_absolute = _split_idx_unbalanced_cv(y, cfg)
+    cfg.vec_idx_absolute = vec_idx_absolute
+
+    # list of lists holding the data from all folds
+    vec_Xs = []
+    vec_ys = []
+    for vec_idx_absolute_curr in vec_idx_absolute:
+        Xs_curr, ys_curr = _gather_split([x_angiography, x_structure, x_bscan, x_bscan3d], y, vec_idx_absolute_curr,
+                                         cfg, bool_view=cfg.cv_fold_view)
+
+        vec_Xs.append(Xs_curr)
+        vec_ys.append(ys_curr)
+
+    return vec_Xs, vec_ys
+
+
+def _split_idx_unbalanced_cv(y, cfg):
+    """
+    Searches for a random split into cross validation folds where the training, validation and test sets of every fold
+    contain all classes, using the labels alone
 
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
+
+    :return: list holding [idx_train, idx_valid, idx_test] for each fold
+    """
     n_iter = 0
-    cfg.sample_size = [x_angiography.shape[1:], x_bscan.shape[1:]]
     while True:
-        idx_orig = np.arange(0, x_angiography.shape[0], 1)
-        idx_permutation = np.random.permutation(x_angiography.shape[0])
+        idx_orig = np.arange(0, y.shape[0], 1)
+        idx_permutation = np.random.permutation(y.shape[0])
         vec_idx_test = np.array_split(idx_permutation, cfg.num_cv_fold)
 
         n_train = int(np.ceil(len(idx_permutation) * cfg.per_train))
@@ -231,10 +384,6 @@ def _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y,
         if n_iter > 200:
             raise Exception("No valid splitting possible, check dataset and configuration")
 
-        # list of lists holding the data from all folds
-        vec_Xs = []
-        vec_ys = []
-
         # list of list holding the absolute indices of all subjects
         vec_idx_absolute = []
 
@@ -242,11 +391,6 @@ def _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y,
         for i in range(cfg.num_cv_fold):
             # extract the test set first
             idx_test_curr = vec_idx_test[i]
-            x_angiography_test_curr = x_angiography[idx_test_curr, ...]
-            x_structure_test_curr = x_structure[idx_test_curr, ...]
-            x_bscan_test_curr = x_bscan[idx_test_curr, ...]
-            x_bscan3d_test_curr = x_bscan3d[idx_test_curr, ...]
-            y_test_curr = y[idx_test_curr]
 
             # obtain the indices for training and validation
             idx_train_valid_sorted = np.setdiff1d(idx_orig, idx_test_curr)
@@ -257,49 +401,16 @@ def _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y,
             idx_train_curr = idx_train_valid[:n_train]
             idx_valid_curr = idx_train_valid[n_train:]
 
-            x_angiography_train_curr = x_angiography[idx_train_curr, ...]
-            x_structure_train_curr = x_structure[idx_train_curr, ...]
-            x_bscan_train_curr = x_bscan[idx_train_curr, ...]
-            x_bscan3d_train_curr = x_bscan3d[idx_train_curr, ...]
-            y_train_curr = y[idx_train_curr]
-
-            x_angiography_valid_curr = x_angiography[idx_valid_curr, ...]
-            x_structure_valid_curr = x_structure[idx_valid_curr, ...]
-            x_bscan_valid_curr = x_bscan[idx_valid_curr, ...]
-            x_bscan3d_valid_curr = x_bscan3d[idx_valid_curr, ...]
-            y_valid_curr = y[idx_valid_curr]
-
             # test if all classes are present in all three sets
-            if len(np.unique(y_train_curr)) == cfg.num_classes and len(np.unique(y_valid_curr)) == cfg.num_classes \
-                    and len(np.unique(y_test_curr)) == cfg.num_classes:
+            if len(np.unique(y[idx_train_curr])) == cfg.num_classes and \
+                    len(np.unique(y[idx_valid_curr])) == cfg.num_classes and \
+                    len(np.unique(y[idx_test_curr])) == cfg.num_classes:
                 vec_check_fold.append(True)
             else:
                 skip_to_next_loop = True
                 break
 
-            x_train_curr = [x_angiography_train_curr, x_structure_train_curr, x_bscan_train_curr, x_bscan3d_train_curr]
-            x_valid_curr = [x_angiography_valid_curr, x_structure_valid_curr, x_bscan_valid_curr, x_bscan3d_valid_curr]
-            x_test_curr = [x_angiography_test_curr, x_structure_test_curr, x_bscan_test_curr, x_bscan3d_test_curr]
-
-            if not cfg.binary_class:
-                y_train_curr = to_categorical(y_train_curr, num_classes=cfg.num_classes)
-                y_valid_curr = to_categorical(y_valid_curr, num_classes=cfg.num_classes)
-                y_test_curr = to_categorical(y_test_curr, num_classes=cfg.num_classes)
-
-            # package all the data from the current fold
-            Xs_curr = [x_train_curr, x_valid_curr, x_test_curr]
-            ys_curr = [y_train_curr, y_valid_curr, y_test_curr]
-
-            # obtain the absolute indices
-            vec_idx_absolute_train = idx_train_curr
-            vec_idx_absolute_valid = idx_valid_curr
-            vec_idx_absolute_test_curr = idx_test_curr
-
-            # append everything to the list
-            vec_Xs.append(Xs_curr)
-            vec_ys.append(ys_curr)
-
-            vec_idx_absolute.append([vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test_curr])
+            vec_idx_absolute.append([idx_train_curr, idx_valid_curr, idx_test_curr])
 
         if skip_to_next_loop:
             continue
@@ -307,96 +418,84 @@ def _split_data_unbalanced_cv(x_angiography, x_structure, x_bscan, x_bscan3d, y,
         if np.all(vec_check_fold):
             break
 
+    return vec_idx_absolute
+
+
+def _split_data(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg):
+    """
+    Balanced splitting of training, validation and test sets, where the training set holds roughly the same number of
+    samples from each class
+
+    :param x_angiography: numpy array in the form (n_sample, width, height, num_octa, 1)
+    :param x_structure: numpy array in the form (n_sample, width, height, num_octa, 1)
+    :param x_bscan: numpy array in the form (n_sample, width, height, 1)
+    :param x_bscan3d: numpy array in the form (n_sample, width, height, num_octa, 1)
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
+
+    :return: a tuple Xs, ys holding the train, validation and test sets
+    """
+    vec_idx_absolute = _split_idx(y, cfg)
     cfg.vec_idx_absolute = vec_idx_absolute
 
-    return vec_Xs, vec_ys
+    Xs, ys = _gather_split([x_angiography, x_structure, x_bscan, x_bscan3d], y, vec_idx_absolute, cfg)
+    cfg.sample_size = [Xs[0][0].shape[1:], Xs[0][2].shape[1:]]
 
+    return Xs, ys
 
-def _split_data(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg):
+
+def _split_idx(y, cfg):
+    """
+    Searches for a balanced split into training, validation and test sets using the labels alone
+
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
+
+    :return: a list in the form [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+    """
     # split into train, validation and test
-    n_train = int(np.ceil(x_angiography.shape[0] * cfg.per_train))
-    n_valid = int(np.floor(x_angiography.shape[0] * cfg.per_valid))
+    n_train = int(np.ceil(y.shape[0] * cfg.per_train))
+    n_valid = int(np.floor(y.shape[0] * cfg.per_valid))
 
     vec_ls = np.array_split(np.arange(n_train), cfg.num_classes)
     cfg.train_split = []
     for ls in vec_ls:
         cfg.train_split.append(ls.shape[0])
 
-    vec_idx_class0 = np.arange(x_angiography.shape[0])[y == 0]
+    vec_idx_class0 = np.arange(y.shape[0])[y == 0]
     vec_idx_class0_permutation = np.random.permutation(vec_idx_class0.shape[0])
     vec_idx_class0 = vec_idx_class0[vec_idx_class0_permutation]
     vec_idx_class0_train = vec_idx_class0[:cfg.train_split[0]]
 
-    vec_idx_class1 = np.arange(x_angiography.shape[0])[y == 1]
+    vec_idx_class1 = np.arange(y.shape[0])[y == 1]
     vec_idx_class1_permutation = np.random.permutation(vec_idx_class1.shape[0])
     vec_idx_class1 = vec_idx_class1[vec_idx_class1_permutation]
     vec_idx_class1_train = vec_idx_class1[:cfg.train_split[1]]
 
+    # get the absolute index wrt the indexing in x_angiography
     if not cfg.binary_class:
-        vec_idx_class2 = np.arange(x_angiography.shape[0])[y == 2]
+        vec_idx_class2 = np.arange(y.shape[0])[y == 2]
         vec_idx_class2_permutation = np.random.permutation(vec_idx_class2.shape[0])
         vec_idx_class2 = vec_idx_class2[vec_idx_class2_permutation]
         vec_idx_class2_train = vec_idx_class2[:cfg.train_split[2]]
 
-        x_angiography_train = np.concatenate((x_angiography[vec_idx_class0_train, :, :, :, :],
-                                              x_angiography[vec_idx_class1_train, :, :, :, :],
-                                              x_angiography[vec_idx_class2_train, :, :, :, :]), axis=0)
-
-        x_structure_train = np.concatenate((x_structure[vec_idx_class0_train, :, :, :, :],
-                                            x_structure[vec_idx_class1_train, :, :, :, :],
-                                            x_structure[vec_idx_class2_train, :, :, :, :]), axis=0)
-
-        x_bscan_train = np.concatenate((x_bscan[vec_idx_class0_train, :, :, :],
-                                        x_bscan[vec_idx_class1_train, :, :, :],
-                                        x_bscan[vec_idx_class2_train, :, :, :]), axis=0)
-
-        x_bscan3d_train = np.concatenate((x_bscan3d[vec_idx_class0_train, :, :, :, :],
-                                            x_bscan3d[vec_idx_class1_train, :, :, :, :],
-                                            x_bscan3d[vec_idx_class2_train, :, :, :, :]), axis=0)
-
-        y_train = np.concatenate((y[vec_idx_class0_train],
-                                  y[vec_idx_class1_train],
-                                  y[vec_idx_class2_train]), axis=0)
-
-    else:
-        x_angiography_train = np.concatenate((x_angiography[vec_idx_class0_train, :, :, :, :],
-                                              x_angiography[vec_idx_class1_train, :, :, :, :]), axis=0)
-
-        x_structure_train = np.concatenate((x_structure[vec_idx_class0_train, :, :, :, :],
-                                            x_structure[vec_idx_class1_train, :, :, :, :]), axis=0)
-
-        x_bscan_train = np.concatenate((x_bscan[vec_idx_class0_train, :, :, :],
-                                        x_bscan[vec_idx_class1_train, :, :, :]), axis=0)
-        
-        x_bscan3d_train = np.concatenate((x_bscan3d[vec_idx_class0_train, :, :, :, :],
-                                            x_bscan3d[vec_idx_class1_train, :, :, :, :]), axis=0)
-
-
-        y_train = np.concatenate((y[vec_idx_class0_train],
-                                  y[vec_idx_class1_train]), axis=0)
-
-    # shuffle within the training set again...
-    vec_idx_train = np.arange(y_train.shape[0])
-    vec_idx_train_permutation = np.random.permutation(vec_idx_train.shape[0])
-
-    x_angiography_train = x_angiography_train[vec_idx_train_permutation, :, :, :, :]
-    x_structure_train = x_structure_train[vec_idx_train_permutation, :, :, :, :]
-    x_bscan_train = x_bscan_train[vec_idx_train_permutation, :, :, :]
-    x_bscan3d_train = x_bscan3d_train[vec_idx_train_permutation, :, :, :, :]
-
-    y_train = y_train[vec_idx_train_permutation]
-    vec_idx_train = vec_idx_train[vec_idx_train_permutation]
-
-    # get the absolute index wrt the indexing in x_angiography
-    if not cfg.binary_class:
         vec_idx_absolute_train = np.concatenate((vec_idx_class0_train, vec_idx_class1_train, vec_idx_class2_train),
                                                 axis=0)
     else:
         vec_idx_absolute_train = np.concatenate((vec_idx_class0_train, vec_idx_class1_train), axis=0)
 
-    vec_idx_absolute_train = vec_idx_absolute_train[vec_idx_train]
+    # shuffle within the training set again...
+    vec_idx_train_permutation = np.random.permutation(vec_idx_absolute_train.shape[0])
+    vec_idx_absolute_train = vec_idx_absolute_train[vec_idx_train_permutation]
 
     # Now generate the validation and test sets
+    if cfg.split_method == 'stratified':
+        vec_idx_absolute_valid_test = np.setdiff1d(np.arange(y.shape[0]), vec_idx_absolute_train)
+        vec_idx_absolute_valid, vec_idx_absolute_test = _stratified_partition(vec_idx_absolute_valid_test, y,
+                                                                              [cfg.per_valid, cfg.per_test])
+
+        return [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+
     # TODO: right now just concatenate everything left and then split... might be a better way out there
     n_iter = 0
     while True:
@@ -407,27 +506,20 @@ def _split_data(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg):
             vec_idx_class2_valid_test = vec_idx_class2[cfg.train_split[2]:]
             vec_idx_absolute_valid_test = np.concatenate((vec_idx_class0_valid_test, vec_idx_class1_valid_test,
                                                           vec_idx_class2_valid_test), axis=0)
-            y_valid_test = np.concatenate((y[vec_idx_class0_valid_test], y[vec_idx_class1_valid_test],
-                                           y[vec_idx_class2_valid_test]), axis=0)
-
         else:
             vec_idx_absolute_valid_test = np.concatenate((vec_idx_class0_valid_test, vec_idx_class1_valid_test), axis=0)
-            y_valid_test = np.concatenate((y[vec_idx_class0_valid_test], y[vec_idx_class1_valid_test]), axis=0)
 
         # get a permutation and start permutating
-        vec_idx_valid_test_permutation = np.random.permutation(y_valid_test.shape[0])
+        vec_idx_valid_test_permutation = np.random.permutation(vec_idx_absolute_valid_test.shape[0])
         vec_idx_absolute_valid_test = vec_idx_absolute_valid_test[vec_idx_valid_test_permutation]
-        y_valid_test = y_valid_test[vec_idx_valid_test_permutation]
 
         # now split into validation and test
         vec_idx_absolute_valid = vec_idx_absolute_valid_test[:n_valid]
-        y_valid = y_valid_test[:n_valid]
-
         vec_idx_absolute_test = vec_idx_absolute_valid_test[n_valid:]
-        y_test = y_valid_test[n_valid:]
 
         # if there are all three labels in both sets we are done
-        if len(np.unique(y_valid)) == cfg.num_classes and len(np.unique(y_test)) == cfg.num_classes:
+        if len(np.unique(y[vec_idx_absolute_valid])) == cfg.num_classes and \
+                len(np.unique(y[vec_idx_absolute_test])) == cfg.num_classes:
             break
 
         # else count how many times have we tried and break if failed attempt
@@ -435,154 +527,161 @@ def _split_data(x_angiography, x_structure, x_bscan, x_bscan3d, y, cfg):
         if n_iter > 200:
             raise Exception("No valid splitting possible, check dataset and configuration")
 
-    x_angiography_valid = x_angiography[vec_idx_absolute_valid, :, :, :, :]
-    x_structure_valid = x_structure[vec_idx_absolute_valid, :, :, :, :]
-    x_bscan_valid = x_bscan[vec_idx_absolute_valid, :, :, :]
-    x_bscan3d_valid = x_bscan3d[vec_idx_absolute_valid, :, :, :, :]
+    return [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+
+
+def _split_idx_stratified(y, cfg):
+    """
+    Stratified splitting into training, validation and test sets in a single pass, where every class is distributed
+    over the three sets in proportion to cfg.per_train, cfg.per_valid and cfg.per_test and is guaranteed to appear in
+    all of them
+
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
 
-    y_valid_alt = y[vec_idx_absolute_valid]
-    if not np.allclose(y_valid, y_valid_alt):
-        raise Exception("Indexing mismatch")
+    :return: a list in the form [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+    """
+    return _stratified_partition(np.arange(y.shape[0]), y, [cfg.per_train, cfg.per_valid, cfg.per_test])
 
-    x_angiography_test = x_angiography[vec_idx_absolute_test, :, :, :, :]
-    x_structure_test = x_structure[vec_idx_absolute_test, :, :, :, :]
-    x_bscan_test = x_bscan[vec_idx_absolute_test, :, :, :]
-    x_bscan3d_test = x_bscan3d[vec_idx_absolute_test, :, :, :, :]
 
-    y_test_alt = y[vec_idx_absolute_test]
-    if not np.allclose(y_test, y_test_alt):
-        raise Exception("Indexing mismatch")
+def _split_idx_stratified_cv(y, cfg):
+    """
+    Stratified splitting into cross validation folds in a single pass. Each class is dealt out over the test sets of
+    the folds in turn and the remaining samples of each fold are split into training and validation sets in a
+    stratified manner, so that all classes are present in all three sets of every fold
 
-    cfg.vec_idx_absolute = [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+    :param y: numpy array in the form (n_sample)
+    :param cfg: object holding all the training parameters
 
-    # convert the labels to onehot encoding
-    if not cfg.binary_class:
-        y_train = to_categorical(y_train, num_classes=cfg.num_classes)
-        y_valid = to_categorical(y_valid, num_classes=cfg.num_classes)
-        y_test = to_categorical(y_test, num_classes=cfg.num_classes)
+    :return: list holding [idx_train, idx_valid, idx_test] for each fold
+    """
+    idx_orig = np.arange(0, y.shape[0], 1)
 
-    x_train = [x_angiography_train, x_structure_train, x_bscan_train, x_bscan3d_train]
-    x_valid = [x_angiography_valid, x_structure_valid, x_bscan_valid, x_bscan3d_valid]
-    x_test = [x_angiography_test, x_structure_test, x_bscan_test, x_bscan3d_test]
+    # order the samples by class after shuffling and deal them out over the folds
+    idx_permutation = np.random.permutation(y.shape[0])
+    idx_class_sorted = idx_permutation[np.argsort(y[idx_permutation], kind='stable')]
+    for y_unique in np.unique(y):
+        if np.sum(y == y_unique) < cfg.num_cv_fold:
+            raise Exception("Not enough samples of class {} for {} folds".format(y_unique, cfg.num_cv_fold))
 
-    cfg.sample_size = [x_angiography_train.shape[1:], x_bscan_train.shape[1:]]
+    vec_idx_test = [np.sort(idx_class_sorted[i::cfg.num_cv_fold]) for i in range(cfg.num_cv_fold)]
 
-    return [x_train, x_valid, x_test], [y_train, y_valid, y_test]
+    vec_idx_absolute = []
+    for i in range(cfg.num_cv_fold):
+        idx_test_curr = np.random.permutation(vec_idx_test[i])
 
+        idx_train_valid = np.setdiff1d(idx_orig, idx_test_curr)
+        idx_train_curr, idx_valid_curr = _stratified_partition(idx_train_valid, y, [cfg.per_train, cfg.per_valid])
 
-def _split_x_set(x, n_train, n_valid):
-    if len(x.shape) == 5:
-        x_train = x[: n_train, :, :, :, :]
-        x_valid = x[n_train: n_train + n_valid, :, :, :, :]
-        x_test = x[n_train + n_valid:, :, :, :, :]
-    else:
-        x_train = x[: n_train, :, :, :]
-        x_valid = x[n_train: n_train + n_valid, :, :, :]
-        x_test = x[n_train + n_valid:, :, :, :]
+        vec_idx_absolute.append([idx_train_curr, idx_valid_curr, idx_test_curr])
 
-    return x_train, x_valid, x_test
+    return vec_idx_absolute
 
 
-def data_loading(vec_idx_patient, cfg):
-    if cfg.load_mode == 'folder':
+def _stratified_partition(vec_idx, y, vec_per):
+    """
+    Randomly partitions the given samples into len(vec_per) sets such that each class is divided in proportion to
+    vec_per, while making sure that every set receives at least one sample of every class
+
+    :param vec_idx: numpy array holding the absolute indices of the samples to be partitioned
+    :param y: numpy array in the form (n_sample) holding the labels of all samples
+    :param vec_per: list of the fractions of samples in each set, e.g. [0.6, 0.2, 0.2]
+
+    :return: list holding the absolute indices of each set, shuffled
+    """
+    vec_per = np.asarray(vec_per, dtype=np.float64) / np.sum(vec_per)
+    vec_vec_idx_set = [[] for _ in vec_per]
+
+    for y_unique in np.unique(y[vec_idx]):
+        vec_idx_class = vec_idx[y[vec_idx] == y_unique]
+        vec_idx_class = vec_idx_class[np.random.permutation(vec_idx_class.shape[0])]
+        if vec_idx_class.shape[0] < len(vec_per):
+            raise Exception("Not enough samples of class {} for a stratified split".format(y_unique))
+
+        # largest remainder rounding of the proportional counts
+        vec_n_exact = vec_idx_class.shape[0] * vec_per
+        vec_n = np.floor(vec_n_exact).astype(int)
+        vec_idx_remainder = np.argsort(-(vec_n_exact - vec_n), kind='stable')
+        vec_n[vec_idx_remainder[:vec_idx_class.shape[0] - np.sum(vec_n)]] += 1
+
+        # make sure all sets hold the class by moving samples over from the largest set
+        for idx_set in np.where(vec_n == 0)[0]:
+            vec_n[np.argmax(vec_n)] -= 1
+            vec_n[idx_set] += 1
+
+        vec_idx_split = np.split(vec_idx_class, np.cumsum(vec_n)[:-1])
+        for idx_set in range(len(vec_per)):
+            vec_vec_idx_set[idx_set].append(vec_idx_split[idx_set])
+
+    vec_idx_set_all = []
+    for vec_idx_set in vec_vec_idx_set:
+        vec_idx_set = np.concatenate(vec_idx_set, axis=0)
+        vec_idx_set_all.append(vec_idx_set[np.random.permutation(vec_idx_set.shape[0])])
+
+    return vec_idx_set_all
+
+
+def _gather_split(X, y, vec_idx_absolute, cfg, bool_view=False):
+    """
+    Gathers the training, validation and test sets from the full arrays, which is the only point where the image
+    tensors are copied
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    :param y: numpy array in the form (n_sample)
+    :param vec_idx_absolute: list in the form [vec_idx_absolute_train, vec_idx_absolute_valid, vec_idx_absolute_test]
+    :param cfg: object holding all the training parameters
+    :param bool_view: whether to return views that gather the images on demand instead of copies
+
+    :return: a tuple Xs, ys holding the train, validation and test sets
+    """
+    Xs = []
+    ys = []
+    for vec_idx_absolute_curr in vec_idx_absolute:
+        if bool_view:
+            Xs.append([IndexedView(x, vec_idx_absolute_curr) for x in X])
+        else:
+            Xs.append([x[vec_idx_absolute_curr, ...] for x in X])
+
+        # convert the labels to onehot encoding if multi-class
+        y_curr = y[vec_idx_absolute_curr]
         if not cfg.binary_class:
-            print('\nLoading data from normal patients')
-            x_healthy, y_healthy, vec_str_healthy_patient = load_specific_label_folder(vec_idx_patient, cfg.str_healthy,
-                                                                                       cfg.label_healthy, cfg)
-            print('Total number of healthy patients: {}\n'.format(x_healthy[0].shape[0]))
+            y_curr = to_categorical(y_curr, num_classes=cfg.num_classes)
+        ys.append(y_curr)
 
-            print('\nLoading data from dry AMD patients')
-            x_dry_amd, y_dry_amd, vec_str_dry_amd_patient = load_specific_label_folder(vec_idx_patient, cfg.str_dry_amd,
-                                                                                       cfg.label_dry_amd, cfg)
-            print('Total number of dry AMD patients: {}\n'.format(x_dry_amd[0].shape[0]))
+    return Xs, ys
 
-            print('\nLoading data from CNV patients')
-            x_cnv, y_cnv, vec_str_cnv_patient = load_specific_label_folder(vec_idx_patient, cfg.str_cnv, cfg.label_cnv,
-                                                                           cfg)
-            print('Total number of CNV patients: {}\n'.format(x_cnv[0].shape[0]))
 
-            cfg.n_dry_amd = x_dry_amd[0].shape[0]
-            cfg.n_cnv = x_cnv[0].shape[0]
-            cfg.n_healthy = x_healthy[0].shape[0]
+def data_loading(vec_idx_patient, cfg):
+    if cfg.load_mode == 'folder':
+        if not cfg.binary_class:
+            vec_str_class = [cfg.str_healthy, cfg.str_dry_amd, cfg.str_cnv]
+            vec_label_class = [cfg.label_healthy, cfg.label_dry_amd, cfg.label_cnv]
 
-            # unpack once more
-            x_angiography = np.concatenate((x_healthy[0], x_dry_amd[0], x_cnv[0]), axis=0)
-            x_structure = np.concatenate((x_healthy[1], x_dry_amd[1], x_cnv[1]), axis=0)
-            x_bscan = np.concatenate((x_healthy[2], x_dry_amd[2], x_cnv[2]), axis=0)
-            x_bscan3d = np.concatenate((x_healthy[3], x_dry_amd[3], x_cnv[3]), axis=0)
+        elif cfg.binary_mode == 0:
+            vec_str_class = [cfg.str_healthy, cfg.str_dry_amd]
+            vec_label_class = [cfg.label_healthy, cfg.label_dry_amd]
 
-            y = np.concatenate((y_healthy, y_dry_amd, y_cnv), axis=0)
+        elif cfg.binary_mode == 1:
+            vec_str_class = [cfg.str_healthy, cfg.str_cnv]
+            vec_label_class = [cfg.label_healthy, cfg.label_cnv]
 
-            cfg.vec_str_patient = np.concatenate(
-                (vec_str_healthy_patient, vec_str_dry_amd_patient, vec_str_cnv_patient), axis=0)
+        elif cfg.binary_mode == 2:
+            vec_str_class = [cfg.str_dry_amd, cfg.str_cnv]
+            vec_label_class = [cfg.label_dry_amd, cfg.label_cnv]
 
         else:
-            # TODO: code below is ugly...
-            if cfg.binary_mode == 0:
-                print('\nLoading data from normal patients')
-                x_healthy, y_healthy, vec_str_healthy_patient = load_specific_label_folder(vec_idx_patient,
-                                                                                           cfg.str_healthy,
-                                                                                           cfg.label_healthy, cfg)
-                print('Total number of healthy patients: {}\n'.format(x_healthy[0].shape[0]))
-
-                print('\nLoading data from dry AMD patients')
-                x_dry_amd, y_dry_amd, vec_str_dry_amd_patient = load_specific_label_folder(vec_idx_patient,
-                                                                                           cfg.str_dry_amd,
-                                                                                           cfg.label_dry_amd, cfg)
-                print('Total number of dry AMD patients: {}\n'.format(x_dry_amd[0].shape[0]))
-
-                x_angiography = np.concatenate((x_healthy[0], x_dry_amd[0]), axis=0)
-                x_structure = np.concatenate((x_healthy[1], x_dry_amd[1]), axis=0)
-                x_bscan = np.concatenate((x_healthy[2], x_dry_amd[2]), axis=0)
-                x_bscan3d = np.concatenate((x_healthy[3], x_dry_amd[3]), axis=0)
-                y = np.concatenate((y_healthy, y_dry_amd), axis=0)
-
-                cfg.vec_str_patient = np.concatenate((vec_str_healthy_patient, vec_str_dry_amd_patient), axis=0)
-
-            elif cfg.binary_mode == 1:
-                print('\nLoading data from normal patients')
-                x_healthy, y_healthy, vec_str_healthy_patient = load_specific_label_folder(vec_idx_patient,
-                                                                                           cfg.str_healthy,
-                                                                                           cfg.label_healthy, cfg)
-                print('Total number of healthy patients: {}\n'.format(x_healthy[0].shape[0]))
-
-                print('\nLoading data from CNV patients')
-                x_cnv, y_cnv, vec_str_cnv_patient = load_specific_label_folder(vec_idx_patient, cfg.str_cnv,
-                                                                               cfg.label_cnv, cfg)
-                print('Total number of CNV patients: {}\n'.format(x_cnv[0].shape[0]))
-
-                x_angiography = np.concatenate((x_healthy[0], x_cnv[0]), axis=0)
-                x_structure = np.concatenate((x_healthy[1], x_cnv[1]), axis=0)
-                x_bscan = np.concatenate((x_healthy[2], x_cnv[2]), axis=0)
-                x_bscan3d = np.concatenate((x_healthy[3], x_cnv[3]), axis=0)
-                y = np.concatenate((y_healthy, y_cnv), axis=0)
-
-                cfg.vec_str_patient = np.concatenate((vec_str_healthy_patient, vec_str_cnv_patient), axis=0)
-
-            elif cfg.binary_mode == 2:
-                print('\nLoading data from dry AMD patients')
-                x_dry_amd, y_dry_amd, vec_str_dry_amd_patient = load_specific_label_folder(vec_idx_patient,
-                                                                                           cfg.str_dry_amd,
-                                                                                           cfg.label_dry_amd, cfg)
-                print('Total number of dry AMD patients: {}\n'.format(x_dry_amd[0].shape[0]))
-
-                print('\nLoading data from CNV patients')
-                x_cnv, y_cnv, vec_str_cnv_patient = load_specific_label_folder(vec_idx_patient, cfg.str_cnv,
-                                                                               cfg.label_cnv, cfg)
-                print('Total number of CNV patients: {}\n'.format(x_cnv[0].shape[0]))
-
-                x_angiography = np.concatenate((x_dry_amd[0], x_cnv[0]), axis=0)
-                x_structure = np.concatenate((x_dry_amd[1], x_cnv[1]), axis=0)
-                x_bscan = np.concatenate((x_dry_amd[2], x_cnv[2]), axis=0)
-                x_bscan3d = np.concatenate((x_dry_amd[3], x_cnv[3]), axis=0)
-                y = np.concatenate((y_dry_amd, y_cnv), axis=0)
-
-                cfg.vec_str_patient = np.concatenate((vec_str_dry_amd_patient, vec_str_cnv_patient), axis=0)
+            raise Exception('Undefined mode for binary classification')
 
-            else:
-                raise Exception('Undefined mode for binary classification')
+        # all classes are written into a single set of arrays so that they never have to be concatenated
+        X, y, vec_str_patient, vec_n_class = load_label_folder(vec_idx_patient, vec_str_class, vec_label_class, cfg)
+        for str_class, n_class in zip(vec_str_class, vec_n_class):
+            print('Total number of {} patients: {}'.format(str_class, n_class))
 
-        X = [x_angiography, x_structure, x_bscan, x_bscan3d]
+        if not cfg.binary_class:
+            cfg.n_healthy, cfg.n_dry_amd, cfg.n_cnv = vec_n_class
+
+        y = np.asarray(y)
+        cfg.vec_str_patient = np.asarray(vec_str_patient)
 
     elif cfg.load_mode == 'csv':
         if cfg.d_csv is None or cfg.f_csv is None:
@@ -597,35 +696,149 @@ def data_loading(vec_idx_patient, cfg):
 
         cfg.vec_str_patients = vec_str_patients
         cfg.vec_out_csv_idx = vec_out_csv_idx
-        cfg.y_unique_label = np.unique(y)
+        y = _get_csv_labels(y, cfg)
+
+    elif cfg.load_mode == 'store':
+        p_store = get_dataset_store_path(vec_idx_patient, cfg)
+        if not dataset_store_exists(p_store):
+            print('\nDataset store not available, compiling it first')
+            compile_dataset(vec_idx_patient, cfg)
+
+        print('\nOpening dataset store {}'.format(p_store))
+        X, y = open_dataset_store(p_store, cfg)
+
+    else:
+        raise Exception('Undefined load mode')
+
+    # keep the image cache within its size limit
+    if cfg.d_cache is not None:
+        evict_image_cache(cfg.d_cache, cfg.cache_size_limit)
+
+    return X, y
+
+
+def _get_csv_labels(y, cfg):
+    """
+    Checks the labels loaded in csv mode and converts features with only two labels into binary classification
+
+    :param y: numpy array of integer labels of the current feature
+    :param cfg: configuration file set by the user
+    :return: numpy array of labels in the range [0, cfg.num_classes)
+    """
+    cfg.y_unique_label = np.unique(y)
 
-        # check if there are only two labels present, which is the case for many features
-        if len(np.unique(y)) == 2 and cfg.str_feature != 'disease':
-            cfg.num_classes = 2
-            cfg.binary_class = True
+    # check if there are only two labels present, which is the case for many features
+    if len(np.unique(y)) == 2 and cfg.str_feature != 'disease':
+        cfg.num_classes = 2
+        cfg.binary_class = True
 
-            vec_str_labels_temp = []
+        vec_str_labels_temp = []
+        for i in range(cfg.num_classes):
+            vec_str_labels_temp.append(cfg.vec_str_labels[np.unique(y)[i]])
+        cfg.vec_str_labels = vec_str_labels_temp
+
+        # correct for labels where there are skips
+        y_temp = y.copy()
+        if not np.all(np.unique(y) == np.arange(0, cfg.num_classes)):
             for i in range(cfg.num_classes):
-                vec_str_labels_temp.append(cfg.vec_str_labels[np.unique(y)[i]])
-            cfg.vec_str_labels = vec_str_labels_temp
+                y_temp[y_temp == np.unique(y)[i]] = np.arange(0, cfg.num_classes)[i]
+        y = y_temp
 
-            # correct for labels where there are skips
-            y_temp = y.copy()
-            if not np.all(np.unique(y) == np.arange(0, cfg.num_classes)):
-                for i in range(cfg.num_classes):
-                    y_temp[y_temp == np.unique(y)[i]] = np.arange(0, cfg.num_classes)[i]
-            y = y_temp
+    elif len(np.unique(y)) == 2 and cfg.str_feature == 'disease':
+        raise Exception('There should be three disease labels')
 
-        elif len(np.unique(y)) == 2 and cfg.str_feature == 'disease':
-            raise Exception('There should be three disease labels')
+    elif len(np.unique(y)) == 4:
+        raise Exception('Too many labels')
 
-        elif len(np.unique(y)) == 4:
-            raise Exception('Too many labels')
+    return y
 
-    else:
-        raise Exception('Undefined load mode')
 
-    return X, y
+def data_loading_all_features(vec_idx_patient, cfg):
+    """
+    Loads the images of all patients once in csv mode together with the labels of every feature in
+    cfg.vec_all_str_feature, so that the data of any feature can then be obtained with select_feature without loading
+    the images again
+
+    :param vec_idx_patient: list in the form of [start_idx, end_idx]
+    :param cfg: configuration file set by the user
+    :return: a tuple X, mat_y, where mat_y has the shape (n_sample, n_feature) and holds NaN for invalid labels
+    """
+    if cfg.load_mode != 'csv':
+        raise Exception('Loading all features is only possible in csv load mode')
+    if cfg.d_csv is None or cfg.f_csv is None:
+        raise Exception('Need to provide path of csv file if using csv load mode')
+
+    vec_str_patient_id, mat_OD_feature, mat_OS_feature = load_csv_params_all(cfg)
+
+    X, mat_y, vec_str_patients, vec_out_csv_idx = load_all_data_csv(vec_idx_patient, vec_str_patient_id,
+                                                                     mat_OD_feature, mat_OS_feature, cfg)
+
+    # keep the fields that select_feature modifies so that features can be selected in any order
+    cfg.vec_str_patients_all = vec_str_patients
+    cfg.vec_out_csv_idx_all = vec_out_csv_idx
+    cfg.dict_cfg_all = {'num_classes': cfg.num_classes, 'binary_class': cfg.binary_class,
+                        'vec_str_labels': list(cfg.vec_str_labels), 'vec_csv_col': list(cfg.vec_csv_col)}
+
+    return X, mat_y
+
+
+def select_feature(X, mat_y, str_feature, cfg):
+    """
+    Obtains the samples with a valid label for a single feature from the output of data_loading_all_features and sets
+    up cfg in the same way data_loading would for that feature
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d] holding all samples
+    :param mat_y: numpy array of labels in the form (n_sample, n_feature)
+    :param str_feature: name of the feature, e.g. 'GA'
+    :param cfg: configuration file set by the user
+    :return: a tuple X, y, where each input tensor is a view that only holds the samples with a valid label
+    """
+    if str_feature not in cfg.vec_all_str_feature:
+        raise Exception('Invalid feature label provided')
+
+    for str_field, value in cfg.dict_cfg_all.items():
+        cfg[str_field] = list(value) if isinstance(value, list) else value
+    cfg.str_feature = str_feature
+    load_csv_params(cfg, pd_csv=cfg.pd_csv_all.copy())
+
+    y_feature = mat_y[:, cfg.vec_all_str_feature.index(str_feature)]
+    vec_idx_valid = np.where(np.logical_not(np.isnan(y_feature)))[0]
+
+    # remap the csv entries from the disease columns to the columns of the selected feature
+    vec_out_csv_idx = np.asarray(cfg.vec_out_csv_idx_all, dtype=int).reshape(-1, 2)[vec_idx_valid, :]
+    vec_out_csv_idx[:, 1] = np.where(vec_out_csv_idx[:, 1] == cfg.dict_cfg_all['vec_csv_col'][-2],
+                                     cfg.vec_csv_col[-2], cfg.vec_csv_col[-1])
+    cfg.vec_str_patients = [cfg.vec_str_patients_all[i] for i in vec_idx_valid]
+    cfg.vec_out_csv_idx = vec_out_csv_idx.tolist()
+
+    y = _get_csv_labels(y_feature[vec_idx_valid].astype(int), cfg)
+
+    return [IndexedView(x, vec_idx_valid) for x in X], y
+
+
+def compile_dataset(vec_idx_patient, cfg):
+    """
+    Loads all data using the underlying load mode cfg.store_load_mode and writes the result into the dataset store, so
+    that subsequent runs with cfg.load_mode = 'store' can memory map the arrays instead of loading the images again
+
+    :param vec_idx_patient: list in the form of [start_idx, end_idx]
+    :param cfg: configuration file set by the user
+    :return: absolute path to the directory of the dataset store
+    """
+    # the key has to be obtained before loading since csv mode modifies the configuration
+    p_store = get_dataset_store_path(vec_idx_patient, cfg)
+
+    load_mode = cfg.load_mode
+    cfg.load_mode = cfg.store_load_mode
+    try:
+        X, y = data_loading(vec_idx_patient, cfg)
+    finally:
+        cfg.load_mode = load_mode
+
+    print('\nWriting dataset store {}'.format(p_store))
+    save_dataset_store(p_store, X, y, cfg)
+
+    return p_store
 
 
 def load_all_data_csv(vec_idx, vec_str_patient_id, vec_OD_feature, vec_OS_feature, cfg):
@@ -644,7 +857,12 @@ def load_all_data_csv(vec_idx, vec_str_patient_id, vec_OD_feature, vec_OS_featur
                                                                  cfg.vec_str_layer, cfg.vec_str_layer_bscan3d, 
                                                                  cfg.str_bscan_layer, cfg.dict_layer_order, 
                                                                  cfg.dict_layer_order_bscan3d, 
-                                                                 cfg.vec_csv_col)
+                                                                 cfg.vec_csv_col, n_workers=cfg.n_load_workers,
+                                                                 d_cache=cfg.d_cache,
+                                                                 manifest=_get_manifest(cfg, vec_idx),
+                                                                 storage_dtype=cfg.storage_dtype,
+                                                                 d_patient_store=cfg.d_patient_store,
+                                                                 image_backend=cfg.image_backend)
 
     return x, y, vec_str_patients, vec_out_csv_idx
 
@@ -652,15 +870,18 @@ def load_all_data_csv(vec_idx, vec_str_patient_id, vec_OD_feature, vec_OS_featur
 def _load_all_data_csv(vec_idx, vec_str_patient_id, vec_OD_feature, vec_OS_feature,
                        d_data, downscale_size, crop_size, num_octa, str_angiography, str_structure,
                        str_bscan, vec_str_layer, vec_str_layer_bscan3d,
-                       str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d, vec_csv_col):
+                       str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d, vec_csv_col, n_workers=None,
+                       d_cache=None, manifest=None, storage_dtype=None,
+                       d_patient_store=None, image_backend=None):
 
     """
     Load all data from all patients without assigning the class label yet
 
     :param vec_idx: list in the form of [start_idx, end_idx]
-    :param vec_str_patient_id:
-    :param vec_OD_feature:
-    :param vec_OS_feature:
+    :param vec_str_patient_id: numpy array of the patient id in each row of the csv file
+    :param vec_OD_feature: OD labels in each row of the csv file, either (n_row) for a single feature or
+    (n_row, n_feature) for all features, in which case invalid labels are kept as NaN
+    :param vec_OS_feature: OS labels in each row of the csv file, same form as vec_OD_feature
     :param pathlib.Path d_data: directory to the data
     :param list downscale_size: desired shape after downscaling the images, e.g. [350, 350]
     :param list crop_size: desired number of pixels to exclude from analysis for bscan images, e.g. [50, 60]
@@ -674,38 +895,37 @@ def _load_all_data_csv(vec_idx, vec_str_patient_id, vec_OD_feature, vec_OS_featu
     :param dict_layer_order: dictionary that contains the order in which the different layers will be organized
     :param dict_layer_order_bscan3d: dictionary that contains the order in which the bscans cubes will be organized
     :param vec_csv_col: list of all the indices of relevant columns in the original csv file
+    :param n_workers: number of worker processes used for decoding the images, serial loading if None or 1
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :param manifest: dictionary holding the manifest of the data directory, glob is used if None
+    :param storage_dtype: dtype in which the cubes are kept, e.g. 'uint8', float64 if None
+    :param d_patient_store: directory holding the per-patient store for incremental loading, no store if None
+    :param image_backend: backend used for decoding and resizing the images, see _load_image_stack
 
     :return: a tuple in the form [x_angiography, x_structure, x_bscan], vec_str_patient, where each of x_class
     contains images from a single type of image and vec_str_patient would correspond to absolute
     """
-    # create the empty lists for holding the variables
-    x_angiography = []
-    x_structure = []
-    x_bscan = []
-    x_bscan3d = []
-
-    y = []
-
     # create a list to append all patients
     vec_str_patient = []
 
     # create a list of all possible indices
     vec_full_idx = np.arange(vec_idx[0], vec_idx[1] + 1, 1)
 
-    # create a list of all valid entries in the csv file
-    vec_out_csv_idx = []
+    # columns of the csv file holding the labels of each eye
     idx_col_OD_feature = vec_csv_col[-2]
     idx_col_OS_feature = vec_csv_col[-1]
 
-    # Loop through all the patients
+    # Loop through all the patients and locate the images first
+    vec_idx_valid, vec_d_patient_valid, vec_f_image_all, vec_f_imageBscan3d_all = [], [], [], []
+    vec_d_patient = [d_data / '{}'.format(idx_patient) for idx_patient in vec_full_idx]
+    vec_d_patient_fallback = [d_data / '{}'.format(idx_patient) for idx_patient in vec_full_idx]
+    if manifest is not None:
+        check_manifest(manifest, vec_d_patient, vec_d_patient_fallback, str_angiography, str_structure, str_bscan,
+                       vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer, dict_layer_order_bscan3d)
+
     for i in range(len(vec_full_idx)):
-        vec_f_image = glob.glob(str(d_data / '{}'.format(vec_full_idx[i]) / '*' / 'OCTA' / '*.bmp'), recursive=True)
-        vec_f_imageBscan3d = glob.glob(str(d_data / '{}'.format(vec_full_idx[i]) / '*' / '*.tiff'), recursive=True)
+        vec_f_image, vec_f_imageBscan3d = _find_patient_files(vec_d_patient[i], vec_d_patient_fallback[i], manifest)
 
-        # try old pattern again also
-        if not vec_f_image:
-            vec_f_image = glob.glob(str(d_data / '{}'.format(vec_full_idx[i]) / '*' / '2D Layers' / '*.bmp'),
-                                    recursive=True)
         if vec_f_image:
             print("Loading data from patient {}".format(vec_full_idx[i]))
         else:
@@ -719,107 +939,149 @@ def _load_all_data_csv(vec_idx, vec_str_patient_id, vec_OD_feature, vec_OS_featu
             print("Data (bscan3d) not available for patient {}, skipping...".format(vec_full_idx[i]))
             continue
 
-        packed_x_curr, str_eye = _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, num_octa,
-                                               str_angiography, str_structure, str_bscan,
-                                               vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer,
-                                               dict_layer_order, dict_layer_order_bscan3d)
-
+        vec_idx_valid.append(vec_full_idx[i])
+        vec_d_patient_valid.append(vec_d_patient[i])
+        vec_f_image_all.append(vec_f_image)
+        vec_f_imageBscan3d_all.append(vec_f_imageBscan3d)
+
+    # now decode the images from all patients, possibly in parallel
+    package_data = functools.partial(_package_data, downscale_size=downscale_size, crop_size=crop_size,
+                                     num_octa=num_octa, str_angiography=str_angiography,
+                                     str_structure=str_structure, str_bscan=str_bscan, vec_str_layer=vec_str_layer,
+                                     vec_str_layer_bscan3d=vec_str_layer_bscan3d, str_bscan_layer=str_bscan_layer,
+                                     dict_layer_order=dict_layer_order,
+                                     dict_layer_order_bscan3d=dict_layer_order_bscan3d, d_cache=d_cache,
+                                     storage_dtype=storage_dtype, image_backend=image_backend)
+    vec_packed = _map_patients(package_data, vec_f_image_all, vec_f_imageBscan3d_all, n_workers,
+                               vec_d_patient_valid, d_patient_store)
+
+    # preallocate the output for the largest possible number of eyes and write the cubes of each patient into it
+    n_sample_max = sum(_get_n_eye_max(vec_f_image) for vec_f_image in vec_f_image_all)
+    X = _allocate_cubes(n_sample_max, downscale_size, crop_size, num_octa, storage_dtype)
+    idx_sample = 0
+
+    # index the rows of the csv file by patient id once, keeping the first row of each patient
+    dict_patient_row = {}
+    for idx_row, str_patient_id in enumerate(vec_str_patient_id):
+        dict_patient_row.setdefault(str_patient_id, idx_row)
+
+    # csv row and eye of each loaded sample, used for assembling the labels at the end
+    vec_idx_row = []
+    vec_bool_OD = []
+
+    for idx_patient, (packed_x_curr, str_eye) in zip(vec_idx_valid, vec_packed):
         if packed_x_curr is None:
-            print("Unable to process data for patient {}, skipping...".format(vec_full_idx[i]))
+            print("Unable to process data for patient {}, skipping...".format(idx_patient))
             continue
 
         # test for the label independently as well
-        rel_idx_patient_id = np.where(vec_str_patient_id == vec_full_idx[i])[0][0]
+        if idx_patient not in dict_patient_row:
+            raise Exception('Patient {} not found in the csv file'.format(idx_patient))
+        rel_idx_patient_id = dict_patient_row[idx_patient]
 
         # now unpack the data
         if len(packed_x_curr) == 2:
-            for j in range(len(packed_x_curr)):
-                if str_eye[j] == 'OD':
-                    y_curr = vec_OD_feature[rel_idx_patient_id]
-                    vec_out_csv_idx.append([rel_idx_patient_id, idx_col_OD_feature])
-                elif str_eye[j] == 'OS':
-                    y_curr = vec_OS_feature[rel_idx_patient_id]
-                    vec_out_csv_idx.append([rel_idx_patient_id, idx_col_OS_feature])
-                else:
-                    raise Exception('Invalid eye label encountered')
+            vec_x_curr = packed_x_curr
+            vec_str_eye = str_eye
+        else:
+            vec_x_curr = [packed_x_curr]
+            vec_str_eye = [str_eye]
 
-                if np.isnan(y_curr):
-                    raise Exception("Label shouldn't be NaN")
+        for x_curr, str_eye_curr in zip(vec_x_curr, vec_str_eye):
+            if str_eye_curr not in ['OD', 'OS']:
+                raise Exception('Invalid eye label encountered')
 
-                x_angiography.append(packed_x_curr[j][0])
-                x_structure.append(packed_x_curr[j][1])
-                x_bscan.append(packed_x_curr[j][2])
-                x_bscan3d.append(packed_x_curr[j][3])
+            _write_cubes(X, idx_sample, x_curr)
+            idx_sample += 1
 
-                y.append(int(y_curr))
+            vec_idx_row.append(rel_idx_patient_id)
+            vec_bool_OD.append(str_eye_curr == 'OD')
 
-                # append to list of patients
-                str_patient = "Patient {}/{}".format(vec_full_idx[i], str_eye[j])
-                vec_str_patient.append(str_patient)
+            # append to list of patients
+            str_patient = "Patient {}/{}".format(idx_patient, str_eye_curr)
+            vec_str_patient.append(str_patient)
 
-        else:
-            if str_eye == 'OD':
-                y_curr = vec_OD_feature[rel_idx_patient_id]
-                vec_out_csv_idx.append([rel_idx_patient_id, idx_col_OD_feature])
-            elif str_eye == 'OS':
-                y_curr = vec_OS_feature[rel_idx_patient_id]
-                vec_out_csv_idx.append([rel_idx_patient_id, idx_col_OS_feature])
-            else:
-                raise Exception('Invalid eye label encountered')
+    # discard the rows reserved for eyes that could not be loaded
+    X = _trim_cubes(X, idx_sample)
 
-            if np.isnan(y_curr):
-                raise Exception("Label shouldn't be NaN")
+    # now gather the labels and the csv entries of all samples at once
+    vec_idx_row = np.asarray(vec_idx_row, dtype=int)
+    vec_bool_OD = np.asarray(vec_bool_OD, dtype=bool)
 
-            x_angiography.append(packed_x_curr[0])
-            x_structure.append(packed_x_curr[1])
-            x_bscan.append(packed_x_curr[2])
-            x_bscan3d.append(packed_x_curr[3])
+    vec_OD_feature = np.asarray(vec_OD_feature)
+    vec_OS_feature = np.asarray(vec_OS_feature)
+    if vec_OD_feature.ndim == 1:
+        y = np.where(vec_bool_OD, vec_OD_feature[vec_idx_row], vec_OS_feature[vec_idx_row])
+        if np.any(np.isnan(y.astype(np.float64))):
+            raise Exception("Label shouldn't be NaN")
+        y = y.astype(int)
 
-            y.append(int(y_curr))
+    else:
+        # labels of all features are kept together with the invalid ones marked as NaN
+        y = np.where(vec_bool_OD[:, None], vec_OD_feature[vec_idx_row, :], vec_OS_feature[vec_idx_row, :])
 
-            # append to list of patients
-            str_patient = "Patient {}/{}".format(vec_full_idx[i], str_eye)
-            vec_str_patient.append(str_patient)
+    vec_idx_col = np.where(vec_bool_OD, idx_col_OD_feature, idx_col_OS_feature)
+    vec_out_csv_idx = np.stack([vec_idx_row, vec_idx_col], axis=1).tolist()
 
-    x_angiography = np.stack(x_angiography, axis=0)
-    x_structure = np.stack(x_structure, axis=0)
-    x_bscan = np.stack(x_bscan, axis=0)
-    x_bscan3d = np.stack(x_bscan3d, axis=0)
+    return X, y, vec_str_patient, vec_out_csv_idx
 
-    y = np.stack(y, axis=0)
-    vec_out_csv_idx = vec_out_csv_idx
 
-    return [x_angiography, x_structure, x_bscan, x_bscan3d], y, vec_str_patient, vec_out_csv_idx
+def _get_manifest(cfg, vec_idx, vec_str_class=None):
+    """
+    Loads the manifest of the data directory if one is specified in the configuration, checking only the directories
+    of the patients that will be loaded
+
+    :param cfg: configuration file set by the user
+    :param vec_idx: list in the form of [start_idx, end_idx]
+    :param vec_str_class: list of the names of the classes in folder mode, None in csv mode
+    :return: dictionary holding the manifest, or None if glob should be used instead
+    """
+    if cfg.f_manifest is None:
+        return None
+
+    vec_str_patient = get_manifest_patients(vec_idx, vec_str_class)
 
+    return load_manifest(cfg.f_manifest, cfg.d_data, rebuild=cfg.rebuild_manifest, vec_str_patient=vec_str_patient,
+                         check_images=cfg.check_manifest_images)
 
-def load_specific_label_folder(vec_idx_class, str_class, label_class, cfg):
+
+def load_label_folder(vec_idx_class, vec_str_class, vec_label_class, cfg):
     """
-    Functional wrapper for loading a specific label using function below
+    Functional wrapper for loading the given labels using function below
 
     :param vec_idx_class: list in the form of [start_idx, end_idx]
-    :param str_class: name of this class, e.g. normalPatient
-    :param label_class: label assigned to this class, e.g. 0
+    :param vec_str_class: list of the names of the classes, e.g. [normalPatient, dryAMD]
+    :param vec_label_class: list of the labels assigned to the classes, e.g. [0, 1]
     :param cfg: configuration file set by the user
     :return:
     """
-    x_class, y_class, vec_str_class = _load_data_folder(vec_idx_class, str_class, label_class,
-                                                        cfg.d_data, cfg.downscale_size, cfg.crop_size, cfg.num_octa,
-                                                        cfg.str_angiography, cfg.str_structure, cfg.str_bscan,
-                                                        cfg.vec_str_layer, cfg.vec_str_layer_bscan3d, cfg.str_bscan_layer,
-                                                        cfg.dict_layer_order, cfg.dict_layer_order_bscan3d)
-
-    return x_class, y_class, vec_str_class
-
-
-def _load_data_folder(vec_idx, str_class, label_class, d_data, downscale_size, crop_size, num_octa,
+    X, y, vec_str_patient, vec_n_class = _load_data_folder(vec_idx_class, vec_str_class, vec_label_class,
+                                                           cfg.d_data, cfg.downscale_size, cfg.crop_size, cfg.num_octa,
+                                                           cfg.str_angiography, cfg.str_structure, cfg.str_bscan,
+                                                           cfg.vec_str_layer, cfg.vec_str_layer_bscan3d,
+                                                           cfg.str_bscan_layer, cfg.dict_layer_order,
+                                                           cfg.dict_layer_order_bscan3d,
+                                                           n_workers=cfg.n_load_workers, d_cache=cfg.d_cache,
+                                                           manifest=_get_manifest(cfg, vec_idx_class,
+                                                                                  vec_str_class),
+                                                           storage_dtype=cfg.storage_dtype,
+                                                           d_patient_store=cfg.d_patient_store,
+                                                           image_backend=cfg.image_backend)
+
+    return X, y, vec_str_patient, vec_n_class
+
+
+def _load_data_folder(vec_idx, vec_str_class, vec_label_class, d_data, downscale_size, crop_size, num_octa,
                       str_angiography, str_structure, str_bscan, vec_str_layer, vec_str_layer_bscan3d,
-                      str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d):
+                      str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d, n_workers=None, d_cache=None,
+                      manifest=None, storage_dtype=None, d_patient_store=None, image_backend=None):
     """
-    Load data of a specific class based on folder structure
+    Load data of the given classes based on folder structure. The images of all classes are located first so that the
+    samples of all classes can be written into a single set of preallocated arrays
 
     :param vec_idx: list in the form of [start_idx, end_idx]
-    :param str_class: name of this class, e.g. normalPatient
-    :param label_class: label assigned to this class, e.g. 0
+    :param vec_str_class: list of the names of the classes, e.g. [normalPatient, dryAMD]
+    :param vec_label_class: list of the labels assigned to the classes, e.g. [0, 1]
     :param pathlib.Path d_data: directory to the data
     :param list downscale_size: desired shape after downscaling the images, e.g. [350, 350]
     :param list crop_size: desired number of pixels to exclude from analysis for bscan images, e.g. [50, 60]
@@ -832,18 +1094,20 @@ def _load_data_folder(vec_idx, str_class, label_class, d_data, downscale_size, c
     :param str_bscan_layer: string that contains the type of b-scan images to be used in filename, e.g. Flow
     :param dict_layer_order: dictionary that contains the order in which the different layers will be organized
     :param dict_layer_order_bscan3d: dictionary that contains the order in which the bscans cubes will be organized
-
-    :return: a tuple in the form [x_angiography, x_structure, x_bscan], y, vec_str_patient, where each of x_class
-    contains images from a single type of image, y would correspond to label of all patients and vec_str_patient
-    would correspond to absolute
+    :param n_workers: number of worker processes used for decoding the images, serial loading if None or 1
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :param manifest: dictionary holding the manifest of the data directory, glob is used if None
+    :param storage_dtype: dtype in which the cubes are kept, e.g. 'uint8', float64 if None
+    :param d_patient_store: directory holding the per-patient store for incremental loading, no store if None
+    :param image_backend: backend used for decoding and resizing the images, see _load_image_stack
+
+    :return: a tuple in the form [x_angiography, x_structure, x_bscan, x_bscan3d], y, vec_str_patient, vec_n_class,
+    where each of x contains images from a single type of image with the samples ordered by class, y would correspond
+    to label of all patients, vec_str_patient would correspond to absolute and vec_n_class holds the number of samples
+    of each class
     """
 
     # create the empty lists for holding the variables
-    x_angiography = []
-    x_structure = []
-    x_bscan = []
-    x_bscan3d = []
-
     y = []
 
     # create a list to append all patients
@@ -852,77 +1116,262 @@ def _load_data_folder(vec_idx, str_class, label_class, d_data, downscale_size, c
     # create a list of all possible indices
     vec_full_idx = np.arange(vec_idx[0], vec_idx[1] + 1, 1)
 
-    # Loop through all the runs
-    for i in range(len(vec_full_idx)):
-        vec_f_image = glob.glob(str(d_data / str_class / '{}'.format(vec_full_idx[i]) / '*' / 'OCTA' / '*.bmp'),
-                                recursive=True)
-        vec_f_imageBscan3d = glob.glob(str(d_data / str_class / '{}'.format(vec_full_idx[i]) / '*' / '*.tiff'),
-                                       recursive=True)
+    # Loop through all the classes and runs and locate the images first
+    vec_idx_valid, vec_idx_class_valid, vec_d_patient_valid = [], [], []
+    vec_f_image_all, vec_f_imageBscan3d_all = [], []
+    for idx_class, str_class in enumerate(vec_str_class):
+        print('\nLocating data from {} patients'.format(str_class))
 
-        # try old pattern again also
-        if not vec_f_image:
-            vec_f_image = glob.glob(str(d_data / '{}'.format(vec_full_idx[i]) / '*' / '2D Layers' / '*.bmp'),
-                                    recursive=True)
+        vec_d_patient = [d_data / str_class / '{}'.format(idx_patient) for idx_patient in vec_full_idx]
+        vec_d_patient_fallback = [d_data / '{}'.format(idx_patient) for idx_patient in vec_full_idx]
+        if manifest is not None:
+            check_manifest(manifest, vec_d_patient, vec_d_patient_fallback, str_angiography, str_structure, str_bscan,
+                           vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer, dict_layer_order_bscan3d)
 
-        if vec_f_image:
-            print("Loading data from patient {}".format(vec_full_idx[i]))
-        else:
-            print("Data not available for patient {}, skipping...".format(vec_full_idx[i]))
-            continue
+        for i in range(len(vec_full_idx)):
+            vec_f_image, vec_f_imageBscan3d = _find_patient_files(vec_d_patient[i], vec_d_patient_fallback[i],
+                                                                  manifest)
 
-        if vec_f_imageBscan3d:
-            print("Loading 3d bscan data from patient {}".format(vec_full_idx[i]))
-        else:
-            print("Data (bscan3d) not available for patient {}, skipping...".format(vec_full_idx[i]))
-            continue
-
-        packed_x_curr, str_eye = _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, num_octa,
-                                               str_angiography, str_structure, str_bscan,
-                                               vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer,
-                                               dict_layer_order, dict_layer_order_bscan3d)
+            if vec_f_image:
+                print("Loading data from patient {}".format(vec_full_idx[i]))
+            else:
+                print("Data not available for patient {}, skipping...".format(vec_full_idx[i]))
+                continue
 
+            if vec_f_imageBscan3d:
+                print("Loading 3d bscan data from patient {}".format(vec_full_idx[i]))
+            else:
+                print("Data (bscan3d) not available for patient {}, skipping...".format(vec_full_idx[i]))
+                continue
+
+            vec_idx_valid.append(vec_full_idx[i])
+            vec_idx_class_valid.append(idx_class)
+            vec_d_patient_valid.append(vec_d_patient[i])
+            vec_f_image_all.append(vec_f_image)
+            vec_f_imageBscan3d_all.append(vec_f_imageBscan3d)
+
+    # now decode the images from all patients, possibly in parallel
+    package_data = functools.partial(_package_data, downscale_size=downscale_size, crop_size=crop_size,
+                                     num_octa=num_octa, str_angiography=str_angiography,
+                                     str_structure=str_structure, str_bscan=str_bscan, vec_str_layer=vec_str_layer,
+                                     vec_str_layer_bscan3d=vec_str_layer_bscan3d, str_bscan_layer=str_bscan_layer,
+                                     dict_layer_order=dict_layer_order,
+                                     dict_layer_order_bscan3d=dict_layer_order_bscan3d, d_cache=d_cache,
+                                     storage_dtype=storage_dtype, image_backend=image_backend)
+    vec_packed = _map_patients(package_data, vec_f_image_all, vec_f_imageBscan3d_all, n_workers,
+                               vec_d_patient_valid, d_patient_store)
+
+    # preallocate the output for the largest possible number of eyes and write the cubes of each patient into it
+    n_sample_max = sum(_get_n_eye_max(vec_f_image) for vec_f_image in vec_f_image_all)
+    X = _allocate_cubes(n_sample_max, downscale_size, crop_size, num_octa, storage_dtype)
+    idx_sample = 0
+    vec_n_class = [0] * len(vec_str_class)
+
+    for idx_patient, idx_class, (packed_x_curr, str_eye) in zip(vec_idx_valid, vec_idx_class_valid, vec_packed):
         if packed_x_curr is None:
-            raise Exception("Unable to process data for patient {}, skipping...".format(vec_full_idx[i]))
+            raise Exception("Unable to process data for patient {}, skipping...".format(idx_patient))
+
+        str_class = vec_str_class[idx_class]
 
         # now unpack the data
         if len(packed_x_curr) == 2:
             for j in range(len(packed_x_curr)):
-                x_angiography.append(packed_x_curr[j][0])
-                x_structure.append(packed_x_curr[j][1])
-                x_bscan.append(packed_x_curr[j][2])
-                x_bscan3d.append(packed_x_curr[j][3])
+                _write_cubes(X, idx_sample, packed_x_curr[j])
+                idx_sample += 1
+                vec_n_class[idx_class] += 1
 
                 # append the class label also
-                y.append(label_class)
+                y.append(vec_label_class[idx_class])
 
                 # append to list of patients
-                str_patient = "{}/Patient {}/{}".format(str_class, vec_full_idx[i], str_eye[j])
+                str_patient = "{}/Patient {}/{}".format(str_class, idx_patient, str_eye[j])
                 vec_str_patient.append(str_patient)
 
         else:
-            x_angiography.append(packed_x_curr[0])
-            x_structure.append(packed_x_curr[1])
-            x_bscan.append(packed_x_curr[2])
-            x_bscan3d.append(packed_x_curr[3])
+            _write_cubes(X, idx_sample, packed_x_curr)
+            idx_sample += 1
+            vec_n_class[idx_class] += 1
 
             # append the class label also
-            y.append(label_class)
+            y.append(vec_label_class[idx_class])
 
             # append to list of patients
-            str_patient = "{}/Patient {}/{}".format(str_class, vec_full_idx[i], str_eye)
+            str_patient = "{}/Patient {}/{}".format(str_class, idx_patient, str_eye)
             vec_str_patient.append(str_patient)
 
-    x_angiography = np.stack(x_angiography, axis=0)
-    x_structure = np.stack(x_structure, axis=0)
-    x_bscan = np.stack(x_bscan, axis=0)
-    x_bscan3d = np.stack(x_bscan3d, axis=0)
+    # discard the rows reserved for eyes that could not be loaded
+    X = _trim_cubes(X, idx_sample)
+
+    return X, y, vec_str_patient, vec_n_class
+
+
+def _find_patient_files(d_patient, d_patient_fallback, manifest=None):
+    """
+    Locates the 2D OCTA images and the 3D bscan images of a single patient, either with glob or from the manifest
+
+    :param pathlib.Path d_patient: directory of the patient, e.g. d_data/5 or d_data/Normal/5
+    :param pathlib.Path d_patient_fallback: directory of the patient in the old folder structure
+    :param manifest: dictionary holding the manifest, glob is used if None
+
+    :return: a tuple vec_f_image, vec_f_imageBscan3d holding the absolute paths to the images
+    """
+    if manifest is not None:
+        return get_manifest_patient_files(manifest, d_patient, d_patient_fallback)
+
+    vec_f_image = glob.glob(str(d_patient / '*' / 'OCTA' / '*.bmp'), recursive=True)
+    vec_f_imageBscan3d = glob.glob(str(d_patient / '*' / '*.tiff'), recursive=True)
+
+    # try old pattern again also
+    if not vec_f_image:
+        vec_f_image = glob.glob(str(d_patient_fallback / '*' / '2D Layers' / '*.bmp'), recursive=True)
+
+    return vec_f_image, vec_f_imageBscan3d
+
+
+def _map_patients(func, vec_f_image_all, vec_f_imageBscan3d_all, n_workers=None, vec_d_patient=None,
+                  d_patient_store=None):
+    """
+    Applies func to the image paths of each patient, either serially or distributed over a pool of worker processes.
+    The outputs are returned in the same order as the patients regardless of the number of workers. If a per-patient
+    store is given, func is only applied to the patients that are new or whose images changed since the store was
+    written, and the outputs of all other patients are read from the store
+
+    :param func: partial of _package_data that takes the list of image paths and the list of bscan paths of a patient
+    :param vec_f_image_all: list holding the lists of absolute paths to the individual images of each patient
+    :param vec_f_imageBscan3d_all: list holding the lists of absolute paths to the bscan images of each patient
+    :param n_workers: number of worker processes, serial processing if None or 1
+    :param vec_d_patient: list of the directories of each patient, only needed with the per-patient store
+    :param d_patient_store: directory holding the per-patient store, no store if None
+
+    :return: generator yielding the output of func for each patient, so that the outputs can be consumed one at a time
+    """
+    if d_patient_store is not None:
+        yield from _map_patients_stored(func, vec_f_image_all, vec_f_imageBscan3d_all, n_workers, vec_d_patient,
+                                        d_patient_store)
+        return
+
+    if n_workers is None or n_workers <= 1:
+        for vec_f_image, vec_f_imageBscan3d in zip(vec_f_image_all, vec_f_imageBscan3d_all):
+            yield func(vec_f_image, vec_f_imageBscan3d)
+
+    else:
+        # only a bounded number of patients is submitted ahead of the one being consumed, so that the outputs of the
+        # workers do not pile up in memory while the output arrays are being written
+        n_window = 2 * n_workers
+        deque_future = collections.deque()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for vec_f_image, vec_f_imageBscan3d in zip(vec_f_image_all, vec_f_imageBscan3d_all):
+                if len(deque_future) >= n_window:
+                    yield deque_future.popleft().result()
+                deque_future.append(executor.submit(func, vec_f_image, vec_f_imageBscan3d))
+
+            while deque_future:
+                yield deque_future.popleft().result()
+
+
+def _map_patients_stored(func, vec_f_image_all, vec_f_imageBscan3d_all, n_workers, vec_d_patient, d_patient_store):
+    """
+    Version of _map_patients backed by the per-patient store, see _map_patients for the parameters
+    """
+    # the image cache does not affect the output so it is not part of the key
+    str_store_key = get_patient_store_key({str_param: value for str_param, value in func.keywords.items()
+                                           if str_param != 'd_cache'})
+
+    vec_f_entry = []
+    for d_patient, vec_f_image, vec_f_imageBscan3d in zip(vec_d_patient, vec_f_image_all, vec_f_imageBscan3d_all):
+        str_fingerprint = get_patient_fingerprint(vec_f_image, vec_f_imageBscan3d)
+        vec_f_entry.append(get_patient_store_path(d_patient_store, str_store_key, d_patient, str_fingerprint))
+
+    vec_idx_new = [i for i in range(len(vec_f_entry)) if not vec_f_entry[i].exists()]
+    print('\nPatient store: decoding {} new or changed patients, reusing {}'.format(len(vec_idx_new),
+                                                                                  len(vec_f_entry) - len(vec_idx_new)))
+
+    vec_packed_new = _map_patients(func, [vec_f_image_all[i] for i in vec_idx_new],
+                                   [vec_f_imageBscan3d_all[i] for i in vec_idx_new], n_workers)
+    set_idx_new = set(vec_idx_new)
+    for i in range(len(vec_f_entry)):
+        packed = None if i in set_idx_new else load_patient_store(vec_f_entry[i])
+        if packed is None:
+            # decode again if the entry was removed or corrupted in the meantime
+            packed = next(vec_packed_new) if i in set_idx_new else func(vec_f_image_all[i], vec_f_imageBscan3d_all[i])
+            save_patient_store(vec_f_entry[i], *packed)
+
+        yield packed
+
+    vec_packed_new.close()
+
+
+def _get_n_eye_max(vec_f_image):
+    """
+    Obtains the largest number of eyes _package_data can return for a single patient without loading any image
+
+    :param vec_f_image: list of absolute paths to individual images from a single subject
+    :return: 2 if images from both eyes are present and 1 otherwise
+    """
+    if any("/OD/" in s for s in vec_f_image) & any("/OS/" in s for s in vec_f_image):
+        return 2
+
+    return 1
+
+
+def _allocate_cubes(n_sample, downscale_size, crop_size, num_octa, storage_dtype=None):
+    """
+    Allocates the output arrays of the loaders, which are filled one eye at a time
+
+    :param n_sample: number of eyes to allocate space for
+    :param downscale_size: desired final size of the loaded images, e.g. (256, 256)
+    :param crop_size: desired number of pixels to exclude from analysis for bscan images, e.g. [50, 60]
+    :param num_octa: number of OCTA images per patient, e.g. 5
+    :param storage_dtype: dtype in which the cubes are kept, e.g. 'uint8', float64 if None
+
+    :return: a list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    """
+    if crop_size is None:
+        n_row_bscan3d = downscale_size[0]
+    else:
+        n_row_bscan3d = downscale_size[0] - crop_size[0] - crop_size[1]
+
+    x_angiography = np.zeros([n_sample, downscale_size[0], downscale_size[1], num_octa, 1], dtype=storage_dtype)
+    x_structure = np.zeros([n_sample, downscale_size[0], downscale_size[1], num_octa, 1], dtype=storage_dtype)
+    x_bscan = np.zeros([n_sample, downscale_size[0], downscale_size[1], 1], dtype=storage_dtype)
+    x_bscan3d = np.zeros([n_sample, n_row_bscan3d, downscale_size[1], num_octa, 1], dtype=storage_dtype)
+
+    return [x_angiography, x_structure, x_bscan, x_bscan3d]
+
+
+def _write_cubes(X, idx_sample, x_curr):
+    """
+    Writes the cubes of a single eye into the preallocated output arrays
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    :param idx_sample: row of the output arrays to write into
+    :param x_curr: list of cubes of a single eye as returned by _form_cubes
+    """
+    for x, x_cube in zip(X, x_curr):
+        x[idx_sample, ...] = x_cube
+
 
-    return [x_angiography, x_structure, x_bscan, x_bscan3d], y, vec_str_patient
+def _trim_cubes(X, n_sample):
+    """
+    Discards the rows of the preallocated output arrays that were reserved for eyes that could not be loaded. The arrays
+    are only copied if rows were discarded, one at a time so that the full allocation of only a single array is held
+    alongside its trimmed copy
+
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    :param n_sample: number of rows that were written
+    :return: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    """
+    for i in range(len(X)):
+        if X[i].shape[0] > n_sample:
+            # a slice would be a view that keeps the whole allocation alive
+            X[i] = X[i][:n_sample].copy()
+
+    return X
 
 
 def _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, num_octa,
                   str_angiography, str_structure, str_bscan, vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer,
-                  dict_layer_order, dict_layer_order_bscan3d):
+                  dict_layer_order, dict_layer_order_bscan3d, d_cache=None, storage_dtype=None, image_backend=None):
     """
     Organizes the angiography, OCT and b-scan images into a list of cubes for a single subject and also returns which
     eye it is. Difference from function below: contains logic that deal with cases where there are two eyes
@@ -940,6 +1389,9 @@ def _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, nu
     :param str_bscan_layer: string that contains the type of b-scan images to be used in filename, e.g. Flow
     :param dict_layer_order: dictionary that contains the order in which the different layers will be organized
     :param dict_layer_order_bscan3d: dictionary that contains the order in which the bscans cubes will be organized
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :param storage_dtype: dtype in which the cubes are kept, e.g. 'uint8', float64 if None
+    :param image_backend: backend used for decoding and resizing the images, see _load_image_stack
 
     :return: return a list in the form [packed_images, str_eye]. If both eyes are available, then each variable would
     be a list of cubes and strings; if only one eye is available, packed_images would be a cube and str_eye would be
@@ -957,11 +1409,13 @@ def _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, nu
 
         x_curr_OD = _form_cubes(vec_f_image_OD, vec_f_imageBscan3d_OD, num_octa, downscale_size, crop_size,
                                 str_angiography, str_structure, str_bscan, vec_str_layer, vec_str_layer_bscan3d,
-                                str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d)
+                                str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d, d_cache, storage_dtype,
+                                image_backend)
 
         x_curr_OS = _form_cubes(vec_f_image_OS, vec_f_imageBscan3d_OS, num_octa, downscale_size, crop_size,
                                 str_angiography, str_structure, str_bscan, vec_str_layer, vec_str_layer_bscan3d,
-                                str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d)
+                                str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d, d_cache, storage_dtype,
+                                image_backend)
 
         # Figure out if any of the single eye data is none
         if x_curr_OD is not None and x_curr_OS is not None:
@@ -983,7 +1437,8 @@ def _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, nu
     else:
         x_curr = _form_cubes(vec_f_image, vec_f_imageBscan3d, num_octa, downscale_size, crop_size,
                              str_angiography, str_structure, str_bscan, vec_str_layer, vec_str_layer_bscan3d,
-                             str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d)
+                             str_bscan_layer, dict_layer_order, dict_layer_order_bscan3d, d_cache, storage_dtype,
+                             image_backend)
 
         packed_x_curr = x_curr
 
@@ -1001,7 +1456,7 @@ def _package_data(vec_f_image, vec_f_imageBscan3d, downscale_size, crop_size, nu
 
 def _form_cubes(vec_f_image, vec_f_imageBscan3d, num_octa, downscale_size, crop_size,
                 str_angiography, str_structure, str_bscan, vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer,
-                dict_layer_order, dict_layer_order_bscan3d):
+                dict_layer_order, dict_layer_order_bscan3d, d_cache=None, storage_dtype=None, image_backend=None):
     """
     Organizes the angiography, OCT and b-scan images into a list of cubes for a single subject
 
@@ -1018,6 +1473,9 @@ def _form_cubes(vec_f_image, vec_f_imageBscan3d, num_octa, downscale_size, crop_
     :param str_bscan_layer: string that contains the type of b-scan images to be used in filename, e.g. Flow
     :param dict_layer_order: dictionary that contains the order in which the different layers will be organized
     :param dict_layer_order_bscan3d: dictionary that contains the order in which the bscans cubes will be organized
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :param storage_dtype: dtype in which the cubes are kept, e.g. 'uint8', float64 if None
+    :param image_backend: backend used for decoding and resizing the images, see _load_image_stack
 
     :return: a list that contains loaded angiography, OCT, and b-scan images
     """
@@ -1026,78 +1484,30 @@ def _form_cubes(vec_f_image, vec_f_imageBscan3d, num_octa, downscale_size, crop_
     vec_vol_f_image_angiography_curr = {}
     vec_vol_f_image_structure_curr = {}
     vec_vol_f_image_bscan_curr = {}
-    vec_vol_f_image_bscan3d_curr = {}
 
     count_angiography_hit = 0
     count_structure_hit = 0
     count_bscan_hit = 0
     for f_image in vec_f_image:
-        p_f_image = pathlib.Path(f_image)
-        p_f_image_filename = p_f_image.name
+        p_f_image_filename = pathlib.Path(f_image).name
 
-        for str_image_type in [str_angiography, str_structure, str_bscan]:
+        for str_image_type, str_layer in match_octa_image(p_f_image_filename, str_angiography, str_structure,
+                                                          str_bscan, vec_str_layer, str_bscan_layer):
             if str_image_type == str_bscan:
-                re_pattern_bscan = '.*{} {}.bmp'.format(str_image_type, str_bscan_layer)
-
-                re_hits = re.findall(re_pattern_bscan, p_f_image_filename, re.I)
-
-                if re_hits:
-                    vec_vol_f_image_bscan_curr[len(vec_vol_f_image_bscan_curr)] = f_image
-                    count_bscan_hit += 1
+                vec_vol_f_image_bscan_curr[len(vec_vol_f_image_bscan_curr)] = f_image
+                count_bscan_hit += 1
+            elif str_image_type == str_angiography:
+                vec_vol_f_image_angiography_curr[dict_layer_order[str_layer]] = f_image
+                count_angiography_hit += 1
             else:
-                for str_layer in vec_str_layer:
-                    re_pattern_curr = '.*{}_{}.bmp'.format(str_image_type, str_layer)
-
-                    re_hits = re.findall(re_pattern_curr, p_f_image_filename, re.I)
-
-                    if re_hits:
-                        if str_image_type == str_angiography:
-                            vec_vol_f_image_angiography_curr[dict_layer_order[str_layer]] = f_image
-                            count_angiography_hit += 1
-                        else:
-                            vec_vol_f_image_structure_curr[dict_layer_order[str_layer]] = f_image
-                            count_structure_hit += 1
+                vec_vol_f_image_structure_curr[dict_layer_order[str_layer]] = f_image
+                count_structure_hit += 1
 
     if (count_angiography_hit != len(vec_str_layer)) or (count_structure_hit != len(vec_str_layer)) or (count_bscan_hit != 1):
         raise Exception('Failed to locate all the OCTA images')
 
-    count_bscan3d_hit = 0
-    for f_image_bscan3d in vec_f_imageBscan3d:
-        p_f_image_bscan3d = pathlib.Path(f_image_bscan3d)
-        p_f_image_bscan3d_filename = p_f_image_bscan3d.name
-
-        #for 3d bscan cube
-        for str_layer_bscan3d in vec_str_layer_bscan3d:
-            if  p_f_image_bscan3d_filename == '{}.tiff'.format(str_layer_bscan3d):
-                vec_vol_f_image_bscan3d_curr[dict_layer_order_bscan3d[str_layer_bscan3d]] = f_image_bscan3d
-                count_bscan3d_hit += 1
-
-    # in cases where no images were identified, try again with different pattern
-    if count_bscan3d_hit == 0:
-        # obtain the date strings at the end of the file
-        vec_img_timestamp = []
-        re_pattern_timestamp = '_O[DS]_(.*).tiff'
-        for f_image_bscan3d in vec_f_imageBscan3d:
-            p_f_image_bscan3d = pathlib.Path(f_image_bscan3d)
-            p_f_image_bscan3d_filename = p_f_image_bscan3d.name
-
-            str_img_timestamp = re.search(re_pattern_timestamp, p_f_image_bscan3d_filename).group(1)
-            vec_img_timestamp.append(int(str_img_timestamp))
-        vec_img_timestamp = np.stack(vec_img_timestamp, axis=-1)
-        vec_img_timestamp = np.sort(vec_img_timestamp)
-
-        # do actual detection and addition to the dictionary
-        for f_image_bscan3d in vec_f_imageBscan3d:
-            p_f_image_bscan3d = pathlib.Path(f_image_bscan3d)
-            p_f_image_bscan3d_filename = p_f_image_bscan3d.name
-
-            for idx_img_timestamp in range(len(vec_img_timestamp)):
-                img_timestamp = vec_img_timestamp[idx_img_timestamp]
-                re_pattern_curr = '.*_{}.tiff'.format(img_timestamp)
-                re_hits = re.findall(re_pattern_curr, p_f_image_bscan3d_filename, re.I)
-                if re_hits:
-                    vec_vol_f_image_bscan3d_curr[idx_img_timestamp] = f_image_bscan3d
-                    count_bscan3d_hit += 1
+    vec_vol_f_image_bscan3d_curr, count_bscan3d_hit = match_bscan3d_images(vec_f_imageBscan3d, vec_str_layer_bscan3d,
+                                                                           dict_layer_order_bscan3d)
 
     if count_bscan3d_hit != len(vec_str_layer_bscan3d):
         raise Exception('Failed to locate all the 3D bscan images')
@@ -1118,30 +1528,36 @@ def _form_cubes(vec_f_image, vec_f_imageBscan3d, num_octa, downscale_size, crop_
 
     # once we are down with finding the appropriate path, try to load the images
     # TODO: number of channels is hard-coded now, fix that in the future
-    vol_angiography_curr = np.zeros([downscale_size[0], downscale_size[1], num_octa, 1])
-    vol_structure_curr = np.zeros([downscale_size[0], downscale_size[1], num_octa, 1])
-    vol_bscan_curr = np.zeros([downscale_size[0], downscale_size[1], 1])
+    vol_angiography_curr = np.zeros([downscale_size[0], downscale_size[1], num_octa, 1], dtype=storage_dtype)
+    vol_structure_curr = np.zeros([downscale_size[0], downscale_size[1], num_octa, 1], dtype=storage_dtype)
+    vol_bscan_curr = np.zeros([downscale_size[0], downscale_size[1], 1], dtype=storage_dtype)
 
 
-    _create_np_cubes(vol_angiography_curr, vec_vol_f_image_angiography_curr, downscale_size)
-    _create_np_cubes(vol_structure_curr, vec_vol_f_image_structure_curr, downscale_size)
-    _create_np_cubes(vol_bscan_curr, vec_vol_f_image_bscan_curr, downscale_size)
+    _create_np_cubes(vol_angiography_curr, vec_vol_f_image_angiography_curr, downscale_size, d_cache=d_cache,
+                     image_backend=image_backend)
+    _create_np_cubes(vol_structure_curr, vec_vol_f_image_structure_curr, downscale_size, d_cache=d_cache,
+                     image_backend=image_backend)
+    _create_np_cubes(vol_bscan_curr, vec_vol_f_image_bscan_curr, downscale_size, d_cache=d_cache,
+                     image_backend=image_backend)
 
     if crop_size is None:
-        vol_bscan3d_curr = np.zeros([downscale_size[0], downscale_size[1], num_octa, 1])
-        _create_np_cubes(vol_bscan3d_curr, vec_vol_f_image_bscan3d_curr, downscale_size)
+        vol_bscan3d_curr = np.zeros([downscale_size[0], downscale_size[1], num_octa, 1], dtype=storage_dtype)
+        _create_np_cubes(vol_bscan3d_curr, vec_vol_f_image_bscan3d_curr, downscale_size, d_cache=d_cache,
+                         image_backend=image_backend)
 
     else:
-        vol_bscan3d_curr = np.zeros([downscale_size[0] - crop_size[0] - crop_size[1], downscale_size[1], num_octa, 1])
+        vol_bscan3d_curr = np.zeros([downscale_size[0] - crop_size[0] - crop_size[1], downscale_size[1], num_octa, 1],
+                                    dtype=storage_dtype)
         _create_np_cubes(vol_bscan3d_curr, vec_vol_f_image_bscan3d_curr, downscale_size,
-                         bool_crop=True, crop_size=crop_size)
+                         bool_crop=True, crop_size=crop_size, d_cache=d_cache, image_backend=image_backend)
 
     x_curr = [vol_angiography_curr, vol_structure_curr, vol_bscan_curr, vol_bscan3d_curr]
 
     return x_curr
 
 
-def _create_np_cubes(np_cube, vec_vol_f_image, downscale_size, bool_crop=False, crop_size=None):
+def _create_np_cubes(np_cube, vec_vol_f_image, downscale_size, bool_crop=False, crop_size=None, d_cache=None,
+                     image_backend=None):
     """
     Packs loaded single-type (e.g. OCT) individual images into numpy tensors of shape (width, height, n_octa, 1).
     This would correspond to data from a single patient
@@ -1149,27 +1565,145 @@ def _create_np_cubes(np_cube, vec_vol_f_image, downscale_size, bool_crop=False,
     :param np_cube: numpy tensor of shape (width, height, n_octa, 1) that will be filled up with individual images
     :param vec_vol_f_image: a dictionary of the absolute paths to the individual images
     :param downscale_size: desired final size of the loaded images, e.g. (256, 256)
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :param image_backend: backend used for decoding and resizing the images, see _load_image_stack
     """
     if len(np_cube.shape) == 4:
-        for idx_layer, p_f_image_curr_layer in vec_vol_f_image.items():
-            curr_img = _load_individual_image(str(p_f_image_curr_layer), downscale_size, bool_crop, crop_size)
-            np_cube[:, :, idx_layer, :] = curr_img
+        vec_idx_layer = list(vec_vol_f_image.keys())
+        vec_img = _load_image_stack([str(vec_vol_f_image[idx_layer]) for idx_layer in vec_idx_layer], downscale_size,
+                                    bool_crop, crop_size, d_cache, image_backend)
+        for idx_layer, curr_img in zip(vec_idx_layer, vec_img):
+            np_cube[:, :, idx_layer, :] = _to_storage_dtype(curr_img, np_cube.dtype)
 
     # TODO: code for B scan is ugly
     else:
-        np_cube[:, :] = _load_individual_image(str(vec_vol_f_image[0]), downscale_size, bool_crop, crop_size)
+        vec_img = _load_image_stack([str(vec_vol_f_image[0])], downscale_size, bool_crop, crop_size, d_cache,
+                                    image_backend)
+        np_cube[:, :] = _to_storage_dtype(vec_img[0], np_cube.dtype)
 
 
-def _load_individual_image(f_image, downscale_size, bool_crop=False, crop_size=None):
+def _to_storage_dtype(img, storage_dtype):
     """
-    Loads an individual image into numpy array and perform resizing
+    Converts a loaded image in the range [0, 1] into the dtype of the cube it is written into. Images are kept as
+    integers in [0, 255] for uint8 storage, which is lossless for 8-bit source images up to the resizing
+
+    :param img: individual grayscale image in the range [0, 1]
+    :param storage_dtype: numpy dtype of the cube
+    :return: the image in the storage dtype
+    """
+    if storage_dtype == np.uint8:
+        return np.round(np.clip(img, 0, 1) * 255).astype(np.uint8)
+
+    return img
+
+
+def _load_image_stack(vec_f_image, downscale_size, bool_crop=False, crop_size=None, d_cache=None, image_backend=None):
+    """
+    Loads and resizes all images of a single cube, e.g. the five angiography layers of one eye. The 'skimage' backend
+    loads each image with _load_individual_image. The 'pil' backend decodes with PIL and resizes by averaging over the
+    source pixels each output pixel covers, as a block mean over the whole stack at once when the scale factors are
+    integers. Rows that are cropped away are never resized since the crop is applied in source coordinates. The box
+    filter replaces the Gaussian anti-aliasing of the 'skimage' backend, so the outputs differ most where the images
+    vary from pixel to pixel. On the images of synthetic_data, which carry pixel noise of +-0.1, the mean absolute
+    difference is below 0.02 and the largest below 0.15 on the [0, 1] scale for sizes from 96 to 1024 pixels
+
+    :param vec_f_image: list of absolute paths to the images
+    :param downscale_size: desired final size of the loaded images, e.g. (256, 256)
+    :param bool_crop: whether or not to crop the rows of the bscan images
+    :param crop_size: desired number of pixels to exclude from analysis for bscan images, e.g. [50, 60]
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :param image_backend: 'skimage' or 'pil', 'skimage' if None
+    :return: list of individual grayscale images of shape (width, height, 1)
+    """
+    if image_backend is None or image_backend == 'skimage':
+        return [_load_individual_image(f_image, downscale_size, bool_crop, crop_size, d_cache)
+                for f_image in vec_f_image]
+
+    if image_backend != 'pil':
+        raise Exception('Undefined image backend')
+
+    vec_img = [None] * len(vec_f_image)
+    vec_f_cache = [None] * len(vec_f_image)
+    if d_cache is not None:
+        for i, f_image in enumerate(vec_f_image):
+            vec_f_cache[i] = get_image_cache_path(d_cache, f_image, downscale_size, bool_crop, crop_size,
+                                                  image_backend)
+            vec_img[i] = load_cached_image(vec_f_cache[i])
+
+    vec_idx_miss = [i for i in range(len(vec_f_image)) if vec_img[i] is None]
+    if vec_idx_miss:
+        vec_img_resized = _resize_stack_pil([_decode_image_pil(vec_f_image[i]) for i in vec_idx_miss], downscale_size,
+                                            bool_crop, crop_size)
+        for i, img_resized in zip(vec_idx_miss, vec_img_resized):
+            vec_img[i] = img_resized
+            if d_cache is not None:
+                save_cached_image(vec_f_cache[i], img_resized)
+
+    return vec_img
+
+
+def _decode_image_pil(f_image):
+    """
+    Decodes an individual image with PIL into the same array as io.imread with the matplotlib plugin
 
     :param f_image: absolute path to a single image
+    :return: individual grayscale image of shape (width, height) in the range [0, 1]
+    """
+    with Image.open(f_image) as img_pil:
+        # matplotlib converts all other modes, e.g. palette images, into RGBA
+        if img_pil.mode not in ['L', 'RGB', 'RGBA', 'RGBX'] and not img_pil.mode.startswith('I;16'):
+            img_pil = img_pil.convert('RGBA')
+        img = np.asarray(img_pil).astype(np.float32)
+
+    return _to_gray(img)
+
+
+def _resize_stack_pil(vec_img, downscale_size, bool_crop=False, crop_size=None):
+    """
+    Resizes decoded images by area averaging when downscaling and bilinear interpolation otherwise, cropping the rows
+    of the bscan images in source coordinates first
+
+    :param vec_img: list of individual grayscale images of shape (width, height)
     :param downscale_size: desired final size of the loaded images, e.g. (256, 256)
-    :return: individual grayscale image of shape (width, height, 1)
+    :param bool_crop: whether or not to crop the rows of the bscan images
+    :param crop_size: desired number of pixels to exclude from analysis for bscan images, e.g. [50, 60]
+    :return: list of resized images of shape (width, height, 1)
+    """
+    # rows kept in the resized image, cropped the same way as in _load_individual_image
+    row_start, row_end = (crop_size[0], downscale_size[1] - crop_size[1]) if bool_crop else (0, downscale_size[0])
+
+    # images of a single shape with integer scale factors are averaged over blocks of pixels all at once
+    if len(set(img.shape for img in vec_img)) == 1:
+        height, width = vec_img[0].shape
+        if height % downscale_size[0] == 0 and width % downscale_size[1] == 0:
+            factor_height = height // downscale_size[0]
+            factor_width = width // downscale_size[1]
+            x = np.stack(vec_img)[:, row_start * factor_height:row_end * factor_height, :]
+            x = x.reshape(len(vec_img), row_end - row_start, factor_height, downscale_size[1], factor_width)
+
+            return list(x.mean(axis=(2, 4), dtype=np.float32)[..., np.newaxis])
+
+    vec_img_resized = []
+    for img in vec_img:
+        height, width = img.shape
+        scale_height = height / downscale_size[0]
+        resample = Image.BOX if height >= downscale_size[0] and width >= downscale_size[1] else Image.BILINEAR
+
+        img_resized = Image.fromarray(img.astype(np.float32)).resize(
+            (downscale_size[1], row_end - row_start), resample=resample,
+            box=(0, row_start * scale_height, width, row_end * scale_height))
+        vec_img_resized.append(np.asarray(img_resized, dtype=np.float32)[..., np.newaxis])
+
+    return vec_img_resized
+
+
+def _to_gray(img):
     """
-    img = io.imread(f_image, plugin='matplotlib').astype(np.float32)
+    Converts a decoded image into a single grayscale channel in the range [0, 1]
 
+    :param img: decoded image of shape (width, height) or (width, height, n_channel)
+    :return: individual grayscale image of shape (width, height)
+    """
     # Take care of images that are not grayscale
     if len(img.shape) >= 3:
         if len(img.shape) >= 4:
@@ -1186,6 +1720,27 @@ def _load_individual_image(f_image, downscale_size, bool_crop=False, crop_size=N
     if np.max(img) > 1:
         img = img / 255
 
+    return img
+
+
+def _load_individual_image(f_image, downscale_size, bool_crop=False, crop_size=None, d_cache=None):
+    """
+    Loads an individual image into numpy array and perform resizing
+
+    :param f_image: absolute path to a single image
+    :param downscale_size: desired final size of the loaded images, e.g. (256, 256)
+    :param d_cache: directory holding the cache of resized images, no caching if None
+    :return: individual grayscale image of shape (width, height, 1)
+    """
+    # skip the decoding and resizing altogether if the resized image is already in the cache
+    if d_cache is not None:
+        f_cache = get_image_cache_path(d_cache, f_image, downscale_size, bool_crop, crop_size)
+        imgResized = load_cached_image(f_cache)
+        if imgResized is not None:
+            return imgResized
+
+    img = _to_gray(io.imread(f_image, plugin='matplotlib').astype(np.float32))
+
     # Note here you can't use numpy resize since the end result obtained is different from original image
     imgResized = transform.resize(img, (downscale_size[0], downscale_size[1], 1), anti_aliasing=True)
 
@@ -1195,4 +1750,8 @@ def _load_individual_image(f_image, downscale_size, bool_crop=False, crop_size=N
         crop_end = downscale_size[1] - crop_size[1]
         imgResized = imgResized[crop_size[0]:crop_end, :, :]
 
+    if d_cache is not None:
+        imgResized = imgResized.astype(np.float32)
+        save_cached_image(f_cache, imgResized)
+
     return imgResized
@@ -0,0 +1,161 @@
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+from skimage import io
+
+from config.load_config import get_config
+
+
+def generate_synthetic_dataset(d_data, vec_idx_patient, cfg, image_size=(420, 420), load_mode='csv', d_csv=None,
+                               f_csv='DiseaseLabelsSynthetic.csv', bscan3d_naming='numbered', per_single_eye=0.2,
+                               random_seed=None):
+    """
+    Writes a fake dataset with random images in the same folder layout as the real data, so that the loaders in
+    preprocess.py can be exercised without access to the patient data
+
+    :param pathlib.Path d_data: directory to write the images into, plays the role of cfg.d_data
+    :param vec_idx_patient: list in the form of [start_idx, end_idx]
+    :param cfg: configuration file set by the user, provides the layer and image type strings
+    :param image_size: shape of the written images, e.g. (420, 420)
+    :param str load_mode: 'csv' for d_data/<id>/<eye>/... or 'folder' for d_data/<class>/<id>/<eye>/...
+    :param pathlib.Path d_csv: directory to write the label csv file into, d_data if None
+    :param str f_csv: filename of the label csv file
+    :param str bscan3d_naming: 'numbered' for 1.tiff, 2.tiff... or 'timestamp' for <id>_<eye>_<timestamp>.tiff
+    :param float per_single_eye: fraction of patients with only a single eye
+    :param random_seed: random seed for the images and labels
+
+    :return: a tuple vec_str_patient, y in the order in which data_loading returns them for three classes
+    """
+    rng = np.random.RandomState(random_seed)
+    d_data = pathlib.Path(d_data)
+    d_csv = d_data if d_csv is None else pathlib.Path(d_csv)
+
+    vec_full_idx = np.arange(vec_idx_patient[0], vec_idx_patient[1] + 1, 1)
+    vec_str_feature = [s for s in cfg.vec_all_str_feature if s != 'disease']
+
+    vec_str_patient = []
+    y = []
+    dict_csv = {'Pt\nID': [], 'OD\nDisease': [], 'OS\nDisease': []}
+    for str_feature in vec_str_feature:
+        dict_csv['OD: {}'.format(str_feature)] = []
+        dict_csv['OS: {}'.format(str_feature)] = []
+
+    for idx_patient in vec_full_idx:
+        # decide which eyes are available and what the disease labels are
+        if rng.rand() < per_single_eye:
+            vec_str_eye = [['OD', 'OS'][rng.randint(2)]]
+        else:
+            vec_str_eye = ['OD', 'OS']
+        dict_label = {str_eye: rng.randint(3) for str_eye in vec_str_eye}
+
+        dict_csv['Pt\nID'].append(idx_patient)
+        for str_eye in ['OD', 'OS']:
+            dict_csv['{}\nDisease'.format(str_eye)].append(dict_label[str_eye] + 1 if str_eye in dict_label else 0)
+            for str_feature in vec_str_feature:
+                dict_csv['{}: {}'.format(str_eye, str_feature)].append(rng.randint(2) if str_eye in dict_label
+                                                                       else np.nan)
+
+        for str_eye in vec_str_eye:
+            if load_mode == 'csv':
+                d_eye = d_data / '{}'.format(idx_patient) / str_eye
+                vec_str_patient.append("Patient {}/{}".format(idx_patient, str_eye))
+            elif load_mode == 'folder':
+                str_class = [cfg.str_healthy, cfg.str_dry_amd, cfg.str_cnv][dict_label[str_eye]]
+                d_eye = d_data / str_class / '{}'.format(idx_patient) / str_eye
+                vec_str_patient.append("{}/Patient {}/{}".format(str_class, idx_patient, str_eye))
+            else:
+                raise Exception('Undefined load mode')
+            y.append(dict_label[str_eye])
+
+            _write_eye(d_eye, idx_patient, str_eye, image_size, bscan3d_naming, rng, cfg)
+
+    pd_csv = pd.DataFrame(dict_csv)
+    d_csv.mkdir(parents=True, exist_ok=True)
+    pd_csv.to_csv(str(d_csv / f_csv), index=False)
+
+    vec_str_patient = np.array(vec_str_patient)
+    y = np.array(y)
+    if load_mode == 'folder':
+        # the folder loader returns the healthy, dry AMD and CNV patients one class after the other
+        vec_idx_sort = np.argsort(y, kind='stable')
+        vec_str_patient = vec_str_patient[vec_idx_sort]
+        y = y[vec_idx_sort]
+
+    return vec_str_patient.tolist(), y
+
+
+def _write_eye(d_eye, idx_patient, str_eye, image_size, bscan3d_naming, rng, cfg):
+    """
+    Writes all the images of a single eye
+
+    :param pathlib.Path d_eye: directory of the eye, e.g. d_data/5/OD
+    :param idx_patient: patient id
+    :param str str_eye: OD or OS
+    :param image_size: shape of the written images, e.g. (420, 420)
+    :param str bscan3d_naming: 'numbered' or 'timestamp'
+    :param rng: numpy random state
+    :param cfg: configuration file set by the user
+    """
+    d_octa = d_eye / 'OCTA'
+    d_octa.mkdir(parents=True, exist_ok=True)
+
+    str_prefix = '{}_{}'.format(idx_patient, str_eye)
+    for str_image_type in [cfg.str_angiography, cfg.str_structure]:
+        for str_layer in cfg.vec_str_layer:
+            f_image = '{}_{}_{}.bmp'.format(str_prefix, str_image_type, str_layer)
+            io.imsave(str(d_octa / f_image), _get_random_image(image_size, rng), check_contrast=False)
+
+    f_image = '{}_{} {}.bmp'.format(str_prefix, cfg.str_bscan, cfg.str_bscan_layer)
+    io.imsave(str(d_octa / f_image), _get_random_image(image_size, rng), check_contrast=False)
+
+    timestamp = 20201024000000 + rng.randint(1000) * 100
+    for idx_layer, str_layer_bscan3d in enumerate(cfg.vec_str_layer_bscan3d):
+        if bscan3d_naming == 'numbered':
+            f_image = '{}.tiff'.format(str_layer_bscan3d)
+        else:
+            f_image = '{}_{}.tiff'.format(str_prefix, timestamp + idx_layer)
+        io.imsave(str(d_eye / f_image), _get_random_image(image_size, rng), check_contrast=False)
+
+
+def _get_random_image(image_size, rng):
+    """
+    Generates a smooth random 8 bit grayscale image
+
+    :param image_size: shape of the image, e.g. (420, 420)
+    :param rng: numpy random state
+    :return: uint8 image of shape image_size
+    """
+    vec_x = np.linspace(0, 1, image_size[1])[np.newaxis, :]
+    vec_y = np.linspace(0, 1, image_size[0])[:, np.newaxis]
+    img = np.sin(2 * np.pi * (rng.rand() * 5 * vec_x + rng.rand())) * np.cos(2 * np.pi * (rng.rand() * 5 * vec_y))
+    img = 0.5 + 0.3 * img + 0.2 * rng.rand(*image_size)
+
+    return np.clip(img * 255, 0, 255).astype(np.uint8)
+
+
+if __name__ == '__main__':
+    # Configuring the files here for now, the strings match the ones set in the training scripts
+    cfg = get_config(filename=pathlib.Path(os.getcwd()) / 'config' / 'default_config.yml')
+    cfg.vec_all_str_feature = ['disease', 'IRF/SRF', 'Scar', 'GA', 'CNV', 'PED']
+    cfg.str_healthy = 'Normal'
+    cfg.str_dry_amd = 'Dry AMD'
+    cfg.str_cnv = 'CNV'
+    cfg.str_angiography = 'Angiography'
+    cfg.str_structure = 'Structure'
+    cfg.str_bscan = 'B-Scan'
+    cfg.vec_str_layer = ['Deep', 'Avascular', 'ORCC', 'Choriocapillaris', 'Choroid']
+    cfg.vec_str_layer_bscan3d = ['1', '2', '3', '4', '5']
+    cfg.str_bscan_layer = 'Flow'
+
+    # point cfg.d_data and cfg.d_csv of the training scripts here
+    d_synthetic = pathlib.Path('/tmp/amd_octa_synthetic/')
+    vec_idx_patient = [1, 40]
+    image_size = (420, 420)
+
+    vec_str_patient, y = generate_synthetic_dataset(d_synthetic / 'FinalData', vec_idx_patient, cfg,
+                                                    image_size=image_size, load_mode='csv', d_csv=d_synthetic,
+                                                    random_seed=68)
+    print('Wrote {} eyes of {} patients to {}'.format(len(y), vec_idx_patient[1] - vec_idx_patient[0] + 1,
+                                                      d_synthetic))
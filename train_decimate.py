@@ -4,6 +4,7 @@ from pathlib import Path
 from config.load_config import get_config
 from preprocess import preprocess
 from model import get_model, get_callbacks, get_model_binary
+from data_pipeline import get_dataset
 from plotting import plot_norm_conf_matrix, plot_raw_conf_matrix, plot_training_loss, plot_training_acc
 
 
@@ -81,37 +82,35 @@ print("y_test onehot shape: {}".format(ys[2].shape))
 # decimate
 n_train = Xs[0][0].shape[0]
 n_train_decimate = round(n_train / 2)
-x_train = Xs[0]
-y_train = ys[0]
-
-x_train[0] = x_train[0][:n_train_decimate, :, :, :, :]
-x_train[1] = x_train[1][:n_train_decimate, :, :, :, :]
-x_train[2] = x_train[2][:n_train_decimate, :, :, :]
-
-y_train = y_train[:n_train_decimate, :]
+# all inputs are decimated, including the 3D bscan cube, without modifying the training set itself
+x_train = [x[:n_train_decimate] for x in Xs[0]]
+y_train = ys[0][:n_train_decimate]
 
 # Get and train model
 model = get_model_binary('arch_009_binary', cfg)
 callbacks = get_callbacks(cfg)
 
-h = model.fit(x_train, y_train, batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks,
-              validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
+h = model.fit(get_dataset(x_train, y_train, cfg.batch_size, n_inputs=len(model.inputs)), epochs=cfg.n_epoch,
+              verbose=2, callbacks=callbacks,
+              class_weight=dict(enumerate(cfg.vec_class_weight)) if cfg.vec_class_weight else None,
+              validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=len(model.inputs)))
 
 
 plot_training_loss(h)
 plot_training_acc(h)
 
 # Now perform prediction
-train_set_score = model.evaluate(x_train, y_train, callbacks=callbacks, verbose=0)
-valid_set_score = model.evaluate(Xs[1], ys[1], callbacks=callbacks, verbose=0)
-test_set_score = model.evaluate(Xs[2], ys[2], callbacks=callbacks, verbose=0)
+train_set_score = model.evaluate(get_dataset(x_train, y_train, n_inputs=len(model.inputs)), callbacks=callbacks,
+                                 verbose=0)
+valid_set_score = model.evaluate(get_dataset(Xs[1], ys[1], n_inputs=len(model.inputs)), callbacks=callbacks, verbose=0)
+test_set_score = model.evaluate(get_dataset(Xs[2], ys[2], n_inputs=len(model.inputs)), callbacks=callbacks, verbose=0)
 
 print("\nAverage train set accuracy: {}".format(train_set_score[1]))
 print("Average valid set accuracy: {}".format(valid_set_score[1]))
 print("Average test set accuracy: {}".format(test_set_score[1]))
 
 y_true = ys[-1]
-y_pred = model.predict(Xs[2])
+y_pred = model.predict(get_dataset(Xs[2], n_inputs=len(model.inputs)))
 y_pred[y_pred >= 0.5] = 1
 y_pred[y_pred < 0.5] = 0
 
@@ -5,9 +5,9 @@ import matplotlib.pyplot as plt
 
 from config.load_config import get_config
 from preprocess import preprocess
-from model import get_model, get_callbacks
+from model import get_model, get_callbacks, get_ensemble_model
+from data_pipeline import get_dataset
 from plotting import plot_norm_conf_matrix, plot_raw_conf_matrix
-from scipy.stats import mode
 
 
 # Configuring the files here for now
@@ -77,46 +77,43 @@ for i in range(cfg.n_ensemble):
     model = get_model('arch_011', cfg)
     callbacks = get_callbacks(cfg)
 
-    h = model.fit(Xs[0], ys[0], batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks,
-                  validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
+    h = model.fit(get_dataset(Xs[0], ys[0], cfg.batch_size, n_inputs=len(model.inputs)), epochs=cfg.n_epoch,
+                  verbose=2, callbacks=callbacks,
+                  class_weight=dict(enumerate(cfg.vec_class_weight)) if cfg.vec_class_weight else None,
+                  validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=len(model.inputs)))
 
     # Now perform prediction
-    train_set_score = model.evaluate(Xs[0], ys[0], callbacks=callbacks, verbose=0)
-    valid_set_score = model.evaluate(Xs[1], ys[1], callbacks=callbacks, verbose=0)
-    test_set_score = model.evaluate(Xs[2], ys[2], callbacks=callbacks, verbose=0)
+    train_set_score = model.evaluate(get_dataset(Xs[0], ys[0], n_inputs=len(model.inputs)), callbacks=callbacks,
+                                     verbose=0)
+    valid_set_score = model.evaluate(get_dataset(Xs[1], ys[1], n_inputs=len(model.inputs)), callbacks=callbacks,
+                                     verbose=0)
+    test_set_score = model.evaluate(get_dataset(Xs[2], ys[2], n_inputs=len(model.inputs)), callbacks=callbacks,
+                                    verbose=0)
 
     vec_train_acc.append(train_set_score[1])
     vec_valid_acc.append(valid_set_score[1])
     vec_test_acc.append(test_set_score[1])
 
-    y_true = np.argmax(ys[-1], axis=1)
-    y_pred = np.argmax(model.predict(Xs[2]), axis=1)
-
-    vec_y_true.append(y_true)
-    vec_y_pred.append(y_pred)
-
     vec_model.append(model)
 
 print("Average train set accuracy: {} + ".format(np.mean(vec_train_acc)), np.std(vec_train_acc))
 print("Average valid set accuracy: {} + ".format(np.mean(vec_valid_acc)), np.std(vec_valid_acc))
 print("Average test set accuracy: {} + ".format(np.mean(vec_test_acc)), np.std(vec_test_acc))
 
+# predictions of all members, their mean and their majority vote in a single pass over the test set
+ensemble_model = get_ensemble_model(vec_model)
+member_prob, mean_prob, y_pred_mode = ensemble_model.predict(get_dataset(Xs[2], n_inputs=len(ensemble_model.inputs)))
+
+for i in range(len(vec_model)):
+    vec_y_true.append(np.argmax(ys[-1], axis=1))
+    vec_y_pred.append(np.argmax(member_prob[:, i, :], axis=1))
+
 y_true = np.concatenate(vec_y_true, axis=0)
 y_pred = np.concatenate(vec_y_pred, axis=0)
 
 plot_raw_conf_matrix(y_true, y_pred, cfg)
 plot_norm_conf_matrix(y_true, y_pred, cfg)
 
-mat_pred = []
-
-for i in range(len(vec_model)):
-    curr_model = vec_model[i]
-    y_pred_curr = np.argmax(curr_model.predict(Xs[2]), axis=1)
-
-    mat_pred.append(y_pred_curr)
-mat_pred = np.stack(mat_pred, axis=0)
-
-y_pred_mode = mode(mat_pred, axis=0).mode.reshape(-1)
 y_true_alt = np.argmax(ys[-1], axis=1)
 ensemble_acc = np.sum(y_pred_mode == y_true_alt) / len(y_true_alt)
 
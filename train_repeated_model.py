@@ -4,8 +4,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from config.load_config import get_config
-from preprocess import preprocess
+from preprocess import data_loading, preprocess_repeated
 from model import get_model, get_callbacks
+from data_pipeline import get_dataset
+from cv_parallel import train_cv_parallel
 from plotting import plot_raw_conf_matrix, plot_norm_conf_matrix
 import time
 
@@ -16,6 +18,8 @@ cfg = get_config(filename=pathlib.Path(os.getcwd()) / 'config' / 'default_config
 # cfg.d_model = pathlib.Path('/home/jyao/local/data/amd_octa/trained_models/')
 cfg.d_data = pathlib.Path('/home/kavi/Downloads/amd_octa_data/patient_id/')
 cfg.d_model = pathlib.Path('/home/kavi/Downloads/amd_octa_data/trained_models/')
+# the dataset is shared with the repeat workers through a copy on disk in this directory
+cfg.d_store = pathlib.Path('/home/kavi/Downloads/amd_octa_data/store/')
 
 # specify the loading mode: 'csv' vs 'folder'
 # if csv, then loading based on a csv file
@@ -84,12 +88,16 @@ cfg.overwrite = True
 cfg.balanced = False
 cfg.cv_mode = False
 cfg.oversample = False
-cfg.oversample_method = 'smote'
+cfg.oversample_method = 'random'
 cfg.decimate = False
 cfg.random_seed = 68
 cfg.use_random_seed = False
 cfg.binary_class = False
 cfg.n_repeats = 10
+# number of repeats trained at the same time, one repeat after another if None
+cfg.n_repeat_workers = None
+# the model is built once and reset for every repeat
+cfg.cache_model = True
 
 vec_idx_healthy = [1, 250]
 vec_idx_dry_amd = [1, 250]
@@ -111,70 +119,82 @@ np.random.seed(cfg.random_seed)
 if cfg.str_feature != 'disease':
     raise Exception('You should run the feature training in CV mode')
 
-for i in range(cfg.n_repeats):
-    print("\n\nIteration: {}".format(i + 1))
+# the repeats are trained in spawned worker processes if n_repeat_workers is set, which import this script again
+if __name__ == '__main__':
+    # Preprocessing, the images are loaded once and every repeat is a different split of them
+    data = data_loading(vec_idx_patient, cfg)
+    vec_Xs, vec_ys = preprocess_repeated(vec_idx_patient, cfg, data=data)
+
+    if cfg.n_repeat_workers is None:
+        for i in range(cfg.n_repeats):
+            print("\n\nIteration: {}".format(i + 1))
+
+            Xs = vec_Xs[i]
+            ys = vec_ys[i]
+
+            print("\nx_train Angiography cube shape: {}".format(Xs[0][0].shape))
+            print("x_train Structure OCT cube shape: {}".format(Xs[0][1].shape))
+            print("x_train B scan shape: {}".format(Xs[0][2].shape))
+            print("y_train onehot shape: {}".format(ys[0].shape))
+
+            print("\nx_valid Angiography cube shape: {}".format(Xs[1][0].shape))
+            print("x_valid Structure OCT cube shape: {}".format(Xs[1][1].shape))
+            print("x_valid B scan shape: {}".format(Xs[1][2].shape))
+            print("y_valid onehot shape: {}".format(ys[1].shape))
+
+            print("\nx_test Angiography cube shape: {}".format(Xs[2][0].shape))
+            print("x_test Structure OCT cube shape: {}".format(Xs[2][1].shape))
+            print("x_test B scan shape: {}".format(Xs[2][2].shape))
+            print("y_test onehot shape: {}".format(ys[2].shape))
+
+            model = get_model('arch_022', cfg)
+            callbacks = get_callbacks(cfg)
+
+            h = model.fit(get_dataset(Xs[0], ys[0], cfg.batch_size, n_inputs=len(model.inputs)), epochs=cfg.n_epoch,
+                          verbose=2, callbacks=callbacks,
+                          class_weight=dict(enumerate(cfg.vec_class_weight[i])) if cfg.vec_class_weight else None,
+                          validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=len(model.inputs)))
+
+            # Now perform prediction
+            train_set_score = model.evaluate(get_dataset(Xs[0], ys[0], n_inputs=len(model.inputs)),
+                                             callbacks=callbacks, verbose=0)
+            valid_set_score = model.evaluate(get_dataset(Xs[1], ys[1], n_inputs=len(model.inputs)),
+                                             callbacks=callbacks, verbose=0)
+            test_set_score = model.evaluate(get_dataset(Xs[2], ys[2], n_inputs=len(model.inputs)),
+                                            callbacks=callbacks, verbose=0)
+
+            vec_train_acc.append(train_set_score[1])
+            vec_valid_acc.append(valid_set_score[1])
+            vec_test_acc.append(test_set_score[1])
+
+            if cfg.num_classes == 2:
+                y_true = ys[-1]
+                y_pred = model.predict(get_dataset(Xs[2], n_inputs=len(model.inputs)))
+                y_pred[y_pred >= 0.5] = 1
+                y_pred[y_pred < 0.5] = 0
+                y_pred = y_pred.reshape(-1)
+            else:
+                y_true = np.argmax(ys[-1], axis=1)
+                y_pred = np.argmax(model.predict(get_dataset(Xs[2], n_inputs=len(model.inputs))), axis=1)
+
+            vec_y_true.append(y_true)
+            vec_y_pred.append(y_pred)
 
-    # Preprocessing
-    #Xs, ys = preprocess(vec_idx_healthy, vec_idx_dry_amd, vec_idx_cnv, cfg)
-    Xs, ys = preprocess(vec_idx_patient, cfg)
-
-
-    print("\nx_train Angiography cube shape: {}".format(Xs[0][0].shape))
-    print("x_train Structure OCT cube shape: {}".format(Xs[0][1].shape))
-    print("x_train B scan shape: {}".format(Xs[0][2].shape))
-    print("y_train onehot shape: {}".format(ys[0].shape))
-
-    print("\nx_valid Angiography cube shape: {}".format(Xs[1][0].shape))
-    print("x_valid Structure OCT cube shape: {}".format(Xs[1][1].shape))
-    print("x_valid B scan shape: {}".format(Xs[1][2].shape))
-    print("y_valid onehot shape: {}".format(ys[1].shape))
-
-    print("\nx_test Angiography cube shape: {}".format(Xs[2][0].shape))
-    print("x_test Structure OCT cube shape: {}".format(Xs[2][1].shape))
-    print("x_test B scan shape: {}".format(Xs[2][2].shape))
-    print("y_test onehot shape: {}".format(ys[2].shape))
-
-    model = get_model('arch_022', cfg)
-    callbacks = get_callbacks(cfg)
-
-    h = model.fit(Xs[0], ys[0], batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks,
-                  validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
-
-    # Now perform prediction
-    train_set_score = model.evaluate(Xs[0], ys[0], callbacks=callbacks, verbose=0)
-    valid_set_score = model.evaluate(Xs[1], ys[1], callbacks=callbacks, verbose=0)
-    test_set_score = model.evaluate(Xs[2], ys[2], callbacks=callbacks, verbose=0)
-
-    vec_train_acc.append(train_set_score[1])
-    vec_valid_acc.append(valid_set_score[1])
-    vec_test_acc.append(test_set_score[1])
-
-    if cfg.num_classes == 2:
-        y_true = ys[-1]
-        y_pred = model.predict(Xs[2])
-        y_pred[y_pred >= 0.5] = 1
-        y_pred[y_pred < 0.5] = 0
-        y_pred = y_pred.reshape(-1)
     else:
-        y_true = np.argmax(ys[-1], axis=1)
-        y_pred = np.argmax(model.predict(Xs[2]), axis=1)
-
-    vec_y_true.append(y_true)
-    vec_y_pred.append(y_pred)
-
-    Xs = []
-    ys = []
+        _, vec_acc, vec_y_true, vec_y_pred = train_cv_parallel(data[0], vec_Xs, vec_ys, cfg, 'arch_022',
+                                                               n_workers=cfg.n_repeat_workers, save=False)
+        vec_train_acc, vec_valid_acc, vec_test_acc = [list(x) for x in zip(*vec_acc)]
 
-print("Average train set accuracy: {} + ".format(np.mean(vec_train_acc)), np.std(vec_train_acc))
-print("Average valid set accuracy: {} + ".format(np.mean(vec_valid_acc)), np.std(vec_valid_acc))
-print("Average test set accuracy: {} + ".format(np.mean(vec_test_acc)), np.std(vec_test_acc))
+    print("Average train set accuracy: {} + ".format(np.mean(vec_train_acc)), np.std(vec_train_acc))
+    print("Average valid set accuracy: {} + ".format(np.mean(vec_valid_acc)), np.std(vec_valid_acc))
+    print("Average test set accuracy: {} + ".format(np.mean(vec_test_acc)), np.std(vec_test_acc))
 
-y_true = np.concatenate(vec_y_true, axis=0)
-y_pred = np.concatenate(vec_y_pred, axis=0)
+    y_true = np.concatenate(vec_y_true, axis=0)
+    y_pred = np.concatenate(vec_y_pred, axis=0)
 
-f_model = "{}_{}".format(cfg.str_model, time.strftime("%Y%m%d_%H%M%S"))
-cfg.p_figure = pathlib.Path('/home/kavi/Downloads/conf_matrix_repeated_seed_fixed/') / cfg.str_model / f_model
-cfg.p_figure.mkdir(exist_ok=True, parents=True)
+    f_model = "{}_{}".format(cfg.str_model, time.strftime("%Y%m%d_%H%M%S"))
+    cfg.p_figure = pathlib.Path('/home/kavi/Downloads/conf_matrix_repeated_seed_fixed/') / cfg.str_model / f_model
+    cfg.p_figure.mkdir(exist_ok=True, parents=True)
 
-plot_raw_conf_matrix(y_true, y_pred, cfg, save=True, f_figure=cfg.str_model)
-plot_norm_conf_matrix(y_true, y_pred, cfg, save=True, f_figure=cfg.str_model)
+    plot_raw_conf_matrix(y_true, y_pred, cfg, save=True, f_figure=cfg.str_model)
+    plot_norm_conf_matrix(y_true, y_pred, cfg, save=True, f_figure=cfg.str_model)
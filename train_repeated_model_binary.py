@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 from config.load_config import get_config
 from preprocess import preprocess
 from model import get_model, get_callbacks, get_model_binary
+from data_pipeline import get_dataset
 from plotting import plot_norm_conf_matrix, plot_raw_conf_matrix
 
 # Configuring the files here for now
@@ -109,40 +110,35 @@ for i in range(cfg.n_repeats):
     #
     if cfg.decimate:
         n_train_decimate = round(n_train / 2)
+        # all inputs are decimated, including the 3D bscan cube, without modifying the training set itself
+        x_train = [x[:n_train_decimate] for x in Xs[0]]
+        y_train = ys[0][:n_train_decimate]
+    else:
         x_train = Xs[0]
         y_train = ys[0]
 
-        x_train[0] = x_train[0][:n_train_decimate, :, :, :, :]
-        x_train[1] = x_train[1][:n_train_decimate, :, :, :, :]
-        x_train[2] = x_train[2][:n_train_decimate, :, :, :]
-
-        y_train = y_train[:n_train_decimate, :]
-
     model = get_model('arch_010', cfg)
     callbacks = get_callbacks(cfg)
 
-    if not cfg.decimate:
-        h = model.fit(Xs[0], ys[0], batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks,
-                      validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
-
-    else:
-        h = model.fit(x_train, y_train, batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks,
-                      validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
+    h = model.fit(get_dataset(x_train, y_train, cfg.batch_size, n_inputs=len(model.inputs)), epochs=cfg.n_epoch,
+                  verbose=2, callbacks=callbacks,
+                  class_weight=dict(enumerate(cfg.vec_class_weight)) if cfg.vec_class_weight else None,
+                  validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=len(model.inputs)))
 
     # Now perform prediction
-    if not cfg.decimate:
-        train_set_score = model.evaluate(Xs[0], ys[0], callbacks=callbacks, verbose=0)
-    else:
-        train_set_score = model.evaluate(x_train, y_train, callbacks=callbacks, verbose=0)
-    valid_set_score = model.evaluate(Xs[1], ys[1], callbacks=callbacks, verbose=0)
-    test_set_score = model.evaluate(Xs[2], ys[2], callbacks=callbacks, verbose=0)
+    train_set_score = model.evaluate(get_dataset(x_train, y_train, n_inputs=len(model.inputs)), callbacks=callbacks,
+                                     verbose=0)
+    valid_set_score = model.evaluate(get_dataset(Xs[1], ys[1], n_inputs=len(model.inputs)), callbacks=callbacks,
+                                     verbose=0)
+    test_set_score = model.evaluate(get_dataset(Xs[2], ys[2], n_inputs=len(model.inputs)), callbacks=callbacks,
+                                    verbose=0)
 
     vec_train_acc.append(train_set_score[1])
     vec_valid_acc.append(valid_set_score[1])
     vec_test_acc.append(test_set_score[1])
 
     y_true = ys[-1]
-    y_pred = model.predict(Xs[2])
+    y_pred = model.predict(get_dataset(Xs[2], n_inputs=len(model.inputs)))
     y_pred[y_pred >= 0.5] = 1
     y_pred[y_pred < 0.5] = 0
 
@@ -4,6 +4,7 @@ from pathlib import Path
 from config.load_config import get_config
 from preprocess import preprocess
 from model import get_model, get_callbacks, get_model_binary
+from data_pipeline import get_dataset
 from utils.io_funcs import *
 from plotting import plot_norm_conf_matrix, plot_raw_conf_matrix, plot_training_loss, plot_training_acc
 
@@ -96,8 +97,10 @@ print("y_test onehot shape: {}".format(ys[2].shape))
 model = get_model('arch_010', cfg)
 callbacks = get_callbacks(cfg)
 
-h = model.fit(Xs[0], ys[0], batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks,
-              validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
+h = model.fit(get_dataset(Xs[0], ys[0], cfg.batch_size, n_inputs=len(model.inputs)), epochs=cfg.n_epoch,
+              verbose=2, callbacks=callbacks,
+              class_weight=dict(enumerate(cfg.vec_class_weight)) if cfg.vec_class_weight else None,
+              validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=len(model.inputs)))
 cfg.history = h.history
 
 # save trained models
@@ -108,16 +111,16 @@ plot_training_loss(h, cfg, save=True)
 plot_training_acc(h, cfg, save=True)
 
 # Now perform prediction
-train_set_score = model.evaluate(Xs[0], ys[0], callbacks=callbacks, verbose=0)
-valid_set_score = model.evaluate(Xs[1], ys[1], callbacks=callbacks, verbose=0)
-test_set_score = model.evaluate(Xs[2], ys[2], callbacks=callbacks, verbose=0)
+train_set_score = model.evaluate(get_dataset(Xs[0], ys[0], n_inputs=len(model.inputs)), callbacks=callbacks, verbose=0)
+valid_set_score = model.evaluate(get_dataset(Xs[1], ys[1], n_inputs=len(model.inputs)), callbacks=callbacks, verbose=0)
+test_set_score = model.evaluate(get_dataset(Xs[2], ys[2], n_inputs=len(model.inputs)), callbacks=callbacks, verbose=0)
 
 print("\nTrain set accuracy: {}".format(train_set_score[1]))
 print("Valid set accuracy: {}".format(valid_set_score[1]))
 print("Test set accuracy: {}".format(test_set_score[1]))
 
 y_true = ys[-1]
-y_pred = model.predict(Xs[2])
+y_pred = model.predict(get_dataset(Xs[2], n_inputs=len(model.inputs)))
 y_pred[y_pred >= 0.5] = 1
 y_pred[y_pred < 0.5] = 0
 
@@ -5,6 +5,7 @@ import numpy as np
 from config.load_config import get_config
 from preprocess import preprocess_cv
 from model import get_model, get_callbacks
+from data_pipeline import get_dataset
 from utils.io_funcs import *
 from utils.get_patient_id import get_patient_id_by_label
 from plotting import plot_training_loss, plot_training_acc, plot_raw_conf_matrix, plot_norm_conf_matrix
@@ -84,11 +85,14 @@ cfg.overwrite = True
 
 cfg.balanced = False
 cfg.oversample = False
-cfg.oversample_method = 'smote'
+cfg.oversample_method = 'random'
 cfg.random_seed = 68
 cfg.use_random_seed = True
 cfg.binary_class = False
 
+# the model is built once and reset for every fold
+cfg.cache_model = True
+
 vec_idx_patient = [1, 310]
 
 # Preprocessing
@@ -126,8 +130,15 @@ for idx_fold in range(len(vec_Xs)):
     model_curr = get_model('arch_009', cfg)
     callbacks_curr = get_callbacks(cfg)
 
-    h = model_curr.fit(Xs[0], ys[0], batch_size=cfg.batch_size, epochs=cfg.n_epoch, verbose=2, callbacks=callbacks_curr,
-                       validation_data=(Xs[1], ys[1]), shuffle=False, validation_batch_size=Xs[1][0].shape[0])
+    # class weights are only set by the 'weight' oversampling method
+    class_weight_curr = None
+    if cfg.vec_class_weight is not None and cfg.vec_class_weight[idx_fold] is not None:
+        class_weight_curr = dict(enumerate(cfg.vec_class_weight[idx_fold]))
+
+    h = model_curr.fit(get_dataset(Xs[0], ys[0], cfg.batch_size, n_inputs=len(model_curr.inputs)), epochs=cfg.n_epoch,
+                       verbose=2, callbacks=callbacks_curr,
+                       class_weight=class_weight_curr,
+                       validation_data=get_dataset(Xs[1], ys[1], cfg.batch_size, n_inputs=len(model_curr.inputs)))
     vec_history.append(h.history)
 
     # save trained models
@@ -138,9 +149,12 @@ for idx_fold in range(len(vec_Xs)):
     plot_training_acc(h, cfg, save=True)
 
     # Now perform prediction
-    train_set_score = model_curr.evaluate(Xs[0], ys[0], callbacks=callbacks_curr, verbose=0)
-    valid_set_score = model_curr.evaluate(Xs[1], ys[1], callbacks=callbacks_curr, verbose=0)
-    test_set_score = model_curr.evaluate(Xs[2], ys[2], callbacks=callbacks_curr, verbose=0)
+    train_set_score = model_curr.evaluate(get_dataset(Xs[0], ys[0], n_inputs=len(model_curr.inputs)),
+                                          callbacks=callbacks_curr, verbose=0)
+    valid_set_score = model_curr.evaluate(get_dataset(Xs[1], ys[1], n_inputs=len(model_curr.inputs)),
+                                          callbacks=callbacks_curr, verbose=0)
+    test_set_score = model_curr.evaluate(get_dataset(Xs[2], ys[2], n_inputs=len(model_curr.inputs)),
+                                         callbacks=callbacks_curr, verbose=0)
 
     print("\nTrain set accuracy: {}".format(train_set_score[1]))
     print("Valid set accuracy: {}".format(valid_set_score[1]))
@@ -150,14 +164,14 @@ for idx_fold in range(len(vec_Xs)):
 
     if cfg.num_classes == 2:
         y_true = ys[-1]
-        y_pred = model_curr.predict(Xs[2])
+        y_pred = model_curr.predict(get_dataset(Xs[2], n_inputs=len(model_curr.inputs)))
         y_pred[y_pred >= 0.5] = 1
         y_pred[y_pred < 0.5] = 0
         y_pred = y_pred.reshape(-1)
 
     else:
         y_true = np.argmax(ys[-1], axis=1)
-        y_pred = np.argmax(model_curr.predict(Xs[2]), axis=1)
+        y_pred = np.argmax(model_curr.predict(get_dataset(Xs[2], n_inputs=len(model_curr.inputs))), axis=1)
 
     # plot the confusion matrices
     plot_raw_conf_matrix(y_true, y_pred, cfg, save=True)
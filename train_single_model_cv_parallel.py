@@ -0,0 +1,163 @@
+import os
+import pathlib
+import numpy as np
+
+from config.load_config import get_config
+from preprocess import data_loading, preprocess_cv
+from cv_parallel import train_cv_parallel
+from utils.io_funcs import *
+from utils.get_patient_id import get_patient_id_by_label
+from plotting import plot_raw_conf_matrix, plot_norm_conf_matrix
+
+
+# Configuring the files here for now
+cfg = get_config(filename=pathlib.Path(os.getcwd()) / 'config' / 'default_config.yml')
+# cfg.d_data = pathlib.Path('/home/jyao/local/data/amd_octa/orig/')
+cfg.d_data = pathlib.Path('/home/jyao/local/data/amd_octa/FinalData/')
+cfg.d_model = pathlib.Path('/home/jyao/local/data/amd_octa/trained_models/')
+# the dataset is shared with the fold workers through a copy on disk in this directory
+cfg.d_store = pathlib.Path('/home/jyao/local/data/amd_octa/store/')
+
+# specify the loading mode: 'csv' vs 'folder'
+# if csv, then loading based on a csv file
+# if folder, then loading based on existing folder structure
+cfg.load_mode = 'csv'
+# cfg.load_mode = 'folder'
+cfg.d_csv = pathlib.Path('/home/jyao/local/data/amd_octa/')
+cfg.f_csv = 'DiseaseLabelsThrough305.csv'
+
+# name of particular feature that will be used
+# note if want to test for disease label then have to specify this to be disease
+# otherwise it has to match what's in the CSV file column header
+cfg.vec_all_str_feature = ['disease', 'IRF/SRF', 'Scar', 'GA', 'CNV', 'PED']
+
+cfg.str_feature = 'disease'
+cfg.vec_str_labels = ['Normal', 'NNV AMD', 'NV AMD']
+
+# cfg.str_feature = 'Scar'
+# cfg.vec_str_labels = ['Not Present', 'Possible', 'Present']
+
+cfg.str_healthy = 'Normal'
+cfg.label_healthy = 0
+cfg.str_dry_amd = 'Dry AMD'
+cfg.label_dry_amd = 1
+cfg.str_cnv = 'CNV'
+cfg.label_cnv = 2
+cfg.num_classes = 3
+
+cfg.num_octa = 5
+cfg.str_angiography = 'Angiography'
+cfg.str_structure = 'Structure'
+cfg.str_bscan = 'B-Scan'
+
+cfg.vec_str_layer = ['Deep', 'Avascular', 'ORCC', 'Choriocapillaris', 'Choroid']
+cfg.vec_str_layer_bscan3d = ['1', '2', '3', '4', '5']
+cfg.dict_layer_order = {'Deep': 0,
+                        'Avascular': 1,
+                        'ORCC': 2,
+                        'Choriocapillaris': 3,
+                        'Choroid': 4}
+cfg.dict_layer_order_bscan3d = {'1': 0,
+                                '2': 1,
+                                '3': 2,
+                                '4': 3,
+                                '5': 4}
+cfg.str_bscan_layer = 'Flow'
+cfg.dict_str_patient_label = {}
+
+cfg.cv_mode = True
+cfg.num_cv_fold = 5
+
+cfg.downscale_size = [256, 256]
+cfg.crop_size = [int(np.round(cfg.downscale_size[1] * 1.5/7.32)),
+                 int(np.round(cfg.downscale_size[1] * 1.8/7.32))]
+# cfg.crop_size = None
+cfg.per_train = 0.6
+cfg.per_valid = 0.2
+cfg.per_test = 0.2
+
+cfg.n_epoch = 1000
+cfg.batch_size = 8
+cfg.es_patience = 20
+cfg.es_min_delta = 1e-5
+cfg.lr = 5e-5
+cfg.lam = 1e-5
+cfg.overwrite = True
+
+cfg.balanced = False
+cfg.oversample = False
+cfg.oversample_method = 'random'
+cfg.random_seed = 68
+cfg.use_random_seed = True
+cfg.binary_class = False
+
+# the model is built once and reset for every fold
+cfg.cache_model = True
+
+# folds are views of the full dataset, which is shared with the workers instead of copied for each fold
+cfg.cv_fold_view = True
+# number of folds trained at the same time and number of threads of each, split evenly across the cores if None
+cfg.n_cv_workers = None
+cfg.n_cv_threads = None
+
+vec_idx_patient = [1, 310]
+
+# the folds are trained in spawned worker processes, which import this script again
+if __name__ == '__main__':
+    # Preprocessing
+    data = data_loading(vec_idx_patient, cfg)
+    vec_Xs, vec_ys = preprocess_cv(vec_idx_patient, cfg, data=data)
+
+    # Train all folds in parallel
+    vec_history, vec_acc, vec_y_true, vec_y_pred = train_cv_parallel(data[0], vec_Xs, vec_ys, cfg, 'arch_009')
+    cfg.vec_acc = vec_acc[-1]
+
+    # Now we are outside of the loop
+    y_true_unsorted_all = np.concatenate(vec_y_true, axis=-1)
+    y_pred_unsorted_all = np.concatenate(vec_y_pred, axis=-1)
+
+    # Now obtain the correct indices
+    vec_idx_absolute_test_all = []
+    for idx_fold in range(len(vec_Xs)):
+        vec_idx_test_curr = cfg.vec_idx_absolute[idx_fold][-1]
+        vec_idx_absolute_test_all.append(vec_idx_test_curr)
+    vec_idx_absolute_test_all = np.concatenate(vec_idx_absolute_test_all, -1)
+
+    # Now get all the test set data
+    idx_permutation_sort = np.argsort(vec_idx_absolute_test_all)
+
+    y_true_all = y_true_unsorted_all[idx_permutation_sort]
+    y_pred_all = y_pred_unsorted_all[idx_permutation_sort]
+
+    cfg.y_test_true = y_true_all
+    cfg.y_test_pred = y_pred_all
+
+    print("\nOverall accuracy: {}".format(np.sum(y_true_all == y_pred_all)/len(y_true_all)))
+
+    # Print out the patient IDs corresponding to the query
+    # Here for example
+    # if you are running 'disease' label and you set true_label_id = 0 and predicted_label_id = 2
+    # then you would get the patients who are normal/healthy and but falsely classified as NV AMD
+    # the true_label_id and predicted_label_id correspond to cfg.vec_str_labels defined above
+    # print(get_patient_id_by_label(y_true_all, y_pred_all, true_label_id=0, predicted_label_id=2, cfg=cfg))
+
+    # you can also print multiple of these at the same time
+    # print(get_patient_id_by_label(y_true_all, y_pred_all, true_label_id=2, predicted_label_id=1, cfg=cfg))
+
+    # Extra caveat: for feature labels since we don't have possible any more and since the classes
+    # are automatically recasted to get the FN (patient has the feature but network predicts not present)
+    # you need to do something like
+    print(get_patient_id_by_label(y_true_all, y_pred_all, true_label_id=1, predicted_label_id=0, cfg=cfg))
+
+    # Plot and save the final result
+    plot_raw_conf_matrix(y_true_all, y_pred_all, cfg, save=True, cv_all=True)
+    plot_norm_conf_matrix(y_true_all, y_pred_all, cfg, save=True, cv_all=True)
+
+    # append final training history
+    cfg.vec_history = vec_history
+
+    # save the output as a csv file also
+    save_csv(y_true_all, y_pred_all, cfg)
+
+    # save the cfg, which contains configurations and results
+    save_cfg(cfg, overwrite=True)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pathlib
+import pickle
+import shutil
+
+import numpy as np
+
+from utils.manifest import load_manifest, get_manifest_patients, get_manifest_fingerprint
+
+
+# names of the files holding the four input tensors
+VEC_STR_X_STORE = ['x_angiography', 'x_structure', 'x_bscan', 'x_bscan3d']
+
+# configuration fields that are set as a side effect of loading and need to be restored when opening the store
+VEC_STR_CFG_STORE = ['n_healthy', 'n_dry_amd', 'n_cnv', 'y_unique_label', 'num_classes', 'binary_class',
+                     'vec_str_labels', 'pd_csv', 'out_csv', 'vec_csv_col']
+
+
+def get_dataset_store_path(vec_idx_patient, cfg):
+    """
+    Obtains the directory of the dataset store that corresponds to the current loading configuration. This has to be
+    called before loading since loading in csv mode modifies some of the fields in cfg. The images in d_data are only
+    part of the key if cfg.f_manifest is set, through the images the manifest records for the requested patients, so
+    without a manifest a store is reused even after images were added, removed or replaced and has to be deleted by
+    hand. With a manifest, images replaced in place are only picked up with cfg.check_manifest_images or
+    cfg.rebuild_manifest, see load_manifest
+
+    :param vec_idx_patient: list in the form of [start_idx, end_idx]
+    :param cfg: configuration file set by the user
+    :return: absolute path to the directory of the dataset store
+    """
+    if cfg.d_store is None or cfg.store_load_mode is None:
+        raise Exception('Need to provide the store directory and the underlying load mode if using store load mode')
+
+    vec_key = [cfg.store_load_mode, list(vec_idx_patient), str(cfg.d_data), list(cfg.downscale_size),
+               None if cfg.crop_size is None else list(cfg.crop_size), cfg.num_octa, cfg.str_angiography,
+               cfg.str_structure, cfg.str_bscan, list(cfg.vec_str_layer), list(cfg.vec_str_layer_bscan3d),
+               cfg.str_bscan_layer, sorted(cfg.dict_layer_order.items()), sorted(cfg.dict_layer_order_bscan3d.items()),
+               cfg.storage_dtype, cfg.image_backend]
+
+    if cfg.store_load_mode == 'csv':
+        # the labels come from the csv file, so it is part of the key too
+        stat_csv = os.stat(str(cfg.d_csv / cfg.f_csv))
+        vec_key.extend([str(cfg.d_csv / cfg.f_csv), stat_csv.st_size, stat_csv.st_mtime_ns, cfg.str_feature])
+    else:
+        vec_key.extend([cfg.binary_class, cfg.binary_mode, cfg.str_healthy, cfg.label_healthy, cfg.str_dry_amd,
+                        cfg.label_dry_amd, cfg.str_cnv, cfg.label_cnv])
+
+    if cfg.f_manifest is not None:
+        # all classes are covered in folder mode, whichever of them the binary mode loads
+        vec_str_class = None if cfg.store_load_mode == 'csv' else [cfg.str_healthy, cfg.str_dry_amd, cfg.str_cnv]
+        vec_str_patient = get_manifest_patients(vec_idx_patient, vec_str_class)
+        manifest = load_manifest(cfg.f_manifest, cfg.d_data, rebuild=cfg.rebuild_manifest,
+                                 vec_str_patient=vec_str_patient, check_images=cfg.check_manifest_images)
+        vec_key.append(get_manifest_fingerprint(manifest, vec_str_patient))
+
+    str_hash = hashlib.sha1(repr(vec_key).encode('utf-8')).hexdigest()
+
+    return pathlib.Path(cfg.d_store) / '{}_{}'.format(cfg.store_load_mode, str_hash[:16])
+
+
+def dataset_store_exists(p_store):
+    """
+    Tests if a complete dataset store is available
+
+    :param p_store: absolute path to the directory of the dataset store
+    :return: True if the store has been fully written
+    """
+    return (pathlib.Path(p_store) / 'cfg_store').exists()
+
+
+def save_dataset_store(p_store, X, y, cfg):
+    """
+    Writes the output of data_loading into the dataset store. Everything is written into a temporary directory first
+    and only moved in place once complete, so that a crash never leaves a partial store behind
+
+    :param p_store: absolute path to the directory of the dataset store
+    :param X: list in the form [x_angiography, x_structure, x_bscan, x_bscan3d]
+    :param y: numpy array of labels
+    :param cfg: configuration file set by the user, after data_loading has been called
+    """
+    p_store = pathlib.Path(p_store)
+    p_store_tmp = p_store.with_name('{}.{}.tmp'.format(p_store.name, os.getpid()))
+    p_store_tmp.mkdir(parents=True, exist_ok=True)
+
+    for str_x, x in zip(VEC_STR_X_STORE, X):
+        np.save(str(p_store_tmp / '{}.npy'.format(str_x)), x)
+    np.save(str(p_store_tmp / 'y.npy'), np.asarray(y))
+
+    if cfg.store_load_mode == 'csv':
+        np.save(str(p_store_tmp / 'vec_str_patient.npy'), np.asarray(cfg.vec_str_patients))
+        np.save(str(p_store_tmp / 'vec_out_csv_idx.npy'), np.asarray(cfg.vec_out_csv_idx))
+    else:
+        np.save(str(p_store_tmp / 'vec_str_patient.npy'), np.asarray(cfg.vec_str_patient))
+
+    dict_cfg_store = {str_field: cfg[str_field] for str_field in VEC_STR_CFG_STORE if str_field in cfg}
+    with open(str(p_store_tmp / 'cfg_store'), 'wb') as handle:
+        pickle.dump(dict_cfg_store, handle)
+
+    if p_store.exists():
+        shutil.rmtree(str(p_store))
+    os.replace(str(p_store_tmp), str(p_store))
+
+
+def open_dataset_store(p_store, cfg):
+    """
+    Opens the dataset store with the input tensors memory-mapped in read-only mode, so that multiple processes share
+    the same page cache, and restores the fields that data_loading would have set in cfg
+
+    :param p_store: absolute path to the directory of the dataset store
+    :param cfg: configuration file set by the user
+    :return: a tuple in the form [x_angiography, x_structure, x_bscan, x_bscan3d], y
+    """
+    p_store = pathlib.Path(p_store)
+
+    X = [np.load(str(p_store / '{}.npy'.format(str_x)), mmap_mode='r') for str_x in VEC_STR_X_STORE]
+    y = np.load(str(p_store / 'y.npy'))
+
+    with open(str(p_store / 'cfg_store'), 'rb') as handle:
+        dict_cfg_store = pickle.load(handle)
+    for str_field, value in dict_cfg_store.items():
+        cfg[str_field] = value
+
+    vec_str_patient = np.load(str(p_store / 'vec_str_patient.npy'))
+    if cfg.store_load_mode == 'csv':
+        cfg.vec_str_patients = vec_str_patient.tolist()
+        cfg.vec_out_csv_idx = np.load(str(p_store / 'vec_out_csv_idx.npy')).tolist()
+    else:
+        cfg.vec_str_patient = vec_str_patient
+
+    return X, y
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import pathlib
+
+import numpy as np
+
+
+def get_image_cache_path(d_cache, f_image, downscale_size, bool_crop=False, crop_size=None, image_backend=None):
+    """
+    Obtains the path of the cache entry of a single resized image. The entry is addressed by the hash of the source
+    path, its size and modification time and the resizing parameters, so any change to the source image or to the
+    preprocessing configuration results in a different entry
+
+    :param d_cache: directory holding the cached images
+    :param f_image: absolute path to a single image
+    :param downscale_size: desired final size of the loaded images, e.g. (256, 256)
+    :param bool_crop: whether or not the image is cropped after resizing
+    :param crop_size: desired number of pixels to exclude from analysis for bscan images, e.g. [50, 60]
+    :param image_backend: backend used for decoding and resizing the image, 'skimage' if None
+    :return: absolute path to the cache entry
+    """
+    stat_image = os.stat(f_image)
+    str_key = repr((os.path.abspath(f_image), stat_image.st_size, stat_image.st_mtime_ns,
+                    tuple(downscale_size), tuple(crop_size) if bool_crop else None))
+    # entries of the default backend keep the key they had before the backend could be chosen
+    if image_backend is not None and image_backend != 'skimage':
+        str_key += repr(image_backend)
+    str_hash = hashlib.sha1(str_key.encode('utf-8')).hexdigest()
+
+    return pathlib.Path(d_cache) / str_hash[:2] / '{}.npy'.format(str_hash)
+
+
+def load_cached_image(f_cache):
+    """
+    Loads a resized image from the cache and marks it as recently used
+
+    :param f_cache: absolute path to the cache entry
+    :return: the cached image, or None if the entry does not exist or cannot be read
+    """
+    try:
+        img = np.load(str(f_cache))
+    except (OSError, ValueError):
+        return None
+
+    # update the modification time so that eviction removes the least recently used entries first
+    os.utime(str(f_cache), None)
+
+    return img
+
+
+def save_cached_image(f_cache, img):
+    """
+    Writes a resized image into the cache. The file is written under a temporary name first so that concurrent
+    readers never see a partially written entry
+
+    :param f_cache: absolute path to the cache entry
+    :param img: resized image to be cached
+    """
+    f_cache = pathlib.Path(f_cache)
+    f_cache.parent.mkdir(parents=True, exist_ok=True)
+
+    f_cache_tmp = f_cache.with_name('{}.{}.tmp'.format(f_cache.stem, os.getpid()))
+    with open(str(f_cache_tmp), 'wb') as handle:
+        np.save(handle, img)
+    os.replace(str(f_cache_tmp), str(f_cache))
+
+
+def evict_image_cache(d_cache, cache_size_limit):
+    """
+    Removes the least recently used entries until the total size of the cache falls below the limit
+
+    :param d_cache: directory holding the cached images
+    :param cache_size_limit: maximum total size of the cache in bytes, no eviction if None
+    """
+    if cache_size_limit is None or not pathlib.Path(d_cache).exists():
+        return
+
+    vec_entry = []
+    for f_cache in pathlib.Path(d_cache).glob('*/*.npy'):
+        stat_cache = f_cache.stat()
+        vec_entry.append((stat_cache.st_mtime_ns, stat_cache.st_size, f_cache))
+
+    total_size = sum(entry[1] for entry in vec_entry)
+    for _, size_cache, f_cache in sorted(vec_entry, key=lambda entry: entry[0]):
+        if total_size <= cache_size_limit:
+            break
+
+        f_cache.unlink()
+        total_size -= size_cache
@@ -5,7 +5,7 @@ import time
 import pickle
 
 
-def save_model(model, cfg, overwrite=True, save_format='tf', idx_cv_fold=None):
+def save_model(model, cfg, overwrite=True, save_format='tf', idx_cv_fold=None, f_model=None):
     """
     save the trained model
 
@@ -14,6 +14,8 @@ def save_model(model, cfg, overwrite=True, save_format='tf', idx_cv_fold=None):
     :param bool overwrite: whether or not to overwrite any existing model weights
     :param str save_format: format to save the weights in
     :param int idx_cv_fold: only relevant for cross validation mode, specify which fold it is
+    :param str f_model: only relevant for cross validation mode, name shared by all folds, e.g. when the folds are
+        trained in separate processes, derived from the time at which the first fold is saved if None
     """
     if not cfg.cv_mode:
         f_model = "{}_{}".format(cfg.str_model, time.strftime("%Y%m%d_%H%M%S"))
@@ -23,7 +25,9 @@ def save_model(model, cfg, overwrite=True, save_format='tf', idx_cv_fold=None):
         cfg.p_cfg = p_model
 
     else:
-        if idx_cv_fold == 0:
+        if f_model is not None:
+            cfg.f_model_cv = f_model
+        elif idx_cv_fold == 0:
             f_model = "{}_{}".format(cfg.str_model, time.strftime("%Y%m%d_%H%M%S"))
             cfg.f_model_cv = f_model
         else:
@@ -68,6 +72,43 @@ def load_model(model, cfg, name, **kwargs):
     model.load_weights(filepath=str(p_model / f_model), **kwargs)
 
 
+def load_model_cv(cfg, name, **kwargs):
+    """
+    load the model weights of every fold of a cross validation run and merge the folds into a single ensemble model,
+    so that new samples are scored by all folds in one batched call. As in load_model, cfg.p_figure is set to the
+    directory of the run so that the figures of the loaded model are saved next to its weights
+
+    :param cfg: configuration set by user, the architecture is built from cfg.str_model and cfg.sample_size
+    :param name: name of the cross validation run after the underscore
+    :param kwargs: additional arguments accepted by the tensorflow.keras.Model.load_weights() function
+    :return: model from get_ensemble_model, whose second output holds the probabilities averaged over the folds
+    """
+    # only imported here so that importing io_funcs does not build the model module
+    from model import get_model, get_ensemble_model
+
+    f_model = "{}_{}".format(cfg.str_model, name)
+    p_model = cfg.d_model / cfg.str_model / f_model
+    cfg.p_figure = p_model
+    vec_p_fold = sorted(p_model.glob('fold_*'), key=lambda p_fold: int(p_fold.name.split('_')[-1]))
+    if len(vec_p_fold) == 0:
+        raise Exception('No saved folds are available: check path setting')
+
+    # every fold needs a model of its own, which the model cache of get_model would only hand out once
+    bool_cache_model = cfg.cache_model
+    cfg.cache_model = False
+
+    vec_model = []
+    try:
+        for p_fold in vec_p_fold:
+            model = get_model(cfg.str_model, cfg)
+            model.load_weights(filepath=str(p_fold / f_model), **kwargs)
+            vec_model.append(model)
+    finally:
+        cfg.cache_model = bool_cache_model
+
+    return get_ensemble_model(vec_model)
+
+
 def load_config(cfg, name):
     """
     load saved configuration dictionaries
@@ -101,13 +142,17 @@ def save_csv(y_true_all, y_pred_all, cfg):
     out_csv = cfg.out_csv.copy()
     if cfg.str_feature == 'disease':
         cfg.y_unique_label = cfg.y_unique_label + 1
-    for i in range(len(cfg.vec_out_csv_idx)):
-        y_true_all_curr = y_true_all[i]
-        y_pred_all_curr = y_pred_all[i]
-        out_csv.loc[cfg.vec_out_csv_idx[i][0], out_csv.columns[cfg.vec_out_csv_idx[i][1]]] = cfg.y_unique_label[
-            int(y_pred_all_curr)]
-        if not pd_csv.loc[cfg.vec_out_csv_idx[i][0], pd_csv.columns[cfg.vec_out_csv_idx[i][1]]] == cfg.y_unique_label[
-            int(y_true_all_curr)]:
+
+    # write back the predictions one csv column at a time
+    vec_out_csv_idx = np.asarray(cfg.vec_out_csv_idx, dtype=int).reshape(-1, 2)
+    vec_label_true = cfg.y_unique_label[np.asarray(y_true_all).astype(int)]
+    vec_label_pred = cfg.y_unique_label[np.asarray(y_pred_all).astype(int)]
+    for idx_col in np.unique(vec_out_csv_idx[:, 1]):
+        idx_entry_col = vec_out_csv_idx[:, 1] == idx_col
+        vec_idx_row = vec_out_csv_idx[idx_entry_col, 0]
+
+        out_csv.loc[vec_idx_row, out_csv.columns[idx_col]] = vec_label_pred[idx_entry_col]
+        if not np.all(pd_csv.loc[vec_idx_row, pd_csv.columns[idx_col]].to_numpy() == vec_label_true[idx_entry_col]):
             raise Exception("Ground truth label not equal to csv file")
 
     idx_col_OD_feature = cfg.vec_csv_col[-2]
@@ -0,0 +1,373 @@
+import fnmatch
+import hashlib
+import json
+import os
+import pathlib
+import re
+
+import numpy as np
+
+from utils.patient_store import get_patient_fingerprint
+
+
+# subdirectories of each eye that hold the 2D OCTA images, the second one is the old folder structure
+VEC_STR_DIR_OCTA = ['OCTA', '2D Layers']
+
+
+def match_octa_image(f_image_name, str_angiography, str_structure, str_bscan, vec_str_layer, str_bscan_layer):
+    """
+    Identifies the image type and layer of a single 2D OCTA image from its filename
+
+    :param f_image_name: filename of a single image
+    :param str_angiography: identifier for angiography images in the filename
+    :param str_structure: identifier for structural OCT images in the filename
+    :param str_bscan: identifier for b-scan OCT images in the filename
+    :param vec_str_layer: list of strings that contain the relevant layers to be used for training
+    :param str_bscan_layer: string that contains the type of b-scan images to be used in filename, e.g. Flow
+    :return: list of all (str_image_type, str_layer) pairs matched by the filename, str_layer is None for b-scans
+    """
+    vec_hit = []
+    for str_image_type in [str_angiography, str_structure, str_bscan]:
+        if str_image_type == str_bscan:
+            re_pattern_bscan = '.*{} {}.bmp'.format(str_image_type, str_bscan_layer)
+
+            if re.findall(re_pattern_bscan, f_image_name, re.I):
+                vec_hit.append((str_image_type, None))
+        else:
+            for str_layer in vec_str_layer:
+                re_pattern_curr = '.*{}_{}.bmp'.format(str_image_type, str_layer)
+
+                if re.findall(re_pattern_curr, f_image_name, re.I):
+                    vec_hit.append((str_image_type, str_layer))
+
+    return vec_hit
+
+
+def match_bscan3d_images(vec_f_imageBscan3d, vec_str_layer_bscan3d, dict_layer_order_bscan3d):
+    """
+    Identifies the position of each 3D bscan image within the cube, either from the numbered filenames, e.g. 1.tiff,
+    or if none of these are present from the order of the timestamps at the end of the filenames
+
+    :param vec_f_imageBscan3d: list of absolute paths to individual bscan images from a single subject
+    :param vec_str_layer_bscan3d: list of strings that contain the relevant bscan images to be used for training
+    :param dict_layer_order_bscan3d: dictionary that contains the order in which the bscans cubes will be organized
+    :return: a tuple dictionary of the absolute paths keyed by the position in the cube, number of matched images
+    """
+    vec_vol_f_image_bscan3d_curr = {}
+
+    count_bscan3d_hit = 0
+    for f_image_bscan3d in vec_f_imageBscan3d:
+        p_f_image_bscan3d_filename = pathlib.Path(f_image_bscan3d).name
+
+        for str_layer_bscan3d in vec_str_layer_bscan3d:
+            if p_f_image_bscan3d_filename == '{}.tiff'.format(str_layer_bscan3d):
+                vec_vol_f_image_bscan3d_curr[dict_layer_order_bscan3d[str_layer_bscan3d]] = f_image_bscan3d
+                count_bscan3d_hit += 1
+
+    # in cases where no images were identified, try again with different pattern
+    if count_bscan3d_hit == 0:
+        # obtain the date strings at the end of the file
+        vec_img_timestamp = []
+        re_pattern_timestamp = '_O[DS]_(.*).tiff'
+        for f_image_bscan3d in vec_f_imageBscan3d:
+            p_f_image_bscan3d_filename = pathlib.Path(f_image_bscan3d).name
+
+            str_img_timestamp = re.search(re_pattern_timestamp, p_f_image_bscan3d_filename).group(1)
+            vec_img_timestamp.append(int(str_img_timestamp))
+        vec_img_timestamp = np.stack(vec_img_timestamp, axis=-1)
+        vec_img_timestamp = np.sort(vec_img_timestamp)
+
+        # do actual detection and addition to the dictionary
+        for f_image_bscan3d in vec_f_imageBscan3d:
+            p_f_image_bscan3d_filename = pathlib.Path(f_image_bscan3d).name
+
+            for idx_img_timestamp in range(len(vec_img_timestamp)):
+                img_timestamp = vec_img_timestamp[idx_img_timestamp]
+                re_pattern_curr = '.*_{}.tiff'.format(img_timestamp)
+                re_hits = re.findall(re_pattern_curr, p_f_image_bscan3d_filename, re.I)
+                if re_hits:
+                    vec_vol_f_image_bscan3d_curr[idx_img_timestamp] = f_image_bscan3d
+                    count_bscan3d_hit += 1
+
+    return vec_vol_f_image_bscan3d_curr, count_bscan3d_hit
+
+
+def build_manifest(d_data):
+    """
+    Walks the data directory once and records the 2D OCTA images and the 3D bscan images under every directory that
+    could be a patient, i.e. <patient>/<eye>/OCTA/*.bmp, <patient>/<eye>/2D Layers/*.bmp and <patient>/<eye>/*.tiff,
+    where <patient> is either <id> or <class>/<id>. Hidden files and directories are skipped just like with glob
+
+    :param pathlib.Path d_data: directory to the data
+    :return: dictionary holding the manifest
+    """
+    d_data = pathlib.Path(d_data)
+
+    dict_entry = {}
+    dict_mtime = {}
+    for d_curr, vec_d_child, vec_f_child in os.walk(str(d_data)):
+        vec_str_part = pathlib.Path(d_curr).relative_to(d_data).parts
+
+        # the modification time of a directory changes whenever files or directories directly inside it are added,
+        # removed or renamed
+        dict_mtime['/'.join(vec_str_part) or '.'] = os.stat(d_curr).st_mtime_ns
+
+        # the deepest directories of interest are <class>/<id>/<eye>/OCTA
+        vec_d_child[:] = sorted(s for s in vec_d_child if not s.startswith('.') and len(vec_str_part) < 4)
+
+        for f_child in sorted(vec_f_child):
+            if f_child.startswith('.'):
+                continue
+
+            # paths are stored relative to the patient directory, e.g. OD/OCTA/x.bmp or OD/1.tiff
+            if len(vec_str_part) >= 3 and vec_str_part[-1] in VEC_STR_DIR_OCTA and \
+                    fnmatch.fnmatchcase(f_child, '*.bmp'):
+                str_patient = '/'.join(vec_str_part[:-2])
+                str_category = vec_str_part[-1]
+                str_rel_image = '/'.join(vec_str_part[-2:] + (f_child,))
+            elif len(vec_str_part) >= 2 and fnmatch.fnmatchcase(f_child, '*.tiff'):
+                str_patient = '/'.join(vec_str_part[:-1])
+                str_category = 'tiff'
+                str_rel_image = '/'.join(vec_str_part[-1:] + (f_child,))
+            else:
+                continue
+
+            dict_patient = dict_entry.setdefault(str_patient, {})
+            dict_patient.setdefault(str_category, []).append(str_rel_image)
+
+    # images overwritten in place only change their own size and modification time
+    dict_fingerprint = {str_patient: _get_entry_fingerprint(d_data, str_patient, dict_patient)
+                        for str_patient, dict_patient in dict_entry.items()}
+
+    manifest = {'d_data': str(d_data), 'dict_mtime': dict_mtime, 'dict_fingerprint': dict_fingerprint,
+                'entries': dict_entry}
+
+    return manifest
+
+
+def load_manifest(f_manifest, d_data, rebuild=False, vec_str_patient=None, check_images=False):
+    """
+    Loads the manifest from file, building it first if it doesn't exist, if it was built for a different data
+    directory or if any directory of the requested patients has changed since it was built. Directories change when
+    files or directories directly inside them are added, removed or renamed, while images overwritten in place are
+    only detected with check_images or caught by rebuild
+
+    :param f_manifest: absolute path to the manifest file
+    :param pathlib.Path d_data: directory to the data
+    :param bool rebuild: whether or not to force rebuilding the manifest
+    :param vec_str_patient: list of the patient directories relative to d_data that will be loaded, e.g. Normal/5,
+        all directories in the manifest are checked if None
+    :param bool check_images: whether or not to also check the size and modification time of every image of the
+        requested patients, which costs one stat call per image
+    :return: dictionary holding the manifest
+    """
+    f_manifest = pathlib.Path(f_manifest)
+    if f_manifest.exists() and not rebuild:
+        with open(str(f_manifest), 'r') as handle:
+            manifest = json.load(handle)
+
+        if manifest['d_data'] == str(d_data) and _is_manifest_current(manifest, vec_str_patient, check_images):
+            return manifest
+
+    print('\nScanning {} for the dataset manifest'.format(d_data))
+    manifest = build_manifest(d_data)
+
+    f_manifest.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(f_manifest), 'w') as handle:
+        json.dump(manifest, handle, indent=1)
+
+    return manifest
+
+
+def get_manifest_patients(vec_idx, vec_str_class=None):
+    """
+    Obtains the directories of the patients that the loaders look up, including the old folder structure
+
+    :param vec_idx: list in the form of [start_idx, end_idx]
+    :param vec_str_class: list of the names of the classes in folder mode, None in csv mode
+    :return: list of the patient directories relative to d_data, e.g. [5, Normal/5]
+    """
+    vec_full_idx = np.arange(vec_idx[0], vec_idx[1] + 1, 1)
+    vec_str_patient = ['{}'.format(idx_patient) for idx_patient in vec_full_idx]
+    if vec_str_class is not None:
+        vec_str_patient += ['{}/{}'.format(str_class, idx_patient) for str_class in vec_str_class
+                            for idx_patient in vec_full_idx]
+
+    return vec_str_patient
+
+
+def get_manifest_fingerprint(manifest, vec_str_patient):
+    """
+    Obtains a fingerprint of the images recorded in the manifest for the given patients, which changes whenever the
+    manifest is rebuilt with images of these patients added, removed or modified
+
+    :param manifest: dictionary holding the manifest
+    :param vec_str_patient: list of the patient directories relative to d_data, see get_manifest_patients
+    :return: string holding the fingerprint
+    """
+    vec_entry = [(str_patient, manifest['entries'][str_patient], manifest['dict_fingerprint'].get(str_patient))
+                 for str_patient in vec_str_patient if str_patient in manifest['entries']]
+
+    return hashlib.sha1(repr(vec_entry).encode('utf-8')).hexdigest()
+
+
+def get_manifest_patient_files(manifest, d_patient, d_patient_fallback):
+    """
+    Looks up the images of a single patient, following the same rules as the glob patterns in the loaders
+
+    :param manifest: dictionary holding the manifest
+    :param pathlib.Path d_patient: directory of the patient, e.g. d_data/5 or d_data/Normal/5
+    :param pathlib.Path d_patient_fallback: directory of the patient in the old folder structure
+    :return: a tuple vec_f_image, vec_f_imageBscan3d holding the absolute paths to the images
+    """
+    d_data = pathlib.Path(manifest['d_data'])
+
+    dict_patient = manifest['entries'].get(d_patient.relative_to(d_data).as_posix(), {})
+    vec_f_image = [os.path.join(str(d_patient), *s.split('/')) for s in dict_patient.get('OCTA', [])]
+    vec_f_imageBscan3d = [os.path.join(str(d_patient), *s.split('/')) for s in dict_patient.get('tiff', [])]
+
+    # try old pattern again also
+    if not vec_f_image:
+        dict_patient_fallback = manifest['entries'].get(d_patient_fallback.relative_to(d_data).as_posix(), {})
+        vec_f_image = [os.path.join(str(d_patient_fallback), *s.split('/'))
+                       for s in dict_patient_fallback.get('2D Layers', [])]
+
+    return vec_f_image, vec_f_imageBscan3d
+
+
+def check_manifest(manifest, vec_d_patient, vec_d_patient_fallback, str_angiography, str_structure, str_bscan,
+                   vec_str_layer, vec_str_layer_bscan3d, str_bscan_layer, dict_layer_order_bscan3d):
+    """
+    Reports the patients whose images are missing or ambiguous before any image is decoded
+
+    :param manifest: dictionary holding the manifest
+    :param vec_d_patient: list of directories of the patients
+    :param vec_d_patient_fallback: list of directories of the patients in the old folder structure
+    :param str_angiography: identifier for angiography images in the filename
+    :param str_structure: identifier for structural OCT images in the filename
+    :param str_bscan: identifier for b-scan OCT images in the filename
+    :param vec_str_layer: list of strings that contain the relevant layers to be used for training
+    :param vec_str_layer_bscan3d: list of strings that contain the relevant bscan images to be used for training
+    :param str_bscan_layer: string that contains the type of b-scan images to be used in filename, e.g. Flow
+    :param dict_layer_order_bscan3d: dictionary that contains the order in which the bscans cubes will be organized
+    :return: a tuple of dictionaries holding the missing and ambiguous images keyed by the patient directory
+    """
+    dict_missing = {}
+    dict_ambiguous = {}
+    n_absent = 0
+    for d_patient, d_patient_fallback in zip(vec_d_patient, vec_d_patient_fallback):
+        vec_f_image, vec_f_imageBscan3d = get_manifest_patient_files(manifest, d_patient, d_patient_fallback)
+        str_patient = d_patient.relative_to(manifest['d_data']).as_posix()
+
+        # patients without any images are common, e.g. when loading a single class, so they are only counted
+        if not vec_f_image and not vec_f_imageBscan3d:
+            n_absent += 1
+            continue
+
+        if not vec_f_image or not vec_f_imageBscan3d:
+            dict_missing[str_patient] = ['OCTA images' if not vec_f_image else '3D bscan images']
+            continue
+
+        # group the images by the eye directory
+        for str_eye in sorted(set(pathlib.Path(f_image).parent.parent.name for f_image in vec_f_image)):
+            vec_f_image_eye = [s for s in vec_f_image if pathlib.Path(s).parent.parent.name == str_eye]
+            vec_f_imageBscan3d_eye = [s for s in vec_f_imageBscan3d if pathlib.Path(s).parent.name == str_eye]
+
+            dict_count = {}
+            for f_image in vec_f_image_eye:
+                for hit in match_octa_image(pathlib.Path(f_image).name, str_angiography, str_structure, str_bscan,
+                                            vec_str_layer, str_bscan_layer):
+                    dict_count[hit] = dict_count.get(hit, 0) + 1
+
+            vec_hit_expected = [(str_image_type, str_layer) for str_image_type in [str_angiography, str_structure]
+                                for str_layer in vec_str_layer] + [(str_bscan, None)]
+            vec_str_missing = ['{} {}'.format(*hit) for hit in vec_hit_expected if dict_count.get(hit, 0) == 0]
+            vec_str_ambiguous = ['{} {}'.format(*hit) for hit in dict_count if dict_count[hit] > 1]
+
+            try:
+                _, count_bscan3d_hit = match_bscan3d_images(vec_f_imageBscan3d_eye, vec_str_layer_bscan3d,
+                                                            dict_layer_order_bscan3d)
+            except (AttributeError, ValueError):
+                count_bscan3d_hit = None
+            if count_bscan3d_hit is None or count_bscan3d_hit < len(vec_str_layer_bscan3d):
+                vec_str_missing.append('3D bscan images')
+            elif count_bscan3d_hit > len(vec_str_layer_bscan3d):
+                vec_str_ambiguous.append('3D bscan images')
+
+            if vec_str_missing:
+                dict_missing['{}/{}'.format(str_patient, str_eye)] = vec_str_missing
+            if vec_str_ambiguous:
+                dict_ambiguous['{}/{}'.format(str_patient, str_eye)] = vec_str_ambiguous
+
+    print('Manifest: {} of {} patients have no images'.format(n_absent, len(vec_d_patient)))
+    for str_patient, vec_str_issue in dict_missing.items():
+        print('Manifest: missing {} for {}'.format(', '.join(vec_str_issue), str_patient))
+    for str_patient, vec_str_issue in dict_ambiguous.items():
+        print('Manifest: ambiguous {} for {}'.format(', '.join(vec_str_issue), str_patient))
+
+    return dict_missing, dict_ambiguous
+
+
+def _is_manifest_current(manifest, vec_str_patient=None, check_images=False):
+    """
+    Checks whether the directories of the requested patients are unchanged since the manifest was built, from the
+    recorded modification times of the patient directories, the directories below them and the directories above
+    them, without listing any directory again. The directories above a patient catch patients that are added or
+    removed
+
+    :param manifest: dictionary holding the manifest
+    :param vec_str_patient: list of the patient directories relative to d_data, all directories are checked if None
+    :param bool check_images: whether or not to also compare the fingerprints of the images of the requested patients
+    :return: True if no directory, or image with check_images, of the requested patients has changed
+    """
+    # manifests written before the images were fingerprinted are rebuilt
+    if 'dict_fingerprint' not in manifest:
+        return False
+
+    if vec_str_patient is None:
+        vec_str_rel_dir = list(manifest['dict_mtime'])
+        vec_str_patient_check = list(manifest['entries'])
+    else:
+        set_str_parent = {'.'}
+        for str_patient in vec_str_patient:
+            vec_str_part = str_patient.split('/')
+            set_str_parent.update('/'.join(vec_str_part[:i]) for i in range(1, len(vec_str_part)))
+
+        tuple_str_prefix = tuple(str_patient + '/' for str_patient in vec_str_patient)
+        set_str_patient = set(vec_str_patient)
+        vec_str_rel_dir = [str_rel_dir for str_rel_dir in manifest['dict_mtime']
+                           if str_rel_dir in set_str_parent or str_rel_dir in set_str_patient or
+                           str_rel_dir.startswith(tuple_str_prefix)]
+        vec_str_patient_check = [str_patient for str_patient in vec_str_patient if str_patient in manifest['entries']]
+
+    d_data = pathlib.Path(manifest['d_data'])
+    try:
+        for str_rel_dir in vec_str_rel_dir:
+            if os.stat(str(d_data / str_rel_dir)).st_mtime_ns != manifest['dict_mtime'][str_rel_dir]:
+                return False
+
+        if check_images:
+            for str_patient in vec_str_patient_check:
+                str_fingerprint = _get_entry_fingerprint(d_data, str_patient, manifest['entries'][str_patient])
+                if str_fingerprint != manifest['dict_fingerprint'][str_patient]:
+                    return False
+
+    except (OSError, KeyError):
+        return False
+
+    return True
+
+
+def _get_entry_fingerprint(d_data, str_patient, dict_patient):
+    """
+    Obtains the fingerprint of all images recorded for a single patient, see get_patient_fingerprint
+
+    :param pathlib.Path d_data: directory to the data
+    :param str_patient: path of the patient directory relative to d_data, e.g. 5 or Normal/5
+    :param dict_patient: dictionary of the image paths relative to the patient directory keyed by the category
+    :return: string holding the fingerprint
+    """
+    d_patient = pathlib.Path(d_data) / str_patient
+    vec_f_image = [os.path.join(str(d_patient), *s.split('/')) for vec_str in dict_patient.values() for s in vec_str]
+
+    return get_patient_fingerprint(vec_f_image, [])
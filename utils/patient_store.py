@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pathlib
+import pickle
+
+
+def get_patient_store_key(dict_param):
+    """
+    Obtains a string that identifies the loading parameters, so that entries written with different parameters are
+    never mixed up
+
+    :param dict_param: dictionary of the keyword arguments used for packaging the data of a single patient
+    :return: string holding the loading parameters in a canonical order
+    """
+    vec_param = []
+    for str_param, value in sorted(dict_param.items()):
+        if isinstance(value, dict):
+            value = sorted(value.items())
+        vec_param.append((str_param, value))
+
+    return repr(vec_param)
+
+
+def get_patient_store_path(d_patient_store, str_store_key, d_patient, str_fingerprint):
+    """
+    Obtains the path of the store entry of a single patient. The fingerprint is part of the filename, so whether a
+    patient has to be decoded again is known from the existence of the entry alone
+
+    :param d_patient_store: directory holding the per-patient store
+    :param str_store_key: string identifying the loading parameters, see get_patient_store_key
+    :param d_patient: directory of the patient, e.g. d_data/5
+    :param str_fingerprint: fingerprint of the current images of the patient, see get_patient_fingerprint
+    :return: absolute path to the store entry
+    """
+    str_hash = hashlib.sha1(repr((str_store_key, os.path.abspath(str(d_patient)))).encode('utf-8')).hexdigest()
+
+    return pathlib.Path(d_patient_store) / '{}_{}.pkl'.format(str_hash, str_fingerprint[:16])
+
+
+def get_patient_fingerprint(vec_f_image, vec_f_imageBscan3d):
+    """
+    Obtains a fingerprint of the images of a single patient from the paths, sizes and modification times, so that new,
+    removed or modified images are detected without reading them
+
+    :param vec_f_image: list of absolute paths to individual images from a single subject
+    :param vec_f_imageBscan3d: list of absolute paths to individual bscan images from a single subject
+    :return: string holding the fingerprint
+    """
+    vec_stat = []
+    for f_image in sorted(list(vec_f_image) + list(vec_f_imageBscan3d)):
+        stat_image = os.stat(f_image)
+        vec_stat.append((f_image, stat_image.st_size, stat_image.st_mtime_ns))
+
+    return hashlib.sha1(repr(vec_stat).encode('utf-8')).hexdigest()
+
+
+def load_patient_store(f_entry):
+    """
+    Loads the packaged data of a single patient from the store
+
+    :param f_entry: absolute path to the store entry
+    :return: the tuple packed_x_curr, str_eye returned by _package_data, or None if the entry cannot be read
+    """
+    try:
+        with open(str(f_entry), 'rb') as handle:
+            dict_entry = pickle.load(handle)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    return dict_entry['packed_x_curr'], dict_entry['str_eye']
+
+
+def save_patient_store(f_entry, packed_x_curr, str_eye):
+    """
+    Writes the packaged data of a single patient into the store and removes the stale entries of the same patient. The
+    entry is written under a temporary name first so that an interrupted run never leaves a partial entry behind
+
+    :param f_entry: absolute path to the store entry
+    :param packed_x_curr: packaged cubes as returned by _package_data
+    :param str_eye: eye labels as returned by _package_data
+    """
+    f_entry = pathlib.Path(f_entry)
+    f_entry.parent.mkdir(parents=True, exist_ok=True)
+
+    f_entry_tmp = f_entry.with_name('{}.{}.tmp'.format(f_entry.stem, os.getpid()))
+    with open(str(f_entry_tmp), 'wb') as handle:
+        pickle.dump({'packed_x_curr': packed_x_curr, 'str_eye': str_eye}, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(str(f_entry_tmp), str(f_entry))
+
+    # entries of the same patient only differ in the fingerprint part of the filename
+    str_hash = f_entry.stem.split('_')[0]
+    for f_entry_stale in f_entry.parent.glob('{}_*.pkl'.format(str_hash)):
+        if f_entry_stale != f_entry:
+            f_entry_stale.unlink()